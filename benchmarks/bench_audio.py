@@ -0,0 +1,43 @@
+''' Benchmarks for audio stimuli and extractors. '''
+
+from pliers.extractors import STFTAudioExtractor, stitch_results
+from pliers.transformers import get_transformer
+from pliers.stimuli import AudioStim
+
+from common import benchmark, synthetic_audio
+
+
+@benchmark(params=[10, 60, 300], quick=[10])
+def load(duration):
+    filename = synthetic_audio(duration).filename
+    # Audio is decoded lazily, on first access
+    return lambda: AudioStim(filename).data
+
+
+@benchmark(params=[10, 60, 300], quick=[10])
+def stft(duration):
+    audio = synthetic_audio(duration)
+    ext = STFTAudioExtractor()
+    return lambda: ext.transform(audio)
+
+
+@benchmark(params=[60, 300], quick=[60])
+def chunked_stft(duration):
+    audio = synthetic_audio(duration)
+    ext = STFTAudioExtractor()
+
+    def run():
+        results = ext.transform(list(audio.chunks(30., overlap=1.)))
+        return stitch_results(results, stim=audio)
+    return run
+
+
+@benchmark(params=['MelspectrogramExtractor', 'MFCCExtractor',
+                   'SpectralCentroidExtractor', 'ChromaSTFTExtractor',
+                   'RMSEExtractor'],
+           quick=['MelspectrogramExtractor'])
+def librosa(extractor):
+    # Raises a MissingDependencyError (and is skipped) without librosa
+    ext = get_transformer(extractor, base='extractors')
+    audio = synthetic_audio(60, kind='noise')
+    return lambda: ext.transform(audio)
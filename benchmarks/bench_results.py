@@ -0,0 +1,29 @@
+''' Benchmarks for the conversion and merging of ExtractorResults. '''
+
+from pliers.extractors import merge_results as _merge_results
+
+from common import benchmark, synthetic_results
+
+
+@benchmark(params=[1000, 10000, 100000], quick=[1000])
+def merge_results(n_results):
+    results = synthetic_results(n_results)
+    return lambda: _merge_results(results)
+
+
+@benchmark(params=[1000, 10000, 100000], quick=[1000])
+def merge_results_long(n_results):
+    results = synthetic_results(n_results)
+    return lambda: _merge_results(results, format='long')
+
+
+@benchmark(params=[10, 1000, 100000], quick=[10, 1000])
+def to_df(n_rows):
+    result = synthetic_results(1, n_rows=n_rows, n_features=20)[0]
+    return lambda: result.to_df()
+
+
+@benchmark(params=[10, 1000, 100000], quick=[10, 1000])
+def to_df_long(n_rows):
+    result = synthetic_results(1, n_rows=n_rows, n_features=20)[0]
+    return lambda: result.to_df(format='long')
@@ -0,0 +1,21 @@
+''' Benchmarks for text stimuli and extractors. '''
+
+import numpy as np
+import pandas as pd
+
+from pliers.extractors import DictionaryExtractor
+
+from common import SEED, benchmark, synthetic_transcript, synthetic_words
+
+
+@benchmark(params=[1000, 10000, 50000], quick=[1000])
+def dictionary(n_words):
+    transcript = synthetic_transcript(n_words)
+    # Leave some of the vocabulary out, so that lookups also miss
+    _, vocab = synthetic_words(0)
+    rng = np.random.RandomState(SEED)
+    vocab = vocab[:int(len(vocab) * 0.9)]
+    table = pd.DataFrame(rng.rand(len(vocab), 3), index=vocab,
+                         columns=['valence', 'arousal', 'dominance'])
+    ext = DictionaryExtractor(table)
+    return lambda: ext.transform(transcript)
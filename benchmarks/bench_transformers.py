@@ -0,0 +1,53 @@
+''' Benchmarks for the overhead of the Transformer machinery itself. '''
+
+from pliers.extractors import Extractor, ExtractorResult
+from pliers.stimuli import TextStim
+from pliers.transformers import hooks
+
+from common import benchmark
+
+
+class NoopExtractor(Extractor):
+
+    _input_type = TextStim
+
+    def _extract(self, stim):
+        return ExtractorResult([[1]], stim, self, ['one'])
+
+
+def _noop(transformer, stim, **kwargs):
+    pass
+
+
+@benchmark(params=[1, 100, 10000], quick=[1, 100])
+def transform(n_stims):
+    ext = NoopExtractor()
+    stims = [TextStim(text='stim%d' % i) for i in range(n_stims)]
+    if n_stims == 1:
+        stims = stims[0]
+    return lambda: ext.transform(stims)
+
+
+_MODES = ['_transform', '_apply', 'no_hooks', 'noop_hooks']
+
+
+@benchmark(params=_MODES, quick=_MODES)
+def hook_overhead(mode):
+    # Compares calling _transform directly, through the wrapper that fires
+    # the lifecycle hooks (with none registered), and through transform()
+    # with no hooks or a no-op callback for every event.
+    ext = NoopExtractor()
+    stim = TextStim(text='hooks')
+    hooks.clear_hooks()
+    if mode == '_transform':
+        return lambda: ext._transform(stim)
+    if mode == '_apply':
+        return lambda: ext._apply(stim, (), {})
+    if mode == 'noop_hooks':
+        for event in hooks.HOOK_EVENTS:
+            hooks.register_hook(event, _noop)
+
+    def run():
+        ext.transform(stim)
+    run.teardown = hooks.clear_hooks
+    return run
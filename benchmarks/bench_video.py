@@ -0,0 +1,72 @@
+''' Benchmarks for video stimuli and filters. '''
+
+from pliers.filters import FrameSamplingFilter
+from pliers.stimuli import VideoFrameCollectionStim, VideoStim
+
+from common import benchmark, synthetic_video
+
+
+@benchmark(params=[10, 100], quick=[10])
+def load(n_videos):
+    # Initializing many videos, as load_stims() does for a directory
+    filename = synthetic_video(5).filename
+
+    def load_videos():
+        return [VideoStim(filename) for _ in range(n_videos)]
+    return load_videos
+
+
+@benchmark(params=[5, 20], quick=[5])
+def frame_iteration(duration):
+    video = synthetic_video(duration)
+
+    def iterate():
+        for frame in video:
+            frame.data
+    return iterate
+
+
+@benchmark(params=['hertz', 'every', 'top_n'], quick=['hertz'])
+def frame_sampling(mode):
+    video = synthetic_video(20)
+    filt = FrameSamplingFilter(**{'hertz': {'hertz': 2},
+                                  'every': {'every': 10},
+                                  'top_n': {'top_n': 20}}[mode])
+
+    def sample():
+        # Access the frames, as sampling only selects their indices
+        for frame in filt.transform(video):
+            frame.data
+    return sample
+
+
+@benchmark(params=['sorted', 'shuffled'], quick=['shuffled'])
+def frame_index_iteration(order):
+    video = synthetic_video(20)
+    # A sparse selection of frames, as kept by filters that rank frames
+    index = list(range(0, video.n_frames, 13))
+    if order == 'shuffled':
+        index = sorted(index, key=lambda i: (i * 7919) % video.n_frames)
+    frames = VideoFrameCollectionStim(video.filename, clip=video.clip,
+                                      frame_index=index)
+
+    def iterate():
+        for frame in frames:
+            frame.data
+    return iterate
+
+
+@benchmark(params=['full', 'gray', 'gray_half_5fps'], quick=['gray_half_5fps'])
+def decoded_frame_iteration(options):
+    # Frames as consumed by extractors that work on small grayscale images
+    video = synthetic_video(10, size=(640, 480))
+    options = {'full': {},
+               'gray': {'pix_fmt': 'gray'},
+               'gray_half_5fps': {'pix_fmt': 'gray', 'size': (320, None),
+                                  'fps': 5}}[options]
+    video = VideoStim(video.filename, **options)
+
+    def iterate():
+        for frame in video:
+            frame.data
+    return iterate
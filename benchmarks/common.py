@@ -0,0 +1,183 @@
+''' Shared tools for the benchmark suite: the benchmark registry, and
+generators of deterministic synthetic stimuli. '''
+
+from collections import OrderedDict
+import atexit
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from pliers.extractors import Extractor, ExtractorResult
+from pliers.stimuli import (AudioStim, ComplexTextStim, TextStim,
+                            VideoStim)
+from pliers.stimuli.base import _log_transformation
+
+SEED = 0
+
+# Registered benchmarks, by name ('<module>.<function>')
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(params=None, quick=None):
+    ''' Registers a benchmark. The decorated function does any setup needed,
+    and returns a function (taking no arguments) whose execution is timed.
+
+    Args:
+        params (list): Optional values to run the benchmark with; each one is
+            passed to the decorated function as its only argument.
+        quick (list): Subset of the params to use in quick runs (defaults to
+            the first one).
+    '''
+    def decorator(func):
+        module = func.__module__.replace('bench_', '')
+        name = '%s.%s' % (module, func.__name__)
+        values = params if params is not None else [None]
+        BENCHMARKS[name] = {
+            'setup': func,
+            'params': values,
+            'quick': quick if quick is not None else values[:1]
+        }
+        return func
+    return decorator
+
+
+class SkipBenchmark(Exception):
+
+    ''' Raised by a benchmark's setup when it can't run (e.g., because an
+    optional dependency is missing). '''
+    pass
+
+
+_tmpdir = None
+
+
+def tmpdir():
+    ''' Returns a directory for the synthetic stimuli of the current session,
+    which is removed on exit. '''
+    global _tmpdir
+    if _tmpdir is None:
+        _tmpdir = tempfile.mkdtemp(prefix='pliers-bench-')
+        atexit.register(shutil.rmtree, _tmpdir, True)
+    return _tmpdir
+
+
+def synthetic_audio(duration=60., sampling_rate=44100, kind='sine'):
+    ''' Returns an AudioStim holding a mono sine wave (440 Hz, with a slow
+    frequency modulation and a little noise) or white noise.
+
+    Args:
+        duration (float): Duration of the clip, in seconds.
+        sampling_rate (int): Sampling rate of the clip, in hertz.
+        kind (str): Either 'sine' or 'noise'.
+    '''
+    from scipy.io import wavfile
+    filename = os.path.join(tmpdir(), 'audio_%s_%d_%d.wav' %
+                            (kind, duration, sampling_rate))
+    if not os.path.exists(filename):
+        rng = np.random.RandomState(SEED)
+        t = np.arange(int(duration * sampling_rate)) / float(sampling_rate)
+        noise = rng.uniform(-1, 1, len(t))
+        if kind == 'sine':
+            phase = 2 * np.pi * 440 * t + 20 * np.sin(2 * np.pi * 0.1 * t)
+            data = 0.8 * np.sin(phase) + 0.05 * noise
+        elif kind == 'noise':
+            data = 0.5 * noise
+        else:
+            raise ValueError("Invalid kind: '%s'." % kind)
+        wavfile.write(filename, sampling_rate,
+                      (data * 32767).astype(np.int16))
+    return AudioStim(filename, sampling_rate=sampling_rate)
+
+
+def synthetic_video(duration=10., fps=30, size=(320, 240)):
+    ''' Returns a VideoStim showing a moving gradient with some noise, and a
+    hard cut every 2 seconds (so that frame sampling by content changes has
+    something to find).
+
+    Args:
+        duration (float): Duration of the clip, in seconds.
+        fps (int): Frames per second.
+        size (tuple): Width and height of the frames, in pixels.
+    '''
+    from moviepy.video.VideoClip import VideoClip
+    width, height = size
+    filename = os.path.join(tmpdir(), 'video_%d_%d_%dx%d.mp4' %
+                            (duration, fps, width, height))
+    if not os.path.exists(filename):
+        x = np.linspace(0, 1, width)[None, :, None]
+        y = np.linspace(0, 1, height)[:, None, None]
+
+        def make_frame(t):
+            rng = np.random.RandomState(SEED + int(round(t * fps)))
+            scene = int(t // 2)
+            offset = (t % 2) / 2.
+            frame = (x + y + offset + np.array([0., 0.33, 0.66]) * scene) % 1
+            frame = frame * 200 + rng.uniform(0, 55, (height, width, 3))
+            return frame.astype(np.uint8)
+
+        clip = VideoClip(make_frame, duration=duration)
+        clip.write_videofile(filename, fps=fps, codec='libx264', audio=False,
+                             verbose=False, logger=None)
+        clip.close()
+    return VideoStim(filename)
+
+
+def synthetic_words(n_words, vocabulary=5000):
+    ''' Returns a list of n_words pseudo-words, drawn (with a Zipfian
+    distribution) from a vocabulary of the given size. The vocabulary itself
+    is also returned. '''
+    rng = np.random.RandomState(SEED)
+    letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    vocab = []
+    seen = set()
+    while len(vocab) < vocabulary:
+        word = ''.join(rng.choice(letters, rng.randint(2, 10)))
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    ranks = np.minimum(rng.zipf(1.3, n_words), vocabulary) - 1
+    return [vocab[r] for r in ranks], vocab
+
+
+def synthetic_transcript(n_words, word_duration=0.3):
+    ''' Returns a ComplexTextStim with n_words consecutive word-level
+    TextStims. '''
+    words, _ = synthetic_words(n_words)
+    elements = [TextStim(text=w, onset=i * word_duration,
+                         duration=word_duration, order=i)
+                for i, w in enumerate(words)]
+    return ComplexTextStim(elements=elements)
+
+
+class SyntheticExtractor(Extractor):
+
+    ''' Stands in for the Extractors of synthetic ExtractorResults. '''
+
+    _input_type = TextStim
+
+    def _extract(self, stim):
+        raise NotImplementedError
+
+
+def synthetic_results(n_results, n_rows=1, n_features=5, n_extractors=5):
+    ''' Returns a list of ExtractorResults, as produced by applying
+    n_extractors different extractors to n_results / n_extractors stims. '''
+    rng = np.random.RandomState(SEED)
+    extractors = [SyntheticExtractor(name='extractor%d' % i)
+                  for i in range(n_extractors)]
+    n_stims = max(n_results // n_extractors, 1)
+    stims = [TextStim(text='stim%d' % i, onset=float(i), duration=1.)
+             for i in range(n_stims)]
+    features = ['feature%d' % i for i in range(n_features)]
+    results = []
+    for i in range(n_results):
+        stim = stims[i % n_stims]
+        ext = extractors[(i // n_stims) % n_extractors]
+        onsets = stim.onset + np.arange(n_rows) / float(n_rows)
+        result = ExtractorResult(rng.rand(n_rows, n_features), stim, ext,
+                                 features, onsets=onsets,
+                                 durations=[1. / n_rows] * n_rows)
+        results.append(_log_transformation(stim, result, ext))
+    return results
@@ -0,0 +1,190 @@
+''' Runs the benchmark suite, and stores the timings as JSON.
+
+Usage:
+
+    python benchmarks/run.py [-k PATTERN] [--quick] [-o OUTPUT]
+                             [--compare BASELINE]
+
+Every benchmark is set up once per parameter value, then run repeatedly
+(up to --repeat times, within --max-time seconds); the statistics stored are
+per call, in seconds. When --compare is passed,
+the results are also compared with those of an earlier run.
+'''
+
+from __future__ import print_function
+
+from datetime import datetime
+from os.path import abspath, dirname, join
+import argparse
+import glob
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+HERE = dirname(abspath(__file__))
+sys.path.insert(0, dirname(HERE))
+sys.path.insert(0, HERE)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+import pliers  # noqa: E402
+from pliers import config  # noqa: E402
+from pliers.support.exceptions import MissingDependencyError  # noqa: E402
+
+from common import BENCHMARKS, SkipBenchmark  # noqa: E402
+
+
+def _load_benchmarks():
+    for filename in sorted(glob.glob(join(HERE, 'bench_*.py'))):
+        importlib.import_module(filename[len(HERE) + 1:-3])
+
+
+def _time(func, repeat, min_time, max_time):
+    # Calibrates the number of calls per sample from a first call (which
+    # also counts as a sample if it's slow enough), and returns the time per
+    # call of every sample. Fewer samples are taken if they would take more
+    # than max_time in total.
+    start = timeit.default_timer()
+    func()
+    first = timeit.default_timer() - start
+    number = max(int(np.ceil(min_time / max(first, 1e-9))), 1)
+    samples = [first] if number == 1 else []
+    timer = timeit.Timer(func)
+    while len(samples) < repeat and (not samples or
+                                     timeit.default_timer() - start +
+                                     samples[-1] * number <= max_time):
+        samples.append(timer.timeit(number) / number)
+    return samples, number
+
+
+def _metadata(quick):
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=HERE,
+            stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'date': datetime.now().isoformat(),
+        'commit': commit,
+        'pliers': pliers.__version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'quick': quick
+    }
+
+
+def run(pattern=None, quick=False, repeat=5, min_time=0.2, max_time=60):
+    ''' Runs all benchmarks whose name contains the pattern, and returns a
+    list of results. '''
+    config.set_options(cache_transformers=False, progress_bar=False)
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        for param in bench['quick' if quick else 'params']:
+            label = name if param is None else '%s[%s]' % (name, param)
+            print('%-50s' % label, end=' ')
+            sys.stdout.flush()
+            entry = {'benchmark': name, 'param': param}
+            results.append(entry)
+            try:
+                func = bench['setup'](param)
+            except (SkipBenchmark, MissingDependencyError) as e:
+                entry['skipped'] = str(e).strip()
+                print('skipped')
+                continue
+            try:
+                samples, number = _time(func, repeat, min_time, max_time)
+            except MissingDependencyError as e:
+                entry['skipped'] = str(e).strip()
+                print('skipped')
+                continue
+            except Exception as e:
+                # Keep going, so that one broken benchmark doesn't discard
+                # the results of all the others
+                entry['error'] = '%s: %s' % (e.__class__.__name__, e)
+                print('error (%s)' % entry['error'])
+                continue
+            finally:
+                if hasattr(func, 'teardown'):
+                    func.teardown()
+            entry.update(min=min(samples), median=float(np.median(samples)),
+                         mean=float(np.mean(samples)),
+                         std=float(np.std(samples)), number=number,
+                         repeat=len(samples))
+            print('%12.6f s' % entry['median'])
+    config.reset_options(False)
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    ''' Prints the ratio of the median times of two runs, flagging the
+    benchmarks that got slower (or faster) by more than the threshold. '''
+    def _key(r):
+        return (r['benchmark'], json.dumps(r['param']))
+    old = dict((_key(r), r) for r in baseline['results'] if 'median' in r)
+    print('\n%-50s %12s %12s %8s' % ('benchmark', 'baseline', 'current',
+                                     'ratio'))
+    for r in results:
+        if 'median' not in r or _key(r) not in old:
+            continue
+        before = old[_key(r)]['median']
+        ratio = r['median'] / before
+        flag = 'slower' if ratio > 1 + threshold else \
+            'faster' if ratio < 1 - threshold else ''
+        label = r['benchmark'] if r['param'] is None else \
+            '%s[%s]' % (r['benchmark'], r['param'])
+        print('%-50s %12.6f %12.6f %8.2f %s' % (label, before, r['median'],
+                                                ratio, flag))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run pliers benchmarks.')
+    parser.add_argument('-k', dest='pattern',
+                        help='Only run benchmarks whose name contains this.')
+    parser.add_argument('--quick', action='store_true',
+                        help='Only run the smallest parameter values.')
+    parser.add_argument('-o', '--output',
+                        help='JSON file to write the results to (defaults '
+                             'to benchmarks/results/<date>.json).')
+    parser.add_argument('--compare',
+                        help='JSON file of an earlier run to compare to.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of samples per benchmark.')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum duration of each sample, in seconds.')
+    parser.add_argument('--max-time', type=float, default=60,
+                        help='Time after which no more samples are taken '
+                             'for a benchmark, in seconds.')
+    args = parser.parse_args(argv)
+
+    _load_benchmarks()
+    results = run(args.pattern, args.quick, args.repeat, args.min_time,
+                  args.max_time)
+    output = args.output
+    if output is None:
+        results_dir = join(HERE, 'results')
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        output = join(results_dir, '%s.json' %
+                      datetime.now().strftime('%Y%m%d-%H%M%S'))
+    with open(output, 'w') as f:
+        json.dump({'metadata': _metadata(args.quick), 'results': results},
+                  f, indent=2)
+    print('\nResults written to %s' % output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
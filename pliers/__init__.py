@@ -1,7 +1,7 @@
 from .config import set_option, get_option, set_options
-from .graph import Graph
 from .version import __version__
 from .support.due import due, Url, BibTeX
+from .utils import lazy_exports
 
 
 __all__ = [
@@ -23,6 +23,9 @@ __all__ = [
     'Graph'
 ]
 
+# Graph pulls in most of the package, so it's only imported when first used
+__getattr__, __dir__ = lazy_exports(__name__, {'graph': ['Graph']})
+
 # TODO: replace with Doi whenever available (Zenodo?)
 due.cite(
     Url("https://github.com/tyarkoni/pliers"),
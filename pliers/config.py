@@ -19,17 +19,34 @@ _default_converters = {
 
 _default_settings = {
     'cache_transformers': True,
+    'cache_backend': 'memory',
+    'cache_dir': None,
+    'cache_max_bytes': None,
+    'cache_max_entries': None,
+    'cache_policy': 'lru',
+    'cache_conversions': None,
     'default_converters': _default_converters,
     'drop_bad_extractor_results': True,
     'log_transformations': True,
     'n_jobs': None,
     'parallelize': False,
+    'executor': None,
+    'chunksize': 10,
+    'share_arrays': True,
+    'share_arrays_threshold': 65536,
     'progress_bar': True,
     'use_generators': False,
     'allow_large_jobs': True,
     'long_job': 60,  # in seconds
     'large_job': 100,
-    'api_key_validation': False
+    'api_key_validation': False,
+    'api_max_concurrent': 1,
+    'api_burst': 1,
+    'memory_limit': None,
+    'video_prefetch_frames': 16,
+    'max_open_readers': 32,
+    'audio_mmap': False,
+    'audio_cache_dir': None
 }
 
 
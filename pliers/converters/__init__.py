@@ -2,17 +2,27 @@
 of one type as input and return a `Stim` of a different type as output.
 '''
 
-from .api import (WitTranscriptionConverter,
-                  IBMSpeechAPIConverter,
-                  GoogleSpeechAPIConverter,
-                  GoogleVisionAPITextConverter,
-                  MicrosoftAPITextConverter)
 from .base import Converter, get_converter
-from .image import TesseractConverter
-from .iterators import (VideoFrameIterator, VideoFrameCollectionIterator,
-                        ComplexTextIterator)
-from .multistep import VideoToTextConverter, VideoToComplexTextConverter
-from .video import VideoToAudioConverter
+from pliers.utils import lazy_exports
+
+# Classes defined in the other submodules are only imported when first
+# accessed, so that importing the package doesn't import every optional
+# dependency.
+_exports = {
+    'api': ['WitTranscriptionConverter',
+            'IBMSpeechAPIConverter',
+            'GoogleSpeechAPIConverter',
+            'GoogleVisionAPITextConverter',
+            'MicrosoftAPITextConverter'],
+    'image': ['TesseractConverter'],
+    'iterators': ['VideoFrameIterator',
+                  'VideoFrameCollectionIterator',
+                  'ComplexTextIterator',
+                  'AudioChunkIterator'],
+    'multistep': ['VideoToTextConverter',
+                  'VideoToComplexTextConverter'],
+    'video': ['VideoToAudioConverter']
+}
 
 __all__ = [
     'WitTranscriptionConverter',
@@ -23,6 +33,7 @@ __all__ = [
     'VideoFrameIterator',
     'VideoFrameCollectionIterator',
     'ComplexTextIterator',
+    'AudioChunkIterator',
     'MicrosoftAPITextConverter',
     'VideoToTextConverter',
     'VideoToComplexTextConverter',
@@ -30,3 +41,5 @@ __all__ = [
     'Converter',
     'get_converter'
 ]
+
+__getattr__, __dir__ = lazy_exports(__name__, _exports)
@@ -1,17 +1,23 @@
 ''' Base Converter class and utilities. '''
 
 from abc import ABCMeta, abstractmethod, abstractproperty
+from inspect import isabstract
 from pliers.transformers import Transformer
 from six import with_metaclass
-from pliers.utils import listify, EnvironmentKeyMixin
+from pliers.utils import listify, EnvironmentKeyMixin, APIDependent
 from pliers import config
 import pliers
+import heapq
 
 
 class Converter(with_metaclass(ABCMeta, Transformer)):
 
     ''' Base class for Converters.'''
 
+    # Relative cost of the conversion, used to choose between alternative
+    # paths when converting implicitly (see get_converter_path()).
+    _conversion_cost = 1.
+
     @abstractmethod
     def _convert(self, stim):
         pass
@@ -24,38 +30,205 @@ class Converter(with_metaclass(ABCMeta, Transformer)):
         return self._convert(stim, *args, **kwargs)
 
 
+# Relative cost of running a remote (API-based) Converter instead of a local
+# one; used to weight the edges of the conversion graph.
+REMOTE_COST_FACTOR = 10.
+# Cost of converting a Stim to one of its superclasses (e.g., a VideoStim to
+# a VideoFrameCollectionStim), which is free but shouldn't take precedence
+# over Converters that match exactly.
+_UPCAST_COST = 1e-3
+# Cost of the Converters listed in the default_converters option, per rank;
+# small enough that they're always preferred over other Converters.
+_DEFAULT_COST = 1e-2
+
+_converter_classes = None
+_routes = None
+_paths = {}
+
+
+def _get_converter_classes():
+    # The conversion graph: all concrete single-step Converters, in the order
+    # in which they're listed in pliers.converters. Built on first use, as
+    # pliers.converters isn't fully imported when this module is.
+    global _converter_classes
+    if _converter_classes is None:
+        from .multistep import MultiStepConverter
+        classes = []
+        for name in pliers.converters.__all__:
+            cls = getattr(pliers.converters, name)
+            if not isinstance(cls, type) or not issubclass(cls, Converter) \
+                    or issubclass(cls, MultiStepConverter) or isabstract(cls):
+                continue
+            classes.append(cls)
+        _converter_classes = classes
+    return _converter_classes
+
+
+def _get_routes():
+    # The routes of the MultiStepConverters that used to handle conversions
+    # across modalities (e.g., VideoStim -> AudioStim -> TextStim, rather
+    # than OCR on the frames), as (input type, output type, intermediate
+    # types) tuples. Planned conversions between the same types follow them.
+    global _routes
+    if _routes is None:
+        from .multistep import MultiStepConverter
+        routes = []
+        for name in pliers.converters.__all__:
+            cls = getattr(pliers.converters, name)
+            if isinstance(cls, type) and \
+                    issubclass(cls, MultiStepConverter) and \
+                    getattr(cls, '_steps', None):
+                routes.append((cls._input_type, cls._output_type,
+                               tuple(cls._steps[:-1])))
+        _routes = routes
+    return _routes
+
+
+def _get_edge_cost(cls, in_type, defaults):
+    for pair in ((in_type, cls._output_type),
+                 (cls._input_type, cls._output_type)):
+        preferred = defaults.get('%s->%s' % (pair[0].__name__,
+                                              pair[1].__name__), ())
+        if cls.__name__ in preferred:
+            return _DEFAULT_COST * (list(preferred).index(cls.__name__) + 1)
+    cost = cls._conversion_cost
+    if issubclass(cls, APIDependent):
+        cost *= REMOTE_COST_FACTOR
+    if cls._input_type is not in_type:
+        cost += _UPCAST_COST
+    return cost
+
+
+def _find_path(in_type, out_type, max_steps, classes, available,
+               defaults):
+    # Dijkstra's algorithm over Stim types; ties are broken by the number of
+    # steps, and then by the order of the Converters in pliers.converters.
+    # Returns a (cost, path) tuple, or None if no path exists.
+    counter = 0
+    queue = [(0., 0, counter, in_type, ())]
+    visited = set()
+    while queue:
+        cost, n_steps, _, stim_type, steps = heapq.heappop(queue)
+        if stim_type in visited:
+            continue
+        visited.add(stim_type)
+        if steps and issubclass(stim_type, out_type):
+            return cost, steps
+        if max_steps is not None and n_steps >= max_steps:
+            continue
+        for cls, avail in zip(classes, available):
+            if not avail or not issubclass(stim_type, cls._input_type) or \
+                    cls._output_type in visited:
+                continue
+            counter += 1
+            edge_cost = _get_edge_cost(cls, stim_type, defaults)
+            heapq.heappush(queue, (cost + edge_cost, n_steps + 1, counter,
+                                   cls._output_type, steps + (cls,)))
+    return None
+
+
+def get_converter_path(in_type, out_type, max_steps=None):
+    ''' Finds the cheapest sequence of available Converter classes that
+    transforms a Stim of type in_type into a Stim of (one of the) type(s)
+    out_type.
+
+    Converters are weighted by their _conversion_cost, multiplied by
+    REMOTE_COST_FACTOR for API-based Converters; Converters listed in the
+    'default_converters' config option take precedence over all others, in
+    the listed order. Conversions between the types of a MultiStepConverter
+    (e.g., VideoToTextConverter) go through its intermediate types, or fail
+    if that isn't possible. Paths are cached.
+
+    Args:
+        in_type (type): The type of Stim to convert.
+        out_type (type, list): One or more acceptable output types.
+        max_steps (int): Optional maximum number of Converters in the path.
+
+    Returns:
+        A tuple of Converter classes, or None if no path exists.
+    '''
+    out_type = tuple(listify(out_type))
+    classes = _get_converter_classes()
+    available = tuple(cls.available if issubclass(cls, EnvironmentKeyMixin)
+                      else True for cls in classes)
+    defaults = config.get_option('default_converters')
+    key = (in_type, out_type, max_steps, available,
+           repr(sorted(defaults.items())))
+    if key in _paths:
+        return _paths[key]
+
+    routes = [r for r in _get_routes()
+              if r[0] is in_type and r[1] in out_type]
+    if routes:
+        candidates = []
+        for _, route_out, waypoints in routes:
+            types = (in_type,) + waypoints + (route_out,)
+            cost, steps = 0., ()
+            for src, dst in zip(types[:-1], types[1:]):
+                found = _find_path(src, (dst,), None, classes, available,
+                                   defaults)
+                if found is None:
+                    break
+                cost += found[0]
+                steps += found[1]
+            else:
+                if max_steps is None or len(steps) <= max_steps:
+                    candidates.append((cost, len(steps), steps))
+        path = min(candidates, key=lambda c: c[:2])[2] if candidates \
+            else None
+    else:
+        found = _find_path(in_type, out_type, max_steps, classes, available,
+                           defaults)
+        path = found[1] if found else None
+    _paths[key] = path
+    return path
+
+
 def get_converter(in_type, out_type, *args, **kwargs):
-    ''' Scans the list of available Converters and returns an instantiation
-    of the first one whose input and output types match those passed in.
+    ''' Returns an instance of the Converter (or, if no single Converter
+    can do the job, of a ChainedConverter wrapping the sequence of
+    Converters) that transforms Stims of type in_type into Stims of type
+    out_type at the lowest cost. See get_converter_path() for details.
 
     Args:
         in_type (type): The type of input the converter must have.
         out_type (type): The type of output the converter must have.
         args, kwargs: Optional positional and keyword arguments to pass onto
-            matching Converter's initializer.
+            matching Converter's initializer. If provided, only single-step
+            conversions are considered.
     '''
-    convs = pliers.converters.__all__
+    max_steps = 1 if (args or kwargs) else None
+    path = get_converter_path(in_type, out_type, max_steps)
+    if path is None:
+        return None
+    if len(path) == 1:
+        return path[0](*args, **kwargs)
+    from .multistep import ChainedConverter
+    return ChainedConverter([cls() for cls in path])
 
-    # If config includes default converters for this combination, try them
-    # first
-    out_type = listify(out_type)[::-1]
-    default_convs = config.get_option('default_converters')
 
-    for ot in out_type:
-        conv_str = '%s->%s' % (in_type.__name__, ot.__name__)
-        if conv_str in default_convs:
-            convs = list(default_convs[conv_str]) + convs
+_implicit_converters = {}
 
-    for name in convs:
-        cls = getattr(pliers.converters, name)
-        if not issubclass(cls, Converter):
-            continue
 
-        available = cls.available if issubclass(
-            cls, EnvironmentKeyMixin) else True
-        if cls._input_type == in_type and cls._output_type in out_type \
-                and available:
-            conv = cls(*args, **kwargs)
-            return conv
+def get_implicit_converter(in_type, out_type):
+    ''' Like get_converter(), but returns a shared instance of the matching
+    Converter, initialized with default arguments. Used for the implicit
+    conversions performed when a Transformer receives a Stim it can't
+    handle, so that all Transformers reuse the same converters.
 
-    return None
+    Args:
+        in_type (type): The type of input the converter must have.
+        out_type (type): The type of output the converter must have.
+    '''
+    out_type = tuple(listify(out_type))
+    # The selected converter depends on the default_converters setting
+    key = (in_type, out_type,
+           repr(sorted(config.get_option('default_converters').items())))
+    conv = _implicit_converters.get(key)
+    if conv is None:
+        conv = get_converter(in_type, out_type)
+        # Don't remember failures, as converters may become available
+        # (e.g., once API keys are set)
+        if conv is not None:
+            _implicit_converters[key] = conv
+    return conv
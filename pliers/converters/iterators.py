@@ -1,6 +1,7 @@
 ''' Converter classes that take StimCollection classes and return their
 constituent elements as iterables. '''
 
+from pliers.stimuli.audio import AudioStim
 from pliers.stimuli.video import VideoStim, VideoFrameCollectionStim
 from pliers.stimuli.image import ImageStim
 from pliers.stimuli.text import ComplexTextStim, TextStim
@@ -13,6 +14,9 @@ class StimCollectionIterator(Converter):
 
     VERSION = '1.0'
 
+    # Each element of the collection will have to be processed separately
+    _conversion_cost = 20.
+
     def _convert(self, stim):
         return stim.__iter__()
 
@@ -30,8 +34,7 @@ class VideoFrameCollectionIterator(StimCollectionIterator):
 
     # TODO: use VideoFrameIterator for both VideoStim and DerivedVideoStim,
     # but this may require reworking _input_type to handle disjunction rather
-    # than the current conjunction, or making the get_converter() code walk
-    # up the hierarchy and use superclass iterators.
+    # than the current conjunction.
 
     _input_type = VideoFrameCollectionStim
     _output_type = ImageStim
@@ -43,3 +46,28 @@ class ComplexTextIterator(StimCollectionIterator):
 
     _input_type = ComplexTextStim
     _output_type = TextStim
+
+
+class AudioChunkIterator(StimCollectionIterator):
+
+    ''' Iterates consecutive (optionally overlapping) chunks of an AudioStim
+    as AudioStims, so that long recordings can be processed a window at a
+    time. See AudioStim.chunks().
+
+    Args:
+        duration (float): Duration of the chunks, in seconds.
+        overlap (float): Duration of the overlap between consecutive chunks,
+            in seconds.
+    '''
+
+    _input_type = AudioStim
+    _output_type = AudioStim
+    _log_attributes = ('duration', 'overlap')
+
+    def __init__(self, duration=60., overlap=0.):
+        self.duration = duration
+        self.overlap = overlap
+        super(AudioChunkIterator, self).__init__()
+
+    def _convert(self, stim):
+        return stim.chunks(self.duration, self.overlap)
@@ -4,6 +4,7 @@ from pliers.stimuli.base import Stim
 from pliers.stimuli.audio import AudioStim
 from pliers.stimuli.video import VideoStim
 from pliers.stimuli.text import TextStim, ComplexTextStim
+from pliers.utils import fingerprint_hasher
 from .base import Converter, get_converter
 
 
@@ -27,7 +28,7 @@ class MultiStepConverter(Converter):
 
     def _convert(self, stim):
         for i, step in enumerate(self.steps):
-            if issubclass(step, Stim):
+            if isinstance(step, type) and issubclass(step, Stim):
                 converter = get_converter(type(stim), step)
                 if converter is None:
                     msg = ("Conversion failed at step %d; unable to find a "
@@ -40,11 +41,35 @@ class MultiStepConverter(Converter):
         return stim
 
 
-# Current approach requires explicit naming of every possible path. This is
-# not ideal and could get big in a hurry. We should probably switch to
-# walking the inheritance hierarchy of each Stim instance and using the first
-# MultiStepConverter that matches (e.g., a VideoFrameCollectionStim that needs
-# to be converted to a TextStim should use the VideoToTextConverter).
+class ChainedConverter(MultiStepConverter):
+
+    ''' Applies a sequence of initialized Converters. Returned by
+    get_converter() for conversions that require multiple steps.
+
+    Args:
+        steps (list): Ordered list of initialized Converters.
+    '''
+
+    # Placeholders; the actual types are those of the first and last steps
+    _input_type = Stim
+    _output_type = Stim
+
+    def __init__(self, steps):
+        super(ChainedConverter, self).__init__(steps)
+        self._input_type = steps[0]._input_type
+        self._output_type = steps[-1]._output_type
+
+    def fingerprint(self):
+        h = fingerprint_hasher()
+        h.update(self.__class__.__name__.encode('utf-8'))
+        for step in self.steps:
+            h.update(step.fingerprint().encode('utf-8'))
+        return h.hexdigest()
+
+
+# The classes below predate the automatic planning of multi-step conversions
+# (see get_converter_path()); they're kept for explicit use, and their steps
+# define the routes that planned conversions between the same types follow.
 
 
 class VideoToTextConverter(MultiStepConverter):
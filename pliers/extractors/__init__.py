@@ -3,62 +3,77 @@ of any type as input and return extracted feature information (rather than
 another `Stim` instance).
 '''
 
-from .base import Extractor, ExtractorResult, merge_results
-from .api import (IndicoAPITextExtractor,
-                  IndicoAPIImageExtractor,
-                  ClarifaiAPIImageExtractor,
-                  ClarifaiAPIVideoExtractor,
-                  GoogleVisionAPIFaceExtractor,
-                  GoogleVisionAPILabelExtractor,
-                  GoogleVisionAPIPropertyExtractor,
-                  GoogleVisionAPISafeSearchExtractor,
-                  GoogleVisionAPIWebEntitiesExtractor,
-                  GoogleVideoIntelligenceAPIExtractor,
-                  GoogleVideoAPILabelDetectionExtractor,
-                  GoogleVideoAPIShotDetectionExtractor,
-                  GoogleVideoAPIExplicitDetectionExtractor,
-                  GoogleLanguageAPIExtractor,
-                  GoogleLanguageAPIEntityExtractor,
-                  GoogleLanguageAPISentimentExtractor,
-                  GoogleLanguageAPISyntaxExtractor,
-                  GoogleLanguageAPITextCategoryExtractor,
-                  GoogleLanguageAPIEntitySentimentExtractor,
-                  MicrosoftAPIFaceExtractor,
-                  MicrosoftAPIFaceEmotionExtractor,
-                  MicrosoftVisionAPIExtractor,
-                  MicrosoftVisionAPITagExtractor,
-                  MicrosoftVisionAPICategoryExtractor,
-                  MicrosoftVisionAPIImageTypeExtractor,
-                  MicrosoftVisionAPIColorExtractor,
-                  MicrosoftVisionAPIAdultExtractor)
-from .audio import (LibrosaFeatureExtractor,
-                    STFTAudioExtractor,
-                    MeanAmplitudeExtractor,
-                    SpectralCentroidExtractor,
-                    SpectralBandwidthExtractor,
-                    SpectralContrastExtractor,
-                    SpectralRolloffExtractor,
-                    PolyFeaturesExtractor,
-                    RMSEExtractor,
-                    ZeroCrossingRateExtractor,
-                    ChromaSTFTExtractor,
-                    ChromaCQTExtractor,
-                    ChromaCENSExtractor,
-                    MelspectrogramExtractor,
-                    MFCCExtractor,
-                    TonnetzExtractor,
-                    TempogramExtractor)
-from .image import (BrightnessExtractor, SaliencyExtractor, SharpnessExtractor,
-                    VibranceExtractor, FaceRecognitionFaceEncodingsExtractor,
-                    FaceRecognitionFaceLandmarksExtractor,
-                    FaceRecognitionFaceLocationsExtractor)
-from .models import TensorFlowInceptionV3Extractor
-from .text import (ComplexTextExtractor, DictionaryExtractor,
-                   PredefinedDictionaryExtractor, LengthExtractor,
-                   NumUniqueWordsExtractor, PartOfSpeechExtractor,
-                   WordEmbeddingExtractor, TextVectorizerExtractor,
-                   VADERSentimentExtractor)
-from .video import (FarnebackOpticalFlowExtractor)
+from .base import (Extractor, ExtractorResult, ResultMerger, merge_results,
+                   stitch_results)
+from pliers.utils import lazy_exports
+
+# Classes defined in the other submodules are only imported when first
+# accessed, so that importing the package doesn't import every optional
+# dependency.
+_exports = {
+    'api': ['IndicoAPITextExtractor',
+            'IndicoAPIImageExtractor',
+            'ClarifaiAPIImageExtractor',
+            'ClarifaiAPIVideoExtractor',
+            'GoogleVisionAPIFaceExtractor',
+            'GoogleVisionAPILabelExtractor',
+            'GoogleVisionAPIPropertyExtractor',
+            'GoogleVisionAPISafeSearchExtractor',
+            'GoogleVisionAPIWebEntitiesExtractor',
+            'GoogleVideoIntelligenceAPIExtractor',
+            'GoogleVideoAPILabelDetectionExtractor',
+            'GoogleVideoAPIShotDetectionExtractor',
+            'GoogleVideoAPIExplicitDetectionExtractor',
+            'GoogleLanguageAPIExtractor',
+            'GoogleLanguageAPIEntityExtractor',
+            'GoogleLanguageAPISentimentExtractor',
+            'GoogleLanguageAPISyntaxExtractor',
+            'GoogleLanguageAPITextCategoryExtractor',
+            'GoogleLanguageAPIEntitySentimentExtractor',
+            'MicrosoftAPIFaceExtractor',
+            'MicrosoftAPIFaceEmotionExtractor',
+            'MicrosoftVisionAPIExtractor',
+            'MicrosoftVisionAPITagExtractor',
+            'MicrosoftVisionAPICategoryExtractor',
+            'MicrosoftVisionAPIImageTypeExtractor',
+            'MicrosoftVisionAPIColorExtractor',
+            'MicrosoftVisionAPIAdultExtractor'],
+    'audio': ['LibrosaFeatureExtractor',
+              'STFTAudioExtractor',
+              'MeanAmplitudeExtractor',
+              'SpectralCentroidExtractor',
+              'SpectralBandwidthExtractor',
+              'SpectralContrastExtractor',
+              'SpectralRolloffExtractor',
+              'PolyFeaturesExtractor',
+              'RMSEExtractor',
+              'ZeroCrossingRateExtractor',
+              'ChromaSTFTExtractor',
+              'ChromaCQTExtractor',
+              'ChromaCENSExtractor',
+              'MelspectrogramExtractor',
+              'MFCCExtractor',
+              'TonnetzExtractor',
+              'TempogramExtractor'],
+    'image': ['BrightnessExtractor',
+              'SaliencyExtractor',
+              'SharpnessExtractor',
+              'VibranceExtractor',
+              'FaceRecognitionFaceEncodingsExtractor',
+              'FaceRecognitionFaceLandmarksExtractor',
+              'FaceRecognitionFaceLocationsExtractor'],
+    'models': ['TensorFlowInceptionV3Extractor'],
+    'text': ['ComplexTextExtractor',
+             'DictionaryExtractor',
+             'PredefinedDictionaryExtractor',
+             'LengthExtractor',
+             'NumUniqueWordsExtractor',
+             'PartOfSpeechExtractor',
+             'WordEmbeddingExtractor',
+             'TextVectorizerExtractor',
+             'VADERSentimentExtractor'],
+    'video': ['FarnebackOpticalFlowExtractor']
+}
 
 __all__ = [
     'Extractor',
@@ -125,5 +140,9 @@ __all__ = [
     'WordEmbeddingExtractor',
     'TextVectorizerExtractor',
     'VADERSentimentExtractor',
-    'merge_results'
+    'ResultMerger',
+    'merge_results',
+    'stitch_results'
 ]
+
+__getattr__, __dir__ = lazy_exports(__name__, _exports)
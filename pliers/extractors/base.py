@@ -4,9 +4,11 @@ from abc import ABCMeta, abstractmethod
 from six import with_metaclass
 import pandas as pd
 import numpy as np
+from pliers import profiling
 from pliers.transformers import Transformer
-from pliers.utils import isgenerator, flatten
+from pliers.utils import isgenerator, flatten, listify
 from pandas.api.types import is_numeric_dtype
+from collections import OrderedDict
 
 
 class Extractor(with_metaclass(ABCMeta, Transformer)):
@@ -74,6 +76,56 @@ class ExtractorResult(object):
         ''' Creates a DataFrame with default arguments '''
         return self.to_df()
 
+    def to_array(self, dtype=None):
+        ''' Returns the extracted feature values as a 2-d numpy array, with
+        a row per record and a column per feature (see get_feature_names()).
+        Numeric results are usually returned without copying, so the array
+        can be passed on to, e.g., torch.from_numpy().
+
+        Args:
+            dtype: Optional numpy dtype to convert the values to.
+        '''
+        if hasattr(self.extractor, '_to_df'):
+            df = self.extractor._to_df(self)
+            values = df.drop(columns=[c for c in ('object_id', 'onset',
+                                                  'order', 'duration')
+                                      if c in df.columns]).values
+        else:
+            values = np.asarray(self._data)
+            if values.ndim == 1:
+                values = values.reshape(-1, 1)
+            # Keep the converted array, so that lists aren't converted again
+            if values is not self._data and values.dtype != object:
+                self._data = values
+        return values if dtype is None else values.astype(dtype, copy=False)
+
+    def get_feature_names(self):
+        ''' Returns the names of the columns returned by to_array(). '''
+        if hasattr(self.extractor, '_to_df'):
+            df = self.extractor._to_df(self)
+            return [c for c in df.columns
+                    if c not in ('object_id', 'onset', 'order', 'duration')]
+        if self.features is not None:
+            return listify(self.features)
+        return ['feature_%d' % (i + 1) for i in range(self.to_array().shape[1])]
+
+    def _timing_arrays(self, n):
+        # Returns the onsets, durations and orders of the n records, as
+        # numeric arrays (NaN where missing).
+        def _array(values):
+            values = np.asarray(np.nan if values is None else values)
+            if values.dtype.kind not in 'iuf':
+                values = values.astype(float)
+            return np.broadcast_to(values, (n,))
+        if hasattr(self, '_onsets'):
+            onsets = np.asarray(self._onsets) + \
+                (0.0 if self.onset is None else self.onset)
+        else:
+            onsets = _array(self.onset)
+        durations = _array(getattr(self, '_durations', self.duration))
+        orders = _array(getattr(self, '_orders', self.order))
+        return onsets, durations, orders
+
     def to_df(self, timing=True, metadata=False, format='wide',
               extractor_name=False, object_id=True, **to_df_kwargs):
         ''' Convert current instance to a pandas DatasFrame.
@@ -104,38 +156,100 @@ class ExtractorResult(object):
                 constant would be non-constant.
 
         Returns:
-            A pandas DataFrame.
+            A pandas DataFrame. Unless the Extractor implements its own
+            conversion, the feature columns share memory with the array
+            returned by to_array(). String columns added by this method (the
+            metadata, and the feature and extractor names in long format) are
+            categorical.
         '''
 
+        index, features, data = self._records(timing, object_id,
+                                              **to_df_kwargs)
+        df = data if isinstance(data, pd.DataFrame) else None
+        n = len(data)
+        sort = None
+        if 'onset' in index:
+            onsets = index['onset']
+            if n > 1 and not (onsets[1:] >= onsets[:-1]).all():
+                sort = pd.Series(onsets).sort_values().index.values
+
+        # Wide DataFrames start with the order, duration, onset and object_id
+        # columns; long ones with the object_id, onset, order and duration
+        wide_cols = [c for c in ('order', 'duration', 'onset', 'object_id')
+                     if c in index]
+
+        if format == 'long':
+            # Equivalent to melting the wide DataFrame, without building it
+            n_features = len(features)
+            values = [data[:, i] for i in range(n_features)] if df is None \
+                else [df.iloc[:, i].values for i in range(n_features)]
+            if sort is not None:
+                values = [v[sort] for v in values]
+                index = OrderedDict((k, v[sort]) for k, v in index.items())
+            value = np.concatenate(values) if values else np.array([])
+            keep = ~pd.isnull(value)
+            dtype = pd.CategoricalDtype(pd.unique(np.array(features,
+                                                           dtype=object)))
+            codes = dtype.categories.get_indexer(features)
+            columns = OrderedDict((k, np.tile(v, n_features)[keep])
+                                  for k, v in index.items())
+            columns['feature'] = pd.Categorical.from_codes(
+                np.repeat(codes, n)[keep], dtype=dtype)
+            columns['value'] = value[keep]
+            df = pd.DataFrame(columns, index=np.flatnonzero(keep)
+                              if not keep.all() else None)
+        else:
+            # Wrap the data without copying it (unless it needs sorting)
+            if df is None:
+                df = pd.DataFrame(data, columns=features, copy=False)
+            else:
+                df.columns = features
+            for k in wide_cols[::-1]:
+                df.insert(0, k, index[k])
+            if sort is not None:
+                df = df.take(sort).reset_index(drop=True)
+
+        if extractor_name:
+            name = self.extractor.name
+            if format == 'long':
+                df['extractor'] = _constant_categorical(name, len(df))
+            else:
+                df.columns = pd.MultiIndex.from_product([[name], df.columns])
+
+        if metadata:
+            for col, value in self._metadata():
+                df[col] = _constant_categorical(value, len(df))
+        return df
+
+    def _records(self, timing=True, object_id=True, **to_df_kwargs):
+        # Returns the index columns (object_id, onset, order and duration, as
+        # requested), the feature names, and the feature values of the
+        # records: a 2-d array, or the DataFrame returned by the Extractor's
+        # _to_df(), with columns in the same order as the feature names.
+
         # Ideally, Extractors should implement their own _to_df() class method
         # that produces a DataFrame in standardized format. Failing that, we
         # assume self._data is already array-like and can be wrapped in a DF.
         if hasattr(self.extractor, '_to_df'):
-            df = self.extractor._to_df(self, **to_df_kwargs)
+            data = self.extractor._to_df(self, **to_df_kwargs)
+            features = list(data.columns)
+            n = len(data)
         else:
+            data = self.to_array()
             features = self.features
-            data = np.array(self._data)
             if features is None:
                 features = ['feature_%d' % (i + 1)
                             for i in range(data.shape[1])]
-            df = pd.DataFrame(data, columns=features)
-
-        if hasattr(self, '_onsets'):
-            onsets = np.array(self._onsets)
-            onsets += 0.0 if self.onset is None else self.onset
-        else:
-            onsets = np.nan if self.onset is None else self.onset
-        durations = getattr(self, '_durations', self.duration)
-        durations = np.nan if durations is None else durations
-        orders = getattr(self, '_orders', self.order)
-        orders = np.nan if orders is None else orders
+            features = list(features)
+            n = data.shape[0]
 
         # If any features clash with protected keys, append underscore
         protected = ['onset', 'order', 'duration', 'extractor', 'stim_name', \
                      'class', 'filename', 'history', 'source_file']
-        df = df.rename(columns={k: k + '_' for k in protected})
+        features = [f + '_' if f in protected else f for f in features]
 
-        index_cols = []
+        onsets, durations, orders = self._timing_arrays(n)
+        index = OrderedDict()
 
         # Generally we leave it to Extractors to properly track the number of
         # objects returned in the result DF, using the 'object_id' column.
@@ -143,44 +257,30 @@ class ExtractorResult(object):
         # take our best guess. The logic is that we increment the object
         # counter for any row in the DF that cannot be uniquely distinguished
         # from other rows by onset and duration.
-        if object_id and 'object_id' not in df.columns:
-            index = pd.Series(onsets).astype(str) + '_' + \
-                pd.Series(durations).astype(str)
-            if object_id is True or (object_id == 'auto' and
-                                     len(set(index)) < len(df)):
-                ids = np.arange(len(df)) if len(index) == 1 \
-                    else df.groupby(index).cumcount()
-                df.insert(0, 'object_id', ids)
-                index_cols = ['object_id']
+        if object_id and 'object_id' not in features:
+            ids = _object_ids(onsets, durations)
+            if object_id is True or (object_id == 'auto' and ids.any()):
+                index['object_id'] = ids
 
         if timing is True or (timing == 'auto' and
                               (np.isfinite(durations).any() or
                                np.isfinite(orders).any())):
-            df.insert(0, 'onset', onsets)
-            df.insert(0, 'duration', durations)
-            df.insert(0, 'order', orders)
-            df = df.sort_values('onset').reset_index(drop=True)
-            index_cols.extend(['onset', 'order', 'duration'])
-
-        if format == 'long':
-            df = df.melt(index_cols, var_name='feature')
-            df = df.dropna(subset=['value'])
-
-        if extractor_name:
-            name = self.extractor.name
-            if format == 'long':
-                df['extractor'] = name
-            else:
-                df.columns = pd.MultiIndex.from_product([[name], df.columns])
-
-        if metadata:
-            df['stim_name'] = self.stim.name
-            df['class'] = self.stim.__class__.__name__
-            df['filename'] = self.stim.filename
-            hist = '' if self.stim.history is None else str(self.stim.history)
-            df['history'] = hist
-            df['source_file'] = self.history.to_df().iloc[0].source_file
-        return df
+            index['onset'] = onsets
+            index['order'] = orders
+            index['duration'] = durations
+        return index, features, data
+
+    def _metadata(self):
+        # Returns the (column, value) pairs of the Stim metadata columns
+        hist = '' if self.stim.history is None else str(self.stim.history)
+        source = self.history
+        while source.parent:
+            source = source.parent
+        return [('stim_name', self.stim.name),
+                ('class', self.stim.__class__.__name__),
+                ('filename', self.stim.filename),
+                ('history', hist),
+                ('source_file', source.source_file)]
 
     @property
     def history(self):
@@ -192,6 +292,54 @@ class ExtractorResult(object):
         self._history = history
 
 
+def _object_ids(onsets, durations):
+    # Numbers the records that share an onset and a duration (treating NaNs
+    # as equal), in order of appearance
+    n = len(onsets)
+    onsets = np.where(np.isnan(onsets), np.inf, onsets).astype(float)
+    durations = np.where(np.isnan(durations), np.inf, durations)
+    # A stable sort keeps the records of each group in their original order
+    order = np.lexsort((durations, onsets))
+    onsets, durations = onsets[order], durations[order]
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (onsets[1:] != onsets[:-1]) | \
+        (durations[1:] != durations[:-1])
+    positions = np.arange(n)
+    ids = np.empty(n, dtype=int)
+    ids[order] = positions - np.maximum.accumulate(
+        np.where(starts, positions, 0))
+    return ids
+
+
+def _group_codes(columns):
+    # Numbers the distinct combinations of values of the passed arrays, in
+    # order of first appearance. NaNs are given their own code by factorize,
+    # so they need no special care.
+    codes = pd.factorize(columns[0])[0]
+    for values in columns[1:]:
+        c = pd.factorize(values)[0] + 1
+        codes = pd.factorize(codes * (c.max() + 1) + c)[0]
+    return codes
+
+
+def _common_dtype(arrays):
+    # The dtype of the concatenation of the arrays, except that non-numeric
+    # values are kept as objects (rather than converted to strings)
+    if all(a.dtype.kind in 'biuf' for a in arrays):
+        return np.result_type(*arrays)
+    return np.dtype(object)
+
+
+def _constant_categorical(value, n):
+    # A categorical column holding the same value (possibly None) n times
+    if value is None:
+        return pd.Categorical.from_codes(np.full(n, -1, dtype=np.int8),
+                                         dtype=pd.CategoricalDtype([]))
+    return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8),
+                                     dtype=pd.CategoricalDtype([value]))
+
+
+@profiling.profiled('merge')
 def merge_results(results, format='wide', timing=True, metadata=True,
                   extractor_names=True, object_id=True, aggfunc=None,
                   invalid_results='ignore', **to_df_kwargs):
@@ -243,7 +391,9 @@ def merge_results(results, format='wide', timing=True, metadata=True,
             function, and specifies how to aggregate multiple values for the
             same index. Can be a callable or any string value recognized by
             pandas. By default (None), 'mean' will be used for numeric columns
-            and 'first' will be used for object/categorical columns.
+            and 'first' will be used for object/categorical columns. If there
+            are no clashes and aggfunc is None, results are aligned directly
+            instead, which is considerably faster.
         invalid_results (str): Specifies desired action for treating elements
             of the passed in results argument that are not ExtractorResult
             objects. Valid values include:
@@ -255,78 +405,382 @@ def merge_results(results, format='wide', timing=True, metadata=True,
     Returns: a pandas DataFrame. For format details, see 'format' argument.
     '''
 
-    results = flatten(results)
-
-    _timing = True if timing == 'auto' else timing
-    _object_id = True if object_id == 'auto' else object_id
-
-    if extractor_names is True:
-        extractor_names = 'prepend'
-    elif extractor_names is False:
-        extractor_names = 'drop'
-
-    dfs = []
-    for r in results:
-        if isinstance(r, ExtractorResult):
-            dfs.append(r.to_df(timing=_timing, metadata=metadata,
-                               format='long', extractor_name=True,
-                               object_id=_object_id, **to_df_kwargs))
-        elif invalid_results == 'fail':
-            raise ValueError("At least one of the provided results was not an"
-                             "ExtractorResult. Set the invalid_results"
-                             "parameter to 'ignore' if you wish to ignore"
-                             "this.")
-
-    if len(dfs) == 0:
-        return pd.DataFrame()
-
-    data = pd.concat(dfs, axis=0).reset_index(drop=True)
-
-    if object_id == 'auto' and data['object_id'].nunique() == 1:
-        data = data.drop('object_id', axis=1)
-
-    if extractor_names in ['prepend', 'multi']:
-        data['feature'] = data['extractor'] + '#' + data['feature'].astype(str)
-
-    if extractor_names != 'column':
-        data = data.drop('extractor', axis=1)
-
-    if format == 'wide':
-        ind_cols = {'stim_name', 'onset', 'order', 'duration', 'object_id',
-                    'class', 'filename', 'history', 'source_file'}
-        ind_cols = list(ind_cols & set(data.columns))
-        # pandas groupby/index operations can't handle NaNs in index, (see
-        # issue at https://github.com/pandas-dev/pandas/issues/3729), so we
-        # replace NaNs with a placeholder and then re-substitute after
-        # pivoting.
-        dtypes = data[ind_cols].dtypes
-        data[ind_cols] = data[ind_cols].fillna('PlAcEholdER')
+    merger = ResultMerger(format=format, timing=timing, metadata=metadata,
+                          extractor_names=extractor_names,
+                          object_id=object_id, aggfunc=aggfunc,
+                          invalid_results=invalid_results, **to_df_kwargs)
+    merger.add(results)
+    return merger.merge()
 
-        # Set default aggfunc based on column type, otherwise bad things happen
-        if aggfunc is None:
-            aggfunc = 'mean' if is_numeric_dtype(data['value']) else 'first'
 
-        data = data.pivot_table(index=ind_cols, columns='feature',
-                                values='value', aggfunc=aggfunc).reset_index()
-        data.columns.name = None  # vestigial--is set to 'feature'
-        data[ind_cols] = data[ind_cols].replace('PlAcEholdER', np.nan)
-        data[ind_cols] = data[ind_cols].astype(dict(zip(ind_cols, dtypes)))
+# Columns that identify the rows of wide merged DataFrames, in order: the
+# keys of the records of a result, and the Stim metadata
+_INDEX_COLUMNS = ['order', 'duration', 'onset', 'object_id', 'stim_name',
+                  'class', 'filename', 'history', 'source_file']
 
-    if timing == 'auto' and 'onset' in data.columns:
-        if data['onset'].isnull().all():
-            data = data.drop(['onset', 'order', 'duration'], axis=1)
 
-    if 'onset' in data.columns:
-        key = [('onset', ''), ('order', ''), ('duration', '')] \
-            if isinstance(data.columns, pd.MultiIndex) \
-            else ['onset', 'order', 'duration']
-        data = data.sort_values(key).reset_index(drop=True)
+class ResultMerger(object):
 
-    if extractor_names == 'multi':
-        if format == 'long':
+    ''' Merges ExtractorResults incrementally. Results can be added as they
+    become available (e.g., while iterating over Graph.stream()); each one is
+    reduced to its feature values and row keys when added, so the results
+    themselves don't need to be kept in memory, and the merged DataFrame is
+    only built once, when merge() is called.
+
+    Takes the same arguments as merge_results() (except for the results),
+    and merge() returns the same DataFrame as merge_results() would for the
+    results added so far.
+
+    In wide format, records from different results that share a Stim, an
+    onset, an order, a duration and an object_id are aligned on the same row.
+    As long as no feature is given more than one value for the same row, and
+    aggfunc is None, this is done directly, without going through pandas'
+    pivot_table.
+    '''
+
+    def __init__(self, format='wide', timing=True, metadata=True,
+                 extractor_names=True, object_id=True, aggfunc=None,
+                 invalid_results='ignore', **to_df_kwargs):
+        if extractor_names is True:
+            extractor_names = 'prepend'
+        elif extractor_names is False:
+            extractor_names = 'drop'
+        if format == 'long' and extractor_names == 'multi':
             raise ValueError("Invalid extractor_names value 'multi'. When "
                              "format is 'long', extractor_names must be "
                              "one of 'drop', 'prepend', or 'column'.")
-        data.columns = pd.MultiIndex.from_tuples(
-            [c.split('#') for c in data.columns])
-    return data
+        self.format = format
+        self.timing = timing
+        self.metadata = metadata
+        self.extractor_names = extractor_names
+        self.object_id = object_id
+        self.aggfunc = aggfunc
+        self.invalid_results = invalid_results
+        self.to_df_kwargs = to_df_kwargs
+        # The distinct Stim metadata values; for every result, the row keys
+        # of its records (including the code of its Stim metadata); and the
+        # feature values of the results, in blocks of results that share an
+        # Extractor name and feature names
+        self._stims = OrderedDict()
+        self._keys = []
+        self._blocks = OrderedDict()
+
+    def __len__(self):
+        ''' The number of results added so far. '''
+        return len(self._keys)
+
+    def add(self, results):
+        ''' Adds an ExtractorResult, or a list of them. '''
+        _timing = True if self.timing == 'auto' else self.timing
+        _object_id = True if self.object_id == 'auto' else self.object_id
+        for r in flatten(listify(results)):
+            if not isinstance(r, ExtractorResult):
+                if self.invalid_results == 'fail':
+                    raise ValueError("At least one of the provided results "
+                                     "was not an ExtractorResult. Set the "
+                                     "invalid_results parameter to 'ignore' "
+                                     "if you wish to ignore this.")
+                continue
+            index, features, values = r._records(_timing, _object_id,
+                                                 **self.to_df_kwargs)
+            if isinstance(values, pd.DataFrame):
+                values = values.values
+            stim = tuple(v for _, v in r._metadata()) if self.metadata \
+                else ()
+            self._add_records(r.extractor.name, stim, index, features, values)
+
+    def _add_frame(self, df):
+        # Adds the records of a DataFrame holding the wide output of to_df()
+        # (with timing, metadata and object_id columns) for any number of
+        # results, with the name of their Extractor in an 'extractor' column,
+        # as written by result sinks. Features without any value for a given
+        # Extractor and Stim are ignored.
+        keys = [c for c in _INDEX_COLUMNS[:4] if c in df.columns]
+        stim_cols = [c for c in _INDEX_COLUMNS[4:] if c in df.columns]
+        features = [c for c in df.columns
+                    if c not in keys and c not in stim_cols and
+                    c != 'extractor']
+        if not self.timing:
+            keys = [c for c in keys if c == 'object_id']
+        if not self.object_id:
+            keys = [c for c in keys if c != 'object_id']
+        if len(df) == 0:
+            return
+        groups = _group_codes([df[c].values
+                               for c in ['extractor'] + stim_cols])
+        order = np.argsort(groups, kind='mergesort')
+        splits = np.flatnonzero(np.diff(groups[order])) + 1
+        values = df[features].values
+        for rows in np.split(order, splits):
+            first = rows[0]
+            stim = tuple(None if pd.isnull(df[c].values[first])
+                         else df[c].values[first] for c in stim_cols) \
+                if self.metadata else ()
+            index = OrderedDict((c, df[c].values[rows]) for c in keys)
+            group_values = values[rows]
+            valid = ~pd.isnull(group_values).all(axis=0)
+            self._add_records(df['extractor'].values[first], stim, index,
+                              [f for f, v in zip(features, valid) if v],
+                              group_values[:, valid])
+
+    def _add_records(self, extractor, stim, index, features, values):
+        index['stim'] = np.full(len(values),
+                                self._stims.setdefault(stim, len(self._stims)))
+        self._keys.append(index)
+        block = self._blocks.setdefault((extractor, tuple(features)),
+                                        ([], []))
+        block[0].append(len(self._keys) - 1)
+        block[1].append(values)
+
+    def merge(self):
+        ''' Returns the merged results as a pandas DataFrame. '''
+        if not self._keys:
+            return pd.DataFrame()
+
+        # Concatenate the keys of all records, and the values of the records
+        # of every block, with their positions among all records
+        key_cols = [c for c in _INDEX_COLUMNS[:4] if c in self._keys[0]]
+        keys = OrderedDict((c, np.concatenate([k[c] for k in self._keys]))
+                           for c in key_cols + ['stim'])
+        starts = np.cumsum([0] + [len(k['stim']) for k in self._keys])
+        blocks = []
+        for (extractor, features), (indices, values) in self._blocks.items():
+            positions = np.concatenate([np.arange(starts[i], starts[i + 1])
+                                        for i in indices])
+            values = np.concatenate(values) if len(values) > 1 else values[0]
+            blocks.append((extractor, features, positions, values))
+
+        if self.format == 'long':
+            data = self._merge_long(keys, blocks, starts)
+        else:
+            data = self._merge_wide(keys, blocks)
+
+        if self.object_id == 'auto' and 'object_id' in data.columns and \
+                data['object_id'].nunique() == 1:
+            data = data.drop('object_id', axis=1)
+
+        if self.timing == 'auto' and 'onset' in data.columns:
+            if data['onset'].isnull().all():
+                data = data.drop(['onset', 'order', 'duration'], axis=1)
+
+        if 'onset' in data.columns:
+            data = data.sort_values(['onset', 'order', 'duration'],
+                                    kind='mergesort').reset_index(drop=True)
+
+        if self.extractor_names == 'multi':
+            data.columns = pd.MultiIndex.from_tuples(
+                [c.split('#') for c in data.columns])
+        return data
+
+    def _feature_name(self, extractor, feature):
+        if self.extractor_names in ['prepend', 'multi']:
+            return '%s#%s' % (extractor, feature)
+        return feature
+
+    def _index_columns(self, keys, positions, columns):
+        # Returns the passed index columns for the records at the passed
+        # positions, with the Stim metadata columns if needed
+        data = OrderedDict((c, keys[c][positions])
+                           for c in columns if c in keys)
+        if self.metadata:
+            stims = keys['stim'][positions]
+            for i, col in enumerate(_INDEX_COLUMNS[4:]):
+                values = np.array([s[i] for s in self._stims], dtype=object)
+                data[col] = values[stims]
+        return data
+
+    def _merge_long(self, keys, blocks, starts):
+        # Every non-missing value is a row. Rows are ordered by result, then
+        # by feature, then by record (as when concatenating the long outputs
+        # of to_df()).
+        positions, feature_codes, extractor_codes, values = [], [], [], []
+        features, extractors = OrderedDict(), OrderedDict()
+        for extractor, names, block_positions, block_values in blocks:
+            e = extractors.setdefault(extractor, len(extractors))
+            for i, name in enumerate(names):
+                name = self._feature_name(extractor, name)
+                f = features.setdefault((i, name), len(features))
+                v = block_values[:, i]
+                keep = ~pd.isnull(v)
+                positions.append(block_positions[keep])
+                feature_codes.append(np.full(keep.sum(), f, dtype=int))
+                extractor_codes.append(np.full(keep.sum(), e, dtype=int))
+                values.append(v[keep])
+        positions = np.concatenate(positions)
+        feature_codes = np.concatenate(feature_codes)
+        feature_index = np.array([i for i, _ in features], dtype=int)
+        order = np.lexsort((positions, feature_index[feature_codes],
+                            np.searchsorted(starts, positions, 'right')))
+        positions = positions[order]
+        labels = np.empty(len(features), dtype=object)
+        labels[:] = [name for _, name in features]
+
+        index_cols = ['object_id', 'onset', 'order', 'duration']
+        data = self._index_columns(keys, positions, index_cols)
+        columns = OrderedDict((c, data.pop(c)) for c in index_cols
+                              if c in data)
+        columns['feature'] = labels[feature_codes[order]]
+        dtype = _common_dtype(values)
+        columns['value'] = np.concatenate(
+            [v.astype(dtype, copy=False) for v in values])[order]
+        if self.extractor_names == 'column':
+            labels = np.array(list(extractors), dtype=object)
+            columns['extractor'] = labels[
+                np.concatenate(extractor_codes)[order]]
+        columns.update(data)
+        return pd.DataFrame(columns)
+
+    def _merge_wide(self, keys, blocks):
+        # Number the distinct row keys, in order of appearance
+        rows = _group_codes(list(keys.values()))
+        n_rows = rows.max() + 1
+
+        # Collect, for every feature, the positions and values of the
+        # records of every block holding it
+        parts = OrderedDict()
+        for extractor, features, positions, values in blocks:
+            for i, f in enumerate(features):
+                f = self._feature_name(extractor, f)
+                parts.setdefault(f, []).append((positions, values[:, i]))
+
+        columns = self._align(parts, rows, n_rows)
+        if columns is None:
+            columns = self._pivot(parts, rows)
+
+        # Rows that only hold missing values are dropped (as by pivot_table)
+        first = np.unique(rows, return_index=True)[1][columns.index.values]
+        data = pd.DataFrame(self._index_columns(keys, first, _INDEX_COLUMNS))
+        columns = columns.reset_index(drop=True)
+        return pd.concat([data, columns[sorted(columns.columns, key=str)]],
+                         axis=1)
+
+    def _align(self, parts, rows, n_rows):
+        # Places the values of every feature on their rows, if no feature
+        # has more than one value per row and no aggfunc has been set.
+        # Returns None otherwise.
+        if self.aggfunc is not None:
+            return None
+        columns = OrderedDict()
+        filled = np.zeros(n_rows, dtype=bool)
+        for feature, feature_parts in parts.items():
+            feature_rows = [rows[p[0]] for p in feature_parts]
+            n = sum(len(r) for r in feature_rows)
+            if n > 1 and np.bincount(np.concatenate(feature_rows)).max() > 1:
+                return None
+            values = [p[1] for p in feature_parts]
+            dtype = _common_dtype(values)
+            if n < n_rows:
+                dtype = float if dtype.kind in 'biuf' else object
+                column = np.full(n_rows, np.nan, dtype=dtype)
+            else:
+                column = np.empty(n_rows, dtype=dtype)
+            for r, v in zip(feature_rows, values):
+                column[r] = v
+            valid = ~pd.isnull(column)
+            if valid.any():
+                if dtype == object:
+                    column = pd.Series(column).infer_objects().values
+                columns[feature] = column
+                filled |= valid
+        index = np.flatnonzero(filled)
+        if len(index) < n_rows:
+            columns = OrderedDict((f, c[index]) for f, c in columns.items())
+        return pd.DataFrame(columns, index=index)
+
+    def _pivot(self, parts, rows):
+        # Aggregates multiple values per row and feature with pivot_table
+        positions, features, values = [], [], []
+        for feature, feature_parts in parts.items():
+            for p, v in feature_parts:
+                keep = ~pd.isnull(v)
+                positions.append(p[keep])
+                values.append(v[keep])
+                features.append(np.full(keep.sum(), feature, dtype=object))
+        positions = np.concatenate(positions)
+        if len(positions) == 0:
+            return pd.DataFrame(index=np.array([], dtype=int))
+        # Records are passed on in the order in which they were added, for
+        # aggfuncs like 'first' that depend on it
+        order = np.argsort(positions, kind='mergesort')
+        dtype = _common_dtype(values)
+        values = np.concatenate([v.astype(dtype, copy=False) for v in values])
+        data = pd.DataFrame({'row': rows[positions[order]],
+                             'feature': np.concatenate(features)[order],
+                             'value': values[order]})
+        aggfunc = self.aggfunc
+        # Set default aggfunc based on column type, otherwise bad things happen
+        if aggfunc is None:
+            data['value'] = data['value'].infer_objects()
+            aggfunc = 'mean' if is_numeric_dtype(data['value']) else 'first'
+        data = data.pivot_table(index='row', columns='feature',
+                                values='value', aggfunc=aggfunc)
+        data.columns.name = None  # vestigial--is set to 'feature'
+        return data
+
+
+def stitch_results(results, stim=None):
+    ''' Joins the results of a frame-based Extractor (e.g., the librosa
+    Extractors, or STFTAudioExtractor) applied to consecutive, possibly
+    overlapping, chunks of a Stim (e.g., from AudioStim.chunks()) into one
+    continuous ExtractorResult.
+
+    Results are ordered by the onsets of their Stims. Where chunks overlap,
+    every frame is taken from the chunk in which it's furthest from the
+    edges: the boundary between two chunks is placed in the middle of their
+    overlap. Frames missing on one side of a boundary (e.g., because the
+    overlap is shorter than the analysis window) are taken from the other.
+
+    Args:
+        results (list): ExtractorResults of the same Extractor, with a row
+            (and an onset) per frame.
+        stim (Stim): Optional Stim to attribute the stitched result to (e.g.,
+            the Stim the chunks were taken from). By default, the Stim of the
+            first chunk is used.
+    '''
+    results = sorted(listify(results),
+                     key=lambda r: (r.stim.onset or 0.0, r.stim.order or 0))
+    if not results:
+        raise ValueError("No results to stitch.")
+    if any(hasattr(r.extractor, '_to_df') for r in results):
+        raise ValueError("Only results with a row of feature values per "
+                         "frame can be stitched.")
+    features = results[0].get_feature_names()
+
+    # Frames of a chunk are kept if they start before the middle of its
+    # overlap with the next chunk, and after the last frame kept so far
+    # (allowing for rounding errors in the onsets)
+    tolerance = 1e-6
+    last = -np.inf
+    values, onsets, durations = [], [], []
+    for i, r in enumerate(results):
+        if r.get_feature_names() != features:
+            raise ValueError("Results with different features can't be "
+                             "stitched.")
+        data = r.to_array()
+        r_onsets, r_durations, _ = r._timing_arrays(len(data))
+        if np.isnan(r_onsets).any():
+            raise ValueError("Results without onsets can't be stitched.")
+        keep = r_onsets > last + tolerance
+        if i + 1 < len(results):
+            end = (r.stim.onset or 0.0) + (r.stim.duration or 0.0)
+            boundary = ((results[i + 1].stim.onset or 0.0) + end) / 2.
+            keep &= r_onsets < boundary
+        if keep.any():
+            values.append(data[keep])
+            onsets.append(r_onsets[keep])
+            durations.append(r_durations[keep])
+            last = onsets[-1].max()
+
+    first = results[0]
+    if values:
+        values = np.concatenate(values)
+        onsets = np.concatenate(onsets)
+        durations = np.concatenate(durations)
+    else:
+        values = np.empty((0, len(features)))
+    result = ExtractorResult(values, first.stim if stim is None else stim,
+                             first.extractor, features=features,
+                             onsets=onsets, durations=durations,
+                             orders=list(range(len(values))))
+    result.history = first.history
+    return result
@@ -47,7 +47,9 @@ class SharpnessExtractor(ImageExtractor):
         # Taken from
         # http://stackoverflow.com/questions/7765810/is-there-a-way-to-detect-if-an-image-is-blurry?lq=1
         data = stim.data
-        gray_image = cv2.cvtColor(data, cv2.COLOR_BGR2GRAY)
+        # Frames may already have been decoded to grayscale
+        gray_image = data if data.ndim == 2 else \
+            cv2.cvtColor(data, cv2.COLOR_BGR2GRAY)
 
         sharpness = np.max(
             cv2.convertScaleAbs(cv2.Laplacian(gray_image, 3))) / 255.0
@@ -71,7 +71,8 @@ class FarnebackOpticalFlowExtractor(VideoExtractor):
         for i, f in enumerate(stim):
 
             frame = f.data
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
             if i == 0:
                 last_frame = frame
@@ -3,18 +3,25 @@ of one type as input and return a `Stim` of the same type as output (but with
 some changes to its data).
 '''
 
-from .audio import AudioTrimmingFilter
 from .base import TemporalTrimmingFilter
-from .image import (ImageCroppingFilter,
-                    PillowImageFilter)
-from .text import (WordStemmingFilter,
-                   TokenizingFilter,
-                   TokenRemovalFilter,
-                   PunctuationRemovalFilter,
-                   LowerCasingFilter)
-from .video import (FrameSamplingFilter,
-                    VideoTrimmingFilter)
+from pliers.utils import lazy_exports
 
+# Classes defined in the other submodules are only imported when first
+# accessed, so that importing the package doesn't import every optional
+# dependency.
+_exports = {
+    'audio': ['AudioTrimmingFilter'],
+    'image': ['ImageCroppingFilter',
+              'PillowImageFilter'],
+    'text': ['WordStemmingFilter',
+             'TokenizingFilter',
+             'TokenRemovalFilter',
+             'PunctuationRemovalFilter',
+             'LowerCasingFilter'],
+    'video': ['FrameSamplingFilter',
+              'VideoDecodingFilter',
+              'VideoTrimmingFilter']
+}
 
 __all__ = [
     'AudioTrimmingFilter',
@@ -27,5 +34,8 @@ __all__ = [
     'PunctuationRemovalFilter',
     'LowerCasingFilter',
     'FrameSamplingFilter',
+    'VideoDecodingFilter',
     'VideoTrimmingFilter'
 ]
+
+__getattr__, __dir__ = lazy_exports(__name__, _exports)
@@ -66,4 +66,7 @@ class TemporalTrimmingFilter(Filter):
                 raise ValueError("Invalid end argument passed: Attempted to"
                                  "trim beyond the duration of the clip")
         subclip = stim.clip.subclip(start, end)
-        return type(stim)(onset=stim.onset, filename=stim.filename, clip=subclip)
+        # Videos keep the options their frames were decoded with
+        options = getattr(stim, 'decode_options', {})
+        return type(stim)(onset=stim.onset, filename=stim.filename, clip=subclip,
+                          **options)
@@ -1,6 +1,7 @@
 ''' Filters that operate on TextStim inputs. '''
 
-from pliers.stimuli.video import VideoStim, VideoFrameCollectionStim
+from pliers.stimuli.video import (VideoStim, VideoFrameCollectionStim,
+                                  _file_clips)
 from pliers.utils import attempt_to_import, verify_dependencies
 from .base import Filter, TemporalTrimmingFilter
 
@@ -67,9 +68,52 @@ class FrameSamplingFilter(Filter):
                              key=lambda i: diffs[i],
                              reverse=True)[:self.top_n]
 
+        # Unless the video's clip is already open (or isn't read directly
+        # from the file), the new Stim opens its own when it's first needed
         return VideoFrameCollectionStim(filename=video.filename,
-                                        clip=video.clip,
-                                        frame_index=new_idx)
+                                        clip=video.__dict__.get('_clip'),
+                                        frame_index=new_idx,
+                                        **video.decode_options)
+
+
+class VideoDecodingFilter(VideoFilter):
+
+    ''' Re-reads a video with frames resized, converted to grayscale, and/or
+    resampled to another frame rate by ffmpeg as they're decoded, so that
+    downstream Transformers receive smaller frames without resizing them
+    again. Unlike passing the options to VideoStim directly, applying them
+    with a filter records them in the video's history.
+
+    Args:
+        size (tuple): Width and height (in pixels) of the frames. Either can
+            be None, to preserve the aspect ratio.
+        pix_fmt (str): Pixel format of the frames: 'rgb24', 'rgba', or
+            'gray' (in which case frames are 2-d arrays).
+        fps (float): Frame rate to resample the video to.
+    '''
+
+    _log_attributes = ('size', 'pix_fmt', 'fps')
+    VERSION = '1.0'
+
+    def __init__(self, size=None, pix_fmt=None, fps=None):
+        self.size = size
+        self.pix_fmt = pix_fmt
+        self.fps = fps
+        super(VideoDecodingFilter, self).__init__()
+
+    def _filter(self, video):
+        clip = video.__dict__.get('_clip')
+        if clip is not None and clip not in _file_clips:
+            raise ValueError('Decoding options can only be applied to videos '
+                             'read directly from a file (e.g., before they '
+                             'are trimmed).')
+        options = dict(video.decode_options)
+        options.update((k, v) for k, v in [('size', self.size),
+                                          ('pix_fmt', self.pix_fmt),
+                                          ('fps', self.fps)]
+                       if v is not None)
+        return VideoStim(filename=video.filename, onset=video.onset,
+                         **options)
 
 
 class VideoTrimmingFilter(TemporalTrimmingFilter, VideoFilter):
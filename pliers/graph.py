@@ -1,16 +1,27 @@
 ''' The `graph` module contains tools for constructing and executing graphs
 of pliers Transformers. '''
 
+from pliers import config, profiling
 from pliers.extractors.base import merge_results
+from pliers.sinks import ResultSink, CSVSink
 from pliers.stimuli import __all__ as stim_list
 from pliers.transformers import get_transformer
+from pliers.transformers.cache import DiskCache
 from pliers.utils import (listify, flatten, isgenerator, attempt_to_import,
-                          verify_dependencies)
+                          verify_dependencies, batch_iterable,
+                          fingerprint_hasher)
 from itertools import chain
-from six import string_types
+from multiprocessing.pool import ThreadPool
+from six import string_types, reraise
+from six.moves.queue import Queue, Empty, Full
 from collections import OrderedDict
+from os.path import exists, getmtime, getsize, realpath
 
+import copy
 import json
+import multiprocessing
+import sys
+import threading
 
 pgv = attempt_to_import('pygraphviz', 'pgv')
 stim_list.insert(0, 'ExtractorResult')
@@ -59,6 +70,79 @@ class Node(object):
         return spec
 
 
+def _node_span(node, stim):
+    # Profiling span covering (part of) the execution of a Graph node
+    name = node.name or node.transformer.name
+    return profiling.span(name, 'node', node=name,
+                          transformer=node.transformer.__class__.__name__,
+                          stims_in=len(listify(stim)))
+
+
+class RunJournal(object):
+
+    ''' A persistent record of the results of Graph runs, used to resume
+    interrupted runs and to avoid recomputing branches of a graph that
+    haven't changed. Results are stored for each combination of an input
+    stim and a leaf node, under a key that combines the identity of the stim
+    with the specification of every node on the path from the root to the
+    leaf (Transformer class, name, version, and parameters).
+
+    Args:
+        path (str): Directory in which to store the journal. Created if it
+            doesn't already exist.
+        digest (bool): How input files are identified. If False (default),
+            by their path, size and modification time. If True, by a digest
+            of their contents, which survives copying or touching the files
+            but requires reading every file in full.
+    '''
+
+    def __init__(self, path, digest=False):
+        self.path = path
+        self.digest = digest
+        self._store = DiskCache(path)
+
+    def stim_key(self, stim):
+        ''' Returns a string identifying an input stim (or a path to one). '''
+        filename = stim if isinstance(stim, string_types) else stim.filename
+        if self.digest and filename is not None and exists(filename):
+            h = fingerprint_hasher()
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            identity = (stim.__class__.__name__, h.hexdigest())
+            if not isinstance(stim, string_types):
+                identity += (stim.name, stim.onset, stim.duration, stim.order,
+                             str(stim.history))
+            return str(identity)
+        if isinstance(stim, string_types):
+            path = realpath(stim)
+            return str((path, getsize(path), getmtime(path)))
+        return stim.fingerprint()
+
+    def entry_key(self, stim_key, node_key):
+        ''' Returns the key under which the results of the leaf node with
+        the passed key (see Graph._node_key) are stored for a stim. '''
+        h = fingerprint_hasher()
+        h.update(repr((stim_key, node_key)).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key, default=None):
+        return self._store.get(key, default)
+
+    def set(self, key, results):
+        self._store.set(key, results)
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __len__(self):
+        return len(self._store)
+
+    def clear(self):
+        ''' Removes all recorded results. '''
+        self._store.clear()
+
+
 class Graph(object):
     ''' Graph-like structure that represents an entire pliers workflow.
 
@@ -68,12 +152,16 @@ class Graph(object):
             in one of the forms accepted by add_nodes().
         spec (str): An optional path to a .json file containing the graph
             specification.
+        n_jobs (int): Maximum number of nodes to execute concurrently when the
+            graph is run. If 1 (default), nodes are executed one at a time, in
+            depth-first order. If None, the 'n_jobs' config option is used.
     '''
 
-    def __init__(self, nodes=None, spec=None):
+    def __init__(self, nodes=None, spec=None, n_jobs=1):
 
         self.nodes = OrderedDict()
         self.roots = []
+        self.n_jobs = n_jobs
         if nodes is not None:
             if isinstance(nodes, dict):
                 nodes = nodes['roots']
@@ -191,8 +279,10 @@ class Graph(object):
         if return_node:
             return node
 
-    def run(self, stim, merge=True, **merge_kwargs):
-        ''' Executes the graph by calling all Transformers in sequence.
+    def run(self, stim, merge=True, journal=None, sink=None, **merge_kwargs):
+        ''' Executes the graph by calling all Transformers in sequence (or,
+        if the Graph's n_jobs is not 1, by running independent nodes
+        concurrently). The order of the results doesn't depend on n_jobs.
 
         Args:
             stim (str, Stim, list): One or more valid inputs to any
@@ -201,16 +291,80 @@ class Graph(object):
                 DataFrame before being returned. If False, a list of
                 ExtractorResult objects is returned (one per Extractor/Stim
                 combination).
+            journal (str, RunJournal): Optional RunJournal (or path to the
+                directory of one) in which to record the results of every
+                leaf node for every input stim, as soon as they're available.
+                Results already recorded for an unchanged stim and an
+                unchanged branch of the graph are reused rather than
+                recomputed, so an interrupted run can be resumed, and only
+                new or modified branches are run when the graph changes.
+                Input stims are then processed one at a time.
+            sink (str, ResultSink): Optional ResultSink (or path to the
+                directory of a CSVSink) to which results are written as
+                they're produced, instead of being held in memory until the
+                end of the run (see stream()). If merge is True, the merged
+                DataFrame is then read back from the sink; otherwise, a
+                ResultReader for the sink is returned.
             merge_kwargs: Optional keyword arguments to pass onto the
                 merge_results() call.
         '''
-        results = list(chain(*[self.run_node(n, stim) for n in self.roots]))
+        n_jobs = self.n_jobs
+        if n_jobs is None:
+            n_jobs = config.get_option('n_jobs')
+        if sink is not None:
+            reader = self._run_to_sink(stim, sink, journal, n_jobs)
+            return reader.to_df(**merge_kwargs) if merge else reader
+        if journal is None:
+            outputs = self._execute(self.roots, stim, n_jobs)
+            results = list(chain(*[outputs[k] for k in
+                                   self._leaf_keys(self.roots)]))
+        else:
+            results = self._run_with_journal(stim, journal, n_jobs)
         results = list(flatten(results))
         self._results = results  # For use in plotting
         return merge_results(results, **merge_kwargs) if merge else results
 
     transform = run
 
+    def stream(self, stim, chunksize=1, buffer_size=8):
+        ''' Executes the graph incrementally, returning a generator that
+        yields ExtractorResults as soon as they're available. Stims flow
+        through the graph one at a time (or in chunks), and every output is
+        passed on to all of the children of its node before the next one is
+        produced, so collections such as the frames of a video are never held
+        in memory all at once. Equivalent nodes (see run()) are executed once.
+
+        If the Graph's n_jobs is 1, nodes are run in the calling thread, and
+        results are yielded in depth-first order for each input stim (but
+        interleaved across stims, unlike run()). Otherwise, every node runs in
+        a thread of its own, connected to its children by bounded queues,
+        with at most n_jobs nodes transforming stims at any time; results
+        are then yielded in the order in which they're produced.
+
+        Args:
+            stim (str, Stim, list, generator): One or more valid inputs to
+                any Transformer's 'transform' call.
+            chunksize (int): Number of stims passed on to a node's Transformer
+                at a time. Chunks of more than one stim are transformed
+                eagerly (allowing Transformers to process them in batches or
+                in parallel), at the expense of holding all of their outputs
+                in memory.
+            buffer_size (int): Maximum number of chunks queued between two
+                nodes when n_jobs is not 1.
+        '''
+        plans = self._plan(self.roots, None)
+        stims = listify(stim) if not isgenerator(stim) else stim
+        n_jobs = self.n_jobs
+        if n_jobs is None:
+            n_jobs = config.get_option('n_jobs')
+        if n_jobs is None:
+            # As in run(), where ThreadPool does the same
+            n_jobs = multiprocessing.cpu_count()
+        if n_jobs == 1:
+            return self._stream_plans(plans, stims, chunksize)
+        return self._stream_concurrently(plans, stims, chunksize, buffer_size,
+                                         n_jobs)
+
     def run_node(self, node, stim):
         ''' Executes the Transformer at a specific node.
 
@@ -222,17 +376,347 @@ class Graph(object):
         '''
         if isinstance(node, string_types):
             node = self.nodes[node]
+        outputs = self._execute([node], stim, 1)
+        return list(chain(*[outputs[k] for k in self._leaf_keys([node])]))
 
-        result = node.transformer.transform(stim)
+    @staticmethod
+    def _node_key(node, parent_key):
+        # Two nodes are equivalent if they apply equivalent Transformers
+        # (same class, name and logged parameters) to equivalent inputs, i.e.,
+        # if their parents are equivalent too. Equivalent nodes are only
+        # executed once per run, and their output is shared.
+        params = repr(sorted(node.parameters.items()))
+        return (parent_key, node.transformer.fingerprint(), params)
+
+    def _shared_keys(self, roots=None):
+        # Returns the keys of all nodes that have at least one equivalent
+        # node (under the passed roots).
+        counts = {}
+        stack = [(n, None) for n in (self.roots if roots is None else roots)]
+        while stack:
+            node, parent_key = stack.pop()
+            key = self._node_key(node, parent_key)
+            counts[key] = counts.get(key, 0) + 1
+            stack.extend((c, key) for c in node.children)
+        return set(k for k, c in counts.items() if c > 1)
+
+    def _leaf_keys(self, roots):
+        # Returns the keys of all leaves under the passed roots, in
+        # depth-first order (equivalent leaves are listed once per node).
+        keys = []
+        stack = [(n, None) for n in reversed(roots)]
+        while stack:
+            node, parent_key = stack.pop()
+            key = self._node_key(node, parent_key)
+            if node.is_leaf():
+                keys.append(key)
+            stack.extend((c, key) for c in reversed(node.children))
+        return keys
+
+    def _execute(self, roots, stim, n_jobs):
+        # Runs all nodes under the passed roots, and returns a dict mapping
+        # the key of every leaf to its (listified) output.
+        if n_jobs != 1:
+            return self._run_concurrently(roots, stim, n_jobs)
+        outputs = {}
+        shared = self._shared_keys(roots)
+        memo = {}
+        for root in roots:
+            self._run_node(root, stim, None, memo, shared, outputs)
+        return outputs
+
+    def _run_node(self, node, stim, parent_key, memo, shared, outputs):
+        key = self._node_key(node, parent_key)
+        if key in memo:
+            result = memo[key]
+        else:
+            with _node_span(node, stim) as info:
+                result = node.transformer.transform(stim)
+                info['stims_out'] = len(listify(result) or [])
+            # If result is a generator, the first consumer will destroy the
+            # iterable, so cache via list conversion
+            if isgenerator(result) and (key in shared or
+                                        len(node.children) > 1):
+                result = list(result)
+            memo[key] = result
         if node.is_leaf():
-            return listify(result)
-
-        stim = result
-        # If result is a generator, the first child will destroy the
-        # iterable, so cache via list conversion
-        if len(node.children) > 1 and isgenerator(stim):
-            stim = list(stim)
-        return list(chain(*[self.run_node(c, stim) for c in node.children]))
+            outputs[key] = listify(result)
+        for c in node.children:
+            self._run_node(c, result, key, memo, shared, outputs)
+
+    def _prune(self, nodes, parent_key, wanted):
+        # Returns copies of the passed nodes that only keep the branches
+        # leading to leaves whose keys are in wanted.
+        pruned = []
+        for node in nodes:
+            key = self._node_key(node, parent_key)
+            if node.is_leaf():
+                if key in wanted:
+                    pruned.append(node)
+                continue
+            children = self._prune(node.children, key, wanted)
+            if children:
+                node = copy.copy(node)
+                node.children = children
+                pruned.append(node)
+        return pruned
+
+    def _run_with_journal(self, stims, journal, n_jobs):
+        if isinstance(journal, string_types):
+            journal = RunJournal(journal)
+        leaf_keys = self._leaf_keys(self.roots)
+        results = []
+        for stim in listify(stims):
+            stim_key = journal.stim_key(stim)
+            entries = OrderedDict((k, journal.entry_key(stim_key, k))
+                                  for k in leaf_keys)
+            outputs = {}
+            for key, entry in entries.items():
+                recorded = journal.get(entry)
+                if recorded is not None:
+                    outputs[key] = recorded
+            # Only the branches leading to new or modified leaves are run
+            missing = set(entries) - set(outputs)
+            if missing:
+                roots = self._prune(self.roots, None, missing)
+                computed = self._execute(roots, stim, n_jobs)
+                for key in missing:
+                    journal.set(entries[key], computed[key])
+                outputs.update(computed)
+            results.extend(chain(*[outputs[k] for k in leaf_keys]))
+        return results
+
+    def _run_to_sink(self, stims, sink, journal, n_jobs):
+        # Writes results to the sink as they're produced, and only keeps
+        # lightweight references to them
+        if not isinstance(sink, ResultSink):
+            sink = CSVSink(sink)
+        if journal is None:
+            results = self.stream(stims)
+        else:
+            results = chain.from_iterable(
+                self._run_with_journal([s], journal, n_jobs)
+                for s in listify(stims))
+        written = []
+        try:
+            for result in results:
+                written.extend(sink.write(result))
+        finally:
+            sink.flush()
+        self._results = written  # For use in plotting
+        return sink.read()
+
+    def _run_concurrently(self, roots, stim, n_jobs):
+        # Schedules every distinct node (see _node_key) on a pool of threads
+        # as soon as its parent's output is available, and fans its output
+        # out to all equivalent nodes. A private pool is used so that nodes
+        # can't starve Transformers that use the shared executors internally.
+        done = Queue()
+
+        def _run(key, node, stim):
+            try:
+                with _node_span(node, stim) as info:
+                    result = node.transformer.transform(stim)
+                    # Make sure lazy results are computed in this worker, and
+                    # that they can be consumed by several children
+                    if isgenerator(result):
+                        result = list(result)
+                    info['stims_out'] = len(listify(result) or [])
+                done.put((key, result, None))
+            except Exception:
+                done.put((key, None, sys.exc_info()))
+
+        pool = ThreadPool(n_jobs)
+        outputs = {}
+        waiting = {}
+        leaves = {}
+
+        def _schedule(node, stim, parent_key):
+            key = self._node_key(node, parent_key)
+            if key in outputs:
+                _consume(node, key)
+            elif key in waiting:
+                waiting[key].append(node)
+            else:
+                waiting[key] = [node]
+                pool.apply_async(_run, (key, node, stim))
+
+        def _consume(node, key):
+            result = outputs[key]
+            if node.is_leaf():
+                leaves[key] = listify(result)
+            for child in node.children:
+                _schedule(child, result, key)
+
+        try:
+            for root in roots:
+                _schedule(root, stim, None)
+            while waiting:
+                key, result, exc_info = done.get()
+                if exc_info is not None:
+                    reraise(*exc_info)
+                outputs[key] = result
+                for node in waiting.pop(key):
+                    _consume(node, key)
+        finally:
+            pool.terminate()
+        return leaves
+
+    def _plan(self, nodes, parent_key):
+        # Merges equivalent nodes (see _node_key) into a tree of
+        # (node, leaves, children) tuples for streaming, where leaves
+        # is the number of leaves the merged node stands for (i.e., the number
+        # of times each of its outputs appears in the results).
+        groups = OrderedDict()
+        for node in nodes:
+            key = self._node_key(node, parent_key)
+            groups.setdefault(key, []).append(node)
+        plans = []
+        for key, group in groups.items():
+            leaves = sum(1 for n in group if n.is_leaf())
+            children = list(chain(*[n.children for n in group]))
+            plans.append((group[0], leaves, self._plan(children, key)))
+        return plans
+
+    @staticmethod
+    def _stream_chunks(node, stims, chunksize):
+        # Lazily transforms stims in chunks of the passed size, and yields
+        # the outputs of each chunk as a list
+        if chunksize == 1:
+            end = object()
+            for stim in stims:
+                results = node.transformer.stream(stim)
+                stims_in = 1
+                while True:
+                    # Every output is produced in a span of its own, as the
+                    # children run in between
+                    with _node_span(node, [stim] * stims_in) as info:
+                        result = next(results, end)
+                        info['stims_out'] = int(result is not end)
+                    if result is end:
+                        break
+                    stims_in = 0
+                    yield [result]
+        else:
+            for chunk in batch_iterable(stims, chunksize):
+                with _node_span(node, chunk) as info:
+                    results = node.transformer.transform(chunk)
+                    results = [r for r in flatten(listify(results))
+                               if r is not None]
+                    info['stims_out'] = len(results)
+                yield results
+
+    def _stream_plans(self, plans, stims, chunksize):
+        # Every chunk of outputs is passed down the tree before the next
+        # chunk of inputs is transformed
+        for chunk in batch_iterable(stims, chunksize):
+            for node, leaves, children in plans:
+                for outputs in self._stream_chunks(node, chunk, chunksize):
+                    for result in outputs:
+                        for _ in range(leaves):
+                            yield result
+                    for result in self._stream_plans(children, outputs,
+                                                     chunksize):
+                        yield result
+
+    def _stream_concurrently(self, plans, stims, chunksize, buffer_size,
+                             n_jobs):
+        # Runs every (merged) node in a thread of its own. Nodes receive
+        # chunks of inputs through a bounded queue, and put every chunk of
+        # outputs on the queues of all of their children, so fast producers
+        # block until their consumers catch up. A semaphore caps the number
+        # of nodes transforming stims at once.
+        end = object()
+        stop = threading.Event()
+        running = threading.BoundedSemaphore(n_jobs)
+        results = Queue(buffer_size)
+
+        def _put(queue, item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    pass
+
+        def _receive(queue):
+            while not stop.is_set():
+                try:
+                    chunk = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if chunk is end:
+                    return
+                yield chunk
+
+        def _run(plan, queue):
+            node, leaves, children = plan
+            queues = [Queue(buffer_size) for _ in children]
+            for child, child_queue in zip(children, queues):
+                _start(child, child_queue)
+            try:
+                # Inputs are received outside of the semaphore, so that
+                # waiting nodes don't prevent their parents from running
+                for chunk in _receive(queue):
+                    outputs = self._stream_chunks(node, chunk, chunksize)
+                    while not stop.is_set():
+                        with running:
+                            out = next(outputs, end)
+                        if out is end:
+                            break
+                        for _ in range(leaves):
+                            _put(results, ('results', out))
+                        for child_queue in queues:
+                            _put(child_queue, out)
+                for child_queue in queues:
+                    _put(child_queue, end)
+                _put(results, ('done', None))
+            except Exception:
+                _put(results, ('error', sys.exc_info()))
+
+        def _start(plan, queue):
+            thread = threading.Thread(target=_run, args=(plan, queue))
+            thread.daemon = True
+            thread.start()
+
+        def _count(plans):
+            return sum(1 + _count(children) for _, _, children in plans)
+
+        root_queues = [Queue(buffer_size) for _ in plans]
+
+        def _feed():
+            try:
+                for chunk in batch_iterable(stims, chunksize):
+                    for queue in root_queues:
+                        _put(queue, chunk)
+                for queue in root_queues:
+                    _put(queue, end)
+            except Exception:
+                _put(results, ('error', sys.exc_info()))
+
+        def _collect():
+            # The roots share their input, so it's fanned out by a feeder
+            # thread
+            for plan, queue in zip(plans, root_queues):
+                _start(plan, queue)
+            feeder = threading.Thread(target=_feed)
+            feeder.daemon = True
+            feeder.start()
+            try:
+                pending = _count(plans)
+                while pending:
+                    kind, value = results.get()
+                    if kind == 'error':
+                        reraise(*value)
+                    elif kind == 'done':
+                        pending -= 1
+                    else:
+                        for result in value:
+                            yield result
+            finally:
+                stop.set()
+
+        return _collect()
 
     def draw(self, filename, color=True):
         ''' Render a plot of the graph via pygraphviz.
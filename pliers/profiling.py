@@ -0,0 +1,500 @@
+''' The `profiling` module contains tools for measuring where the time (and
+memory) goes when Transformers and Graphs are executed. '''
+
+from functools import wraps
+from timeit import default_timer
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__all__ = ['Profiler', 'MemoryTracker', 'span', 'event', 'profiled']
+
+if hasattr(time, 'thread_time'):
+    _cpu_time = time.thread_time
+elif hasattr(time, 'process_time'):
+    _cpu_time = time.process_time
+else:
+    _cpu_time = time.clock
+
+# Profilers currently recording (see Profiler.__enter__)
+_profilers = []
+_profilers_lock = threading.Lock()
+_context = threading.local()
+
+
+class Profiler(object):
+
+    ''' Records timing information about every Transformer call (and a few
+    other operations) made while it is active. Use as a context manager:
+
+        with Profiler() as profiler:
+            graph.run(stims)
+        profiler.summary(by='node')
+
+    The following events are recorded:
+
+        - 'node': the execution of a Graph node (including any conversions
+          and iteration performed by its Transformer).
+        - 'transform': a call to a Transformer's internal _transform method
+          (on a single stim, or on a batch of stims).
+        - 'conversion': an implicit conversion triggered by a Transformer.
+        - 'cache': a Transformer result retrieved from the cache.
+        - 'rate_limit': time spent waiting for an API rate limit.
+        - 'merge': a call to merge_results().
+
+    Only events in the current process are recorded; work sent to worker
+    processes (see the 'executor' option) appears as a single call.
+    '''
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._start = None
+
+    def __enter__(self):
+        self._start = default_timer()
+        with _profilers_lock:
+            _profilers.append(self)
+        return self
+
+    def __exit__(self, *args):
+        with _profilers_lock:
+            _profilers.remove(self)
+
+    def record(self, name, category, start, duration=None, cpu=None,
+               **args):
+        ''' Adds an event. Times are in seconds; start is a value returned
+        by timeit.default_timer(). Events without a duration are instants.
+        '''
+        event = {
+            'name': name,
+            'category': category,
+            'start': start - self._start,
+            'duration': duration,
+            'cpu': cpu,
+            'pid': os.getpid(),
+            'thread': threading.current_thread().ident
+        }
+        event.update(args)
+        with self._lock:
+            self.events.append(event)
+
+    def to_df(self):
+        ''' Returns a pandas DataFrame with one row per recorded event. '''
+        import pandas as pd
+        columns = ['name', 'category', 'node', 'transformer', 'start',
+                   'duration', 'cpu', 'stims_in', 'stims_out', 'pid',
+                   'thread']
+        df = pd.DataFrame(self.events)
+        for col in columns:
+            if col not in df.columns:
+                df[col] = None
+        return df[columns + sorted(set(df.columns) - set(columns))]
+
+    def summary(self, by='node'):
+        ''' Returns a pandas DataFrame that aggregates the recorded events.
+
+        Args:
+            by (str): Either 'node', in which case there's a row per Graph
+                node, or 'transformer', for a row per Transformer class.
+
+        The returned columns are the number of calls, the total wall and CPU
+        time (in seconds), the number of stims passed in and returned, the
+        number of cache hits and implicit conversions, the time spent
+        converting stims and waiting for API rate limits, and the throughput
+        (input stims per second of wall time).
+        '''
+        import pandas as pd
+        if by not in ('node', 'transformer'):
+            raise ValueError("Invalid value for by: '%s'; must be either "
+                             "'node' or 'transformer'." % by)
+        df = self.to_df()
+        calls = df[df['category'] == ('node' if by == 'node'
+                                      else 'transform')]
+        df = df[df[by].notnull()]
+        calls = calls[calls[by].notnull()]
+
+        def _total(category, column):
+            sub = df[df['category'] == category]
+            return sub.groupby(by)[column].sum() if column else \
+                sub.groupby(by).size()
+
+        summary = pd.DataFrame({
+            'calls': calls.groupby(by).size(),
+            'wall_time': calls.groupby(by)['duration'].sum(),
+            'cpu_time': calls.groupby(by)['cpu'].sum(),
+            'stims_in': calls.groupby(by)['stims_in'].sum(),
+            'stims_out': calls.groupby(by)['stims_out'].sum(),
+            'cache_hits': _total('cache', None),
+            'conversions': _total('conversion', None),
+            'conversion_time': _total('conversion', 'duration'),
+            'rate_limit_time': _total('rate_limit', 'duration')
+        })
+        columns = ['calls', 'wall_time', 'cpu_time', 'stims_in', 'stims_out',
+                   'cache_hits', 'conversions', 'conversion_time',
+                   'rate_limit_time']
+        summary = summary.reindex(columns=columns).fillna(0)
+        for col in ['calls', 'stims_in', 'stims_out', 'cache_hits',
+                    'conversions']:
+            summary[col] = summary[col].astype(int)
+        wall = summary['wall_time'].where(summary['wall_time'] > 0)
+        summary['throughput'] = (summary['stims_in'] / wall).fillna(0)
+        summary.index.name = by
+        return summary
+
+    def to_chrome_trace(self):
+        ''' Returns the events in the Chrome trace event format, as a dict
+        that can be serialized to JSON and loaded in chrome://tracing (or
+        https://ui.perfetto.dev). '''
+        trace = []
+        for e in self.events:
+            args = dict((k, v) for k, v in e.items()
+                        if k not in ('name', 'category', 'start', 'duration',
+                                     'pid', 'thread') and v is not None)
+            entry = {
+                'name': e['name'],
+                'cat': e['category'],
+                'ts': e['start'] * 1e6,
+                'pid': e['pid'],
+                'tid': e['thread'],
+                'args': args
+            }
+            if e['duration'] is None:
+                entry.update(ph='i', s='t')
+            else:
+                entry.update(ph='X', dur=e['duration'] * 1e6)
+            trace.append(entry)
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, filename):
+        ''' Writes the events to a Chrome trace event JSON file.
+
+        Args:
+            filename (str): Path of the file to write.
+        '''
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+
+def _active():
+    with _profilers_lock:
+        return list(_profilers)
+
+
+class span(object):
+
+    ''' Context manager that records an event spanning the enclosed block
+    with all active Profilers (and does nothing if there are none). The
+    current Graph node is attached to the event automatically; 'node' spans
+    set the current node for all events recorded inside them (in the same
+    thread). Additional arguments can be added to the dict returned by
+    __enter__ until the block exits.
+
+    Args:
+        name (str): Name of the event.
+        category (str): Category of the event (see Profiler).
+        args: Additional information to attach to the event.
+    '''
+
+    def __init__(self, name, category, **args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.profilers = None
+
+    def __enter__(self):
+        if not _profilers:
+            return self.args
+        self.profilers = _active()
+        if self.category == 'node':
+            self._outer = getattr(_context, 'node', None)
+            _context.node = self.args.get('node')
+        else:
+            self.args.setdefault('node', getattr(_context, 'node', None))
+        self._cpu = _cpu_time()
+        self._start = default_timer()
+        return self.args
+
+    def __exit__(self, *args):
+        if not self.profilers:
+            return
+        duration = default_timer() - self._start
+        cpu = _cpu_time() - self._cpu
+        if self.category == 'node':
+            _context.node = self._outer
+        for profiler in self.profilers:
+            profiler.record(self.name, self.category, self._start, duration,
+                            cpu, **self.args)
+
+
+def event(name, category, **args):
+    ''' Records an instant event with all active Profilers. '''
+    if not _profilers:
+        return
+    args.setdefault('node', getattr(_context, 'node', None))
+    now = default_timer()
+    for profiler in _active():
+        profiler.record(name, category, now, **args)
+
+
+def profiled(category, name=None):
+    ''' Decorator that records every call to the decorated function as a
+    span of the passed category. '''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _peak_rss():
+    # Peak resident set size of the process in bytes (None if unavailable).
+    # ru_maxrss is in kilobytes, except on macOS.
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class MemoryTracker(object):
+
+    ''' Records the memory used by every Transformer call made while it is
+    active. Use as a context manager:
+
+        with MemoryTracker(limit=2 * 1024 ** 3) as tracker:
+            graph.run(stims)
+        tracker.summary()
+
+    For every call to a Transformer's internal _transform method (on a
+    single stim, or on a batch of stims), the following are recorded:
+
+        - stim_bytes: the estimated size of the input stim(s), including
+          their data arrays.
+        - result_bytes: the estimated size of the output (for
+          ExtractorResults, of their data only).
+        - traced_peak: the peak number of bytes allocated (through Python's
+          allocators, which numpy uses) during the call, on top of what was
+          allocated when it started.
+        - traced_delta: the number of bytes still allocated when the call
+          returned, i.e., mostly the output and anything it keeps alive.
+        - peak_rss: the peak resident set size of the process after the call.
+        - rss_increase: how much the call raised the process' peak resident
+          set size.
+
+    Allocations are traced with tracemalloc, which slows down execution;
+    pass trace_allocations=False to only record sizes and RSS. Allocation
+    and RSS figures are process-wide, so they're only approximate when
+    several Transformers run concurrently in threads; work sent to worker
+    processes (see the 'executor' option) isn't recorded at all. Likewise,
+    trackers rely on the global hooks of pliers.transformers.hooks, so a
+    tracker records all the calls made while it is active, in any thread,
+    and nested or concurrent trackers all record the same calls.
+
+    When a limit is set, a watchdog thread samples memory use while calls
+    are running. A call found to exceed the limit is stopped with a
+    MemoryLimitError at the next Transformer call it makes or completes
+    (e.g., when a Transformer iterates over the frames of a video, at the
+    next frame), or at the latest when it returns, so that the run stops at
+    the offending Transformer.
+
+    Args:
+        limit (int): Optional maximum number of bytes a single call may
+            use (its traced_peak, or its rss_increase if allocations aren't
+            traced). Defaults to the 'memory_limit' config option.
+        trace_allocations (bool): Whether to trace allocations with
+            tracemalloc (only available in Python 3).
+        interval (float): Number of seconds between the samples taken by
+            the watchdog thread (only used if a limit is set).
+    '''
+
+    def __init__(self, limit=None, trace_allocations=True, interval=0.01):
+        from pliers import config
+        if limit is None:
+            limit = config.get_option('memory_limit')
+        self.limit = limit
+        self.trace_allocations = trace_allocations and \
+            tracemalloc is not None
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.interval = interval
+        self._open = []
+        self._started_tracing = False
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        from pliers.transformers import hooks
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        hooks.register_hook('before_transform', self._before)
+        hooks.register_hook('after_transform', self._after)
+        hooks.register_hook('on_error', self._on_error)
+        if self.limit is not None:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch)
+            self._watchdog.daemon = True
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, *args):
+        from pliers.transformers import hooks
+        hooks.unregister_hook('before_transform', self._before)
+        hooks.unregister_hook('after_transform', self._after)
+        hooks.unregister_hook('on_error', self._on_error)
+        if self._watchdog is not None:
+            self._stop.set()
+            self._watchdog.join()
+            self._watchdog = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _sample(self):
+        # Folds the peak allocation since the last sample into all open
+        # calls, and starts a new sampling period; this way nested calls
+        # don't hide the peaks of the calls that enclose them.
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            peak = current
+        for call in self._open:
+            call['peak'] = max(call['peak'], peak)
+        return current
+
+    def _used(self, call):
+        # Bytes used by an open call so far (None if unknown)
+        if self.trace_allocations:
+            return max(call['peak'] - call['start'], 0)
+        rss = _peak_rss()
+        return rss - call['rss'] if rss is not None else None
+
+    def _watch(self):
+        # Runs in the watchdog thread; flags the open calls that exceeded
+        # the limit, to be stopped by _check().
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                if not self._open:
+                    continue
+                if self.trace_allocations:
+                    self._sample()
+                for call in self._open:
+                    used = self._used(call)
+                    if used is not None and used > self.limit:
+                        call['exceeded'] = max(call['exceeded'], used)
+
+    def _check(self):
+        # Raises a MemoryLimitError if a call open in the current thread was
+        # flagged by the watchdog.
+        for call in getattr(self._local, 'stack', []):
+            if call['exceeded']:
+                from pliers.support.exceptions import MemoryLimitError
+                raise MemoryLimitError(call['transformer'], call['stim'],
+                                       call['exceeded'], self.limit)
+
+    def _before(self, transformer, stim):
+        self._check()
+        call = {'rss': _peak_rss(), 'start': None, 'peak': 0, 'exceeded': 0,
+                'transformer': transformer.__class__.__name__,
+                'stim': ', '.join(str(getattr(s, 'name', s)) for s in
+                                  (stim if isinstance(stim, list)
+                                   else [stim]))}
+        with self._lock:
+            if self.trace_allocations:
+                call['start'] = self._sample()
+            self._open.append(call)
+        self._local.__dict__.setdefault('stack', []).append(call)
+
+    def _finish(self, transformer, stim, result=None):
+        from pliers.transformers.cache import estimate_size
+        from pliers.extractors.base import ExtractorResult
+        call = self._local.stack.pop()
+        with self._lock:
+            current = self._sample() if self.trace_allocations else None
+            self._open.remove(call)
+        rss = _peak_rss()
+        record = {
+            'transformer': call['transformer'],
+            'name': transformer.name,
+            'stim': call['stim'],
+            'stim_bytes': estimate_size(stim),
+            'result_bytes': None,
+            'traced_peak': None,
+            'traced_delta': None,
+            'peak_rss': rss,
+            'rss_increase': rss - call['rss'] if rss is not None else None
+        }
+        if result is not None:
+            results = result if isinstance(result, list) else [result]
+            record['result_bytes'] = sum(
+                estimate_size(r._data) if isinstance(r, ExtractorResult)
+                else estimate_size(r) for r in results)
+        if current is not None:
+            record['traced_peak'] = max(call['peak'] - call['start'], 0)
+            record['traced_delta'] = current - call['start']
+        with self._lock:
+            self.records.append(record)
+        return record, call
+
+    def _after(self, transformer, stim, result, duration):
+        record, call = self._finish(transformer, stim, result)
+        used = record['traced_peak'] if self.trace_allocations \
+            else record['rss_increase']
+        if self.limit is not None and used is not None and used > self.limit:
+            call['exceeded'] = max(call['exceeded'], used)
+        if call['exceeded']:
+            from pliers.support.exceptions import MemoryLimitError
+            raise MemoryLimitError(record['transformer'], record['stim'],
+                                   call['exceeded'], self.limit)
+        # Calls enclosing this one may have been flagged meanwhile
+        self._check()
+
+    def _on_error(self, transformer, stim, error, duration):
+        self._finish(transformer, stim)
+
+    def to_df(self):
+        ''' Returns a pandas DataFrame with one row per Transformer call. '''
+        import pandas as pd
+        columns = ['transformer', 'name', 'stim', 'stim_bytes',
+                   'result_bytes', 'traced_peak', 'traced_delta', 'peak_rss',
+                   'rss_increase']
+        df = pd.DataFrame(self.records, columns=columns)
+        for col in columns[3:]:
+            df[col] = pd.to_numeric(df[col])
+        return df
+
+    def summary(self):
+        ''' Returns a pandas DataFrame with a row per Transformer class,
+        sorted by decreasing peak usage. The columns are the number of calls,
+        the largest input and output sizes, the largest traced_peak, the
+        total traced_delta, the total rss_increase, and the peak RSS of the
+        process after the class' last call (all in bytes). '''
+        df = self.to_df()
+        grouped = df.groupby('transformer')
+        summary = grouped.agg({'stim': 'size', 'stim_bytes': 'max',
+                               'result_bytes': 'max', 'traced_peak': 'max',
+                               'traced_delta': 'sum',
+                               'rss_increase': 'sum', 'peak_rss': 'last'})
+        summary = summary.rename(columns={
+            'stim': 'calls', 'stim_bytes': 'max_stim_bytes',
+            'result_bytes': 'max_result_bytes',
+            'traced_peak': 'max_traced_peak'})
+        sort_by = 'max_traced_peak' if self.trace_allocations \
+            else 'rss_increase'
+        return summary.sort_values(sort_by, ascending=False)
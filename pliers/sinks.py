@@ -0,0 +1,295 @@
+''' Result sinks write ExtractorResults to disk as they're produced (e.g., by
+a Graph run), so that they don't need to be held in memory until the end of
+the run. The written results can then be read back as merged DataFrames. '''
+
+from abc import ABCMeta, abstractmethod
+from collections import namedtuple, OrderedDict
+from os.path import basename, exists, join
+import os
+import re
+import threading
+
+import pandas as pd
+from six import with_metaclass
+
+from pliers.extractors.base import ResultMerger, _INDEX_COLUMNS
+from pliers.utils import (attempt_to_import, verify_dependencies, listify,
+                          flatten, fingerprint_hasher)
+
+pyarrow = attempt_to_import('pyarrow')
+tables = attempt_to_import('tables')
+
+__all__ = ['ResultSink', 'CSVSink', 'ParquetSink', 'HDFSink', 'ResultReader',
+           'WrittenResult']
+
+
+# Returned by ResultSink.write() for every result written, in place of the
+# result itself: the name of its Extractor, the input Stim it derives from,
+# the partition (directory, relative to the sink's path) it was written to,
+# and its transformation history.
+WrittenResult = namedtuple('WrittenResult',
+                           'extractor stim partition history')
+
+
+def _source(result):
+    # Identifies the input Stim a result derives from: the filename (or
+    # name) of the Stim at the root of its history
+    log = result.history
+    if log is None:
+        return result.stim.filename or result.stim.name
+    while log.parent:
+        log = log.parent
+    return log.source_file or log.source_name
+
+
+def _partition_name(key, value):
+    # Directory name for a partition, in the key=value form understood by
+    # Parquet readers. Values are made safe for use in paths, and suffixed
+    # with a hash of the original so that distinct values never clash.
+    value = str(value)
+    h = fingerprint_hasher()
+    h.update(value.encode('utf-8'))
+    safe = re.sub(r'[^\w.-]+', '_', basename(value.rstrip('/\\')))[:64]
+    return '%s=%s-%s' % (key, safe, h.hexdigest()[:8])
+
+
+class ResultSink(with_metaclass(ABCMeta)):
+
+    ''' Base class for sinks that write ExtractorResults to files as they're
+    produced, e.g., by passing a sink to Graph.run().
+
+    The records of every result are written as rows, in the wide format of
+    ExtractorResult.to_df() (with the timing, object_id and metadata
+    columns), plus an 'extractor' column holding the Extractor's name. Rows
+    are partitioned by Extractor and by input Stim (the Stim at the root of
+    the result's history): they're written to files in the directory
+    <path>/extractor=<name>/stim=<filename or name>/, where the names are
+    made safe for use in paths and suffixed with a hash. Use read() (or a
+    ResultReader) to get them back as a merged DataFrame.
+
+    Subclasses implement _write_file() and _read_file() for a file format,
+    and set the extension of the files.
+
+    Args:
+        path (str): Directory to write to. Created if it doesn't exist;
+            results already written to it are kept.
+        buffer_size (int): Number of rows held in memory before they're
+            written out (to a new file in every partition that has rows
+            waiting). Rows are also written when flush() is called.
+        to_df_kwargs: Optional keyword arguments passed on to the
+            Extractors' _to_df() methods.
+    '''
+
+    extension = None
+
+    def __init__(self, path, buffer_size=10000, **to_df_kwargs):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.to_df_kwargs = to_df_kwargs
+        self._buffers = OrderedDict()
+        self._n_buffered = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def write(self, results):
+        ''' Writes an ExtractorResult, or a list of them. Returns a list with
+        a WrittenResult for every result written, which can be kept instead
+        of the results themselves. '''
+        written = []
+        for r in flatten(listify(results)):
+            df = r.to_df(metadata=True, **self.to_df_kwargs)
+            for col in _INDEX_COLUMNS[4:]:
+                df[col] = df[col].astype(object)
+            df.insert(0, 'extractor', r.extractor.name)
+            df.columns = [str(c) for c in df.columns]
+            source = _source(r)
+            partition = join(_partition_name('extractor', r.extractor.name),
+                             _partition_name('stim', source))
+            with self._lock:
+                self._buffers.setdefault(partition, []).append(df)
+                self._n_buffered += len(df)
+                if self._n_buffered >= self.buffer_size:
+                    self._flush()
+            written.append(WrittenResult(r.extractor.name, source, partition,
+                                         r.history))
+        return written
+
+    def flush(self):
+        ''' Writes out all buffered rows. '''
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        for partition, dfs in self._buffers.items():
+            directory = join(self.path, partition)
+            if not exists(directory):
+                os.makedirs(directory)
+            df = pd.concat(dfs, axis=0, ignore_index=True)
+            # Files are written under a temporary name first, so that readers
+            # never see incomplete files
+            filename = self._next_filename(directory)
+            self._write_file(df, filename + '.tmp')
+            os.rename(filename + '.tmp', filename)
+        self._buffers = OrderedDict()
+        self._n_buffered = 0
+
+    def _next_filename(self, directory):
+        n = self._counts.get(directory)
+        if n is None:
+            n = len([f for f in os.listdir(directory)
+                     if f.startswith('part-')])
+        while exists(join(directory, 'part-%05d%s' % (n, self.extension))):
+            n += 1
+        self._counts[directory] = n + 1
+        return join(directory, 'part-%05d%s' % (n, self.extension))
+
+    def read(self):
+        ''' Returns a ResultReader for the results written so far. '''
+        return ResultReader(self.path)
+
+    @abstractmethod
+    def _write_file(self, df, filename):
+        pass
+
+    @classmethod
+    @abstractmethod
+    def _read_file(cls, filename):
+        pass
+
+
+class CSVSink(ResultSink):
+
+    ''' Writes results to CSV files. Feature values are read back as numbers
+    or strings, so values of other types don't survive the round trip. '''
+
+    extension = '.csv'
+
+    def _write_file(self, df, filename):
+        df.to_csv(filename, index=False)
+
+    @classmethod
+    def _read_file(cls, filename):
+        strings = ['extractor'] + _INDEX_COLUMNS[4:]
+        df = pd.read_csv(filename, dtype=dict((c, object) for c in strings))
+        # Empty strings are read as NaNs, but histories are never missing
+        if 'history' in df.columns:
+            df['history'] = df['history'].fillna('')
+        return df
+
+
+class ParquetSink(ResultSink):
+
+    ''' Writes results to Parquet files, using pyarrow. The directory can
+    also be read as a partitioned dataset by other Parquet tools. '''
+
+    extension = '.parquet'
+
+    def __init__(self, path, buffer_size=10000, **to_df_kwargs):
+        verify_dependencies(['pyarrow'])
+        super(ParquetSink, self).__init__(path, buffer_size, **to_df_kwargs)
+
+    def _write_file(self, df, filename):
+        df.to_parquet(filename, engine='pyarrow', index=False)
+
+    @classmethod
+    def _read_file(cls, filename):
+        verify_dependencies(['pyarrow'])
+        return pd.read_parquet(filename, engine='pyarrow')
+
+
+class HDFSink(ResultSink):
+
+    ''' Writes results to HDF5 files, using PyTables. '''
+
+    extension = '.h5'
+
+    def __init__(self, path, buffer_size=10000, **to_df_kwargs):
+        verify_dependencies(['tables'])
+        super(HDFSink, self).__init__(path, buffer_size, **to_df_kwargs)
+
+    def _write_file(self, df, filename):
+        df.to_hdf(filename, key='results', mode='w')
+
+    @classmethod
+    def _read_file(cls, filename):
+        verify_dependencies(['tables'])
+        return pd.read_hdf(filename, 'results')
+
+
+def _sink_classes(cls=ResultSink):
+    for sub in cls.__subclasses__():
+        yield sub
+        for c in _sink_classes(sub):
+            yield c
+
+
+class ResultReader(object):
+
+    ''' Reads the results written to a directory by a ResultSink. Files are
+    only read when needed, and one at a time.
+
+    Args:
+        path (str): The directory the results were written to.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def files(self, extractors=None, stims=None):
+        ''' Returns the paths of the files holding results, in order.
+
+        Args:
+            extractors (str, list): Optional names of the Extractors whose
+                results to include. By default, all are.
+            stims (str, list): Optional input Stims whose results to include,
+                given by their filename (or, for Stims without one, their
+                name). By default, all are.
+        '''
+        readers = dict((c.extension, c) for c in _sink_classes()
+                       if c.extension)
+        wanted = {}
+        for key, values in [('extractor', extractors), ('stim', stims)]:
+            if values is not None:
+                wanted[key] = set(_partition_name(key, v)
+                                  for v in listify(values))
+
+        def _subdirs(directory, key):
+            if not exists(directory):
+                return []
+            return [join(directory, d) for d in sorted(os.listdir(directory))
+                    if d.startswith(key + '=') and
+                    (key not in wanted or d in wanted[key])]
+
+        files = []
+        for directory in _subdirs(self.path, 'extractor'):
+            for partition in _subdirs(directory, 'stim'):
+                files.extend(join(partition, f)
+                             for f in sorted(os.listdir(partition))
+                             if f.startswith('part-') and
+                             os.path.splitext(f)[1] in readers)
+        return files
+
+    def read(self, extractors=None, stims=None):
+        ''' Returns a generator that yields the contents of the files
+        returned by files() (with the same arguments), one DataFrame at a
+        time. '''
+        readers = dict((c.extension, c) for c in _sink_classes()
+                       if c.extension)
+        for filename in self.files(extractors, stims):
+            yield readers[os.path.splitext(filename)[1]]._read_file(filename)
+
+    def to_df(self, extractors=None, stims=None, **merge_kwargs):
+        ''' Returns the results as a single DataFrame, as merge_results()
+        would for the original ExtractorResults.
+
+        Args:
+            extractors (str, list): Optional names of the Extractors whose
+                results to include.
+            stims (str, list): Optional input Stims whose results to include.
+            merge_kwargs: Optional keyword arguments (e.g., format or
+                extractor_names) with the same meaning as in merge_results().
+        '''
+        merger = ResultMerger(**merge_kwargs)
+        for df in self.read(extractors, stims):
+            merger._add_frame(df)
+        return merger.merge()
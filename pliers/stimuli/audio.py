@@ -1,17 +1,33 @@
 ''' Classes that represent audio clips. '''
 
-from .base import Stim
+from .base import Stim, _update_array_fingerprint
+from .readers import get_reader_pool, _file_clips
+from pliers import config
+from pliers.utils import fingerprint_hasher
+from moviepy.audio.AudioClip import AudioArrayClip
 from moviepy.audio.io.AudioFileClip import AudioFileClip
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 
+from os.path import exists, getmtime, getsize, join, realpath
+import numpy as np
 import os
 import re
 import subprocess
+import tempfile
+import threading
+import uuid
 
 
 class AudioStim(Stim):
 
     ''' Represents an audio clip.
 
+    The audio data (a mono float32 array) is decoded when it's first
+    accessed, and, depending on the audio_mmap and audio_cache_dir config
+    options, held in a temporary memory-mapped file or kept in a cache of
+    .npy files that later sessions (and worker processes) map read-only.
+
     Args:
         filename (str): Path to audio file.
         onset (float): Optional onset of the audio file (in seconds) with
@@ -23,35 +39,47 @@ class AudioStim(Stim):
             from.
         order (int): Optional sequential index of the AudioStim within some
             containing context.
+        data (ndarray): Optional mono array of samples to initialize from,
+            instead of a file or clip. Requires sampling_rate.
 
     '''
 
     _default_file_extension = '.wav'
 
+    # Number of samples (per channel) read from ffmpeg at a time
+    _chunk_size = 2 ** 20
+
     def __init__(self, filename=None, onset=None, sampling_rate=None, url=None,
-                 clip=None, order=None):
+                 clip=None, order=None, data=None):
         if url is not None:
             filename = url
         self.filename = filename
 
-        if clip:
+        # The clip is only opened, and the data decoded, when the data is
+        # first needed; until then, the file is just probed
+        if data is not None:
+            if not sampling_rate:
+                raise ValueError("A sampling_rate is required to initialize "
+                                 "an AudioStim from data.")
+            self.sampling_rate = sampling_rate
+            duration = len(data) / float(sampling_rate)
+        elif clip:
             self.sampling_rate = clip.fps
             self.clip = clip
+            duration = clip.duration
         else:
+            infos = ffmpeg_parse_infos(self.filename)
             self.sampling_rate = sampling_rate
             if not self.sampling_rate:
-                self.sampling_rate = self.get_sampling_rate(self.filename)
-            self._load_clip()
-
-        # Small default buffer isn't ideal, but moviepy has persistent issues
-        # with some files otherwise; see
-        # https://github.com/Zulko/moviepy/issues/246
-        self.data = self.clip.to_soundarray(buffersize=1000)
-        duration = self.clip.duration
-
-        if self.data.ndim > 1:
-            # Average channels to make data mono
-            self.data = self.data.mean(axis=1)
+                # As in get_sampling_rate()
+                self.sampling_rate = infos.get('audio_fps')
+                if not isinstance(self.sampling_rate, int):
+                    self.sampling_rate = 44100
+            # As computed by moviepy's reader
+            duration = infos.get('video_duration', infos['duration'])
+        # Data read from the file is identified by the file
+        self.__dict__['_file_data'] = clip is None and data is None
+        self.__dict__['_data'] = data
 
         super(AudioStim, self).__init__(
             filename, onset=onset, duration=duration, order=order, url=url)
@@ -60,7 +88,7 @@ class AudioStim(Stim):
     def get_sampling_rate(filename):
         ''' Use FFMPEG to get the sampling rate, most of this code was
         adapted from the moviepy codebase '''
-        cmd = ['ffmpeg', '-i', filename]
+        cmd = [get_setting('FFMPEG_BINARY'), '-i', filename]
 
         with open(os.devnull, 'rb') as devnull:
             creationflags = 0x08000000 if os.name == 'nt' else 0
@@ -93,16 +121,219 @@ class AudioStim(Stim):
         return 44100
 
     def _load_clip(self):
-        self.clip = AudioFileClip(self.filename, fps=self.sampling_rate)
+        # The clip doesn't affect the fingerprint, so bypass __setattr__
+        data = self.__dict__.get('_data')
+        if data is not None and not self._file_data:
+            # Data that doesn't come from the file (e.g., of chunks) is
+            # wrapped in a clip of its own; moviepy only writes mono clips
+            # correctly as two identical channels
+            data = np.asarray(data)
+            clip = AudioArrayClip(np.column_stack([data, data]),
+                                  fps=self.sampling_rate)
+        else:
+            clip = AudioFileClip(self.filename, fps=self.sampling_rate)
+            _file_clips[clip] = True
+        self.__dict__['_clip'] = clip
+
+    @property
+    def clip(self):
+        # Loaded on demand, so that unpickled copies (e.g., in worker
+        # processes) don't open the file unless the clip is actually used
+        if self.__dict__.get('_clip') is None:
+            self._load_clip()
+        return self._clip
+
+    @clip.setter
+    def clip(self, clip):
+        self._clip = clip
+
+    @property
+    def data(self):
+        data = self.__dict__.get('_data')
+        if data is None:
+            data = self._load_data()
+        return data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self.__dict__['_file_data'] = False
+
+    def _load_data(self):
+        lock = self.__dict__.get('_data_lock')
+        if lock is None:
+            lock = self.__dict__.setdefault('_data_lock', threading.Lock())
+        with lock:
+            data = self.__dict__.get('_data')
+            if data is not None:
+                return data
+            cached = self.__dict__.get('_data_file')
+            if cached is not None and exists(cached):
+                data = np.load(cached, mmap_mode='r')
+            else:
+                data = self._decode()
+            # The content is unchanged, so the fingerprint remains valid
+            self.__dict__['_data'] = data
+            return data
+
+    def _decode(self):
+        # Returns the decoded data, from the cache if possible
+        clip = self.__dict__.get('_clip')
+        if clip is None or clip in _file_clips:
+            source = self.filename if clip is None else clip.filename
+        else:
+            # Clips that don't map directly onto a file (e.g., subclips) are
+            # read through moviepy
+            return self._decode_clip(clip)
+
+        cache_dir = config.get_option('audio_cache_dir')
+        if cache_dir is None or not exists(source):
+            return self._decode_file(source)
+
+        h = fingerprint_hasher()
+        h.update(str((realpath(source), getsize(source), getmtime(source),
+                      self.sampling_rate)).encode('utf-8'))
+        filename = join(os.path.expanduser(cache_dir),
+                        'audio-%s.npy' % h.hexdigest())
+        if not exists(filename):
+            data = self._decode_file(source)
+            if not exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            # Written under a temporary name first, so that other processes
+            # never map incomplete files
+            tmp = '%s.%s.tmp' % (filename, uuid.uuid4().hex[:8])
+            with open(tmp, 'wb') as f:
+                np.save(f, data)
+            os.rename(tmp, filename)
+        self.__dict__['_data_file'] = filename
+        return np.load(filename, mmap_mode='r')
+
+    def _decode_clip(self, clip):
+        pool = get_reader_pool()
+        with pool.use(clip):
+            # Small default buffer isn't ideal, but moviepy has persistent
+            # issues with some files otherwise; see
+            # https://github.com/Zulko/moviepy/issues/246
+            data = clip.to_soundarray(buffersize=1000)
+        if data.ndim > 1:
+            # Average channels to make data mono
+            data = data.mean(axis=1)
+        return data.astype(np.float32)
+
+    def _decode_file(self, source):
+        # Reads 32-bit float samples straight from an ffmpeg pipe, in large
+        # chunks. Like moviepy, ffmpeg is asked for two channels, which are
+        # then averaged.
+        cmd = [get_setting('FFMPEG_BINARY'), '-i', source, '-vn',
+               '-loglevel', 'error', '-f', 'f32le', '-acodec', 'pcm_f32le',
+               '-ar', '%d' % self.sampling_rate, '-ac', '2', '-']
+        # The length is only known once decoding is done, so the output is
+        # allocated from the probed duration (with a second to spare), and
+        # grown if needed
+        n = int((self.duration or 0) * self.sampling_rate) + \
+            self.sampling_rate
+        data = self._allocate(n)
+        # Every sample holds two 4-byte floats
+        chunk_bytes = 8 * self._chunk_size
+        size = 0
+        with open(os.devnull, 'rb') as devnull:
+            creationflags = 0x08000000 if os.name == 'nt' else 0
+            proc = subprocess.Popen(cmd, stdin=devnull,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    creationflags=creationflags)
+        try:
+            while True:
+                raw = proc.stdout.read(chunk_bytes)
+                if not raw:
+                    break
+                samples = len(raw) // 8
+                chunk = np.frombuffer(raw, dtype='<f4', count=2 * samples)
+                if size + samples > len(data):
+                    grown = self._allocate(max(2 * len(data), size + samples))
+                    grown[:size] = data[:size]
+                    data = grown
+                np.mean(chunk.reshape(samples, 2), axis=1,
+                        out=data[size:size + samples])
+                size += samples
+            err = proc.stderr.read()
+        finally:
+            proc.stdout.close()
+            proc.stderr.close()
+            proc.wait()
+        if not size:
+            raise IOError("Error: couldn't decode audio from %s.\n%s" %
+                          (source, err.decode('utf8', 'replace')))
+        return data[:size]
+
+    @staticmethod
+    def _allocate(n):
+        # A float32 array of n samples, in a temporary memory-mapped file if
+        # the audio_mmap option is set
+        if not config.get_option('audio_mmap'):
+            return np.empty(n, dtype=np.float32)
+        f = tempfile.NamedTemporaryFile(prefix='pliers-audio-', suffix='.dat',
+                                        delete=False)
+        f.close()
+        data = np.memmap(f.name, dtype=np.float32, mode='w+', shape=(n,))
+        try:
+            # The mapping stays valid after the file is removed
+            os.remove(f.name)
+        except OSError:
+            pass
+        return data
+
+    def chunks(self, duration, overlap=0.):
+        ''' Returns a generator that walks the clip in consecutive windows,
+        as AudioStims with onsets (and orders) relative to the same timeline
+        as this one. The data of every chunk is a view into this Stim's data,
+        so no samples are copied. Results extracted from the chunks can be
+        joined with stitch_results().
+
+        Args:
+            duration (float): Duration of the chunks, in seconds. The last
+                chunk may be shorter.
+            overlap (float): Duration (in seconds) of the overlap between
+                consecutive chunks, giving frame-based extractors context
+                on both sides of every chunk boundary.
+        '''
+        sr = self.sampling_rate
+        size = int(round(duration * sr))
+        step = size - int(round(overlap * sr))
+        if size < 1 or overlap < 0 or step < 1:
+            raise ValueError("Chunks must be at least a sample long, and "
+                             "overlap must be shorter than their duration.")
+        data = self.data
+        onset = 0.0 if self.onset is None else self.onset
+        for i, start in enumerate(range(0, len(data), step)):
+            stop = min(start + size, len(data))
+            chunk = AudioStim(onset=onset + start / float(sr),
+                              sampling_rate=sr, order=i,
+                              data=data[start:stop])
+            chunk.name = self.name
+            yield chunk
+            if stop == len(data):
+                break
+
+    def _update_fingerprint(self, h):
+        h.update(str(self.sampling_rate).encode('utf-8'))
+        if self._file_data:
+            super(AudioStim, self)._update_fingerprint(h)
+        else:
+            _update_array_fingerprint(h, self.data)
 
     def __getstate__(self):
         d = self.__dict__.copy()
-        d['clip'] = None
+        d['_clip'] = None
+        d.pop('_data_lock', None)
+        # Data kept in the cache is mapped again when needed, rather than
+        # copied
+        if d.get('_data_file') is not None:
+            d['_data'] = None
         return d
 
     def __setstate__(self, d):
         self.__dict__ = d
-        self._load_clip()
 
     def save(self, path):
         ''' Save clip data to file.
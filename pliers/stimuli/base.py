@@ -2,7 +2,8 @@
 
 
 from abc import ABCMeta, abstractmethod
-from os.path import isdir, join, basename, realpath, isfile
+from os.path import (isdir, join, basename, realpath, isfile, exists,
+                     getsize, getmtime)
 from glob import glob
 from six import with_metaclass, string_types
 from six.moves.urllib.request import urlopen
@@ -10,7 +11,8 @@ from six.moves.urllib.parse import urlparse
 from collections import namedtuple
 from contextlib import contextmanager
 from pliers import config
-from pliers.utils import isiterable
+from pliers.utils import isiterable, fingerprint_hasher
+import numpy as np
 import pandas as pd
 import os
 import tempfile
@@ -70,9 +72,49 @@ class Stim(with_metaclass(ABCMeta)):
     def history(self, history):
         self._history = history
 
+    def fingerprint(self):
+        ''' Returns a deterministic hex digest identifying the content,
+        timing, and history of the Stim. Unlike hash(), the fingerprint is
+        stable across processes and sessions. It is computed once and cached;
+        assigning to any attribute of the Stim invalidates it, but in-place
+        modification of mutable attributes (e.g., writing into the data array)
+        does not, in which case invalidate_fingerprint() must be called. '''
+        fp = self.__dict__.get('_fingerprint')
+        if fp is None:
+            h = fingerprint_hasher()
+            h.update(str((self.__class__.__name__, self.filename, self.name,
+                          self.onset, self.duration, self.order,
+                          self.history)).encode('utf-8'))
+            self._update_fingerprint(h)
+            fp = h.hexdigest()
+            self.__dict__['_fingerprint'] = fp
+        return fp
+
+    def invalidate_fingerprint(self):
+        ''' Discards the cached fingerprint, forcing recomputation. '''
+        self.__dict__.pop('_fingerprint', None)
+
+    def _update_fingerprint(self, h):
+        # Feeds the content of the Stim into hash object h. By default the
+        # content is identified by the source file's size and modification
+        # time; subclasses holding data in memory override this.
+        if self.filename is not None and exists(self.filename):
+            h.update(str((getsize(self.filename),
+                          getmtime(self.filename))).encode('utf-8'))
+
+    def __setattr__(self, name, value):
+        self.__dict__.pop('_fingerprint', None)
+        super(Stim, self).__setattr__(name, value)
+
     def __hash__(self):
-        return hash((self.filename, self.name, self.onset, self.duration,
-                     self.order, self.history))
+        return hash(self.fingerprint())
+
+
+def _update_array_fingerprint(h, data):
+    # Hashes the raw buffer of an array; no copy is made unless the array is
+    # not C-contiguous.
+    h.update(str((data.dtype.str, data.shape)).encode('utf-8'))
+    h.update(np.ascontiguousarray(data))
 
 
 def _get_stim_class(name):
@@ -2,7 +2,7 @@
 '''
 
 from six import string_types
-from pliers.utils import listify
+from pliers.utils import listify, fingerprint_hasher
 from .base import _get_stim_class
 from .audio import AudioStim
 from .text import ComplexTextStim
@@ -54,6 +54,16 @@ class CompoundStim(object):
         for e in self.elements:
             yield e
 
+    def fingerprint(self):
+        ''' Returns a deterministic hex digest combining the fingerprints of
+        all elements (see Stim.fingerprint()). Not cached, as elements are
+        free to change. '''
+        h = fingerprint_hasher()
+        h.update(str((self.__class__.__name__, self.history)).encode('utf-8'))
+        for e in self.elements:
+            h.update(e.fingerprint().encode('utf-8'))
+        return h.hexdigest()
+
     def get_stim(self, type_, return_all=False):
         ''' Returns component elements of the specified type.
 
@@ -1,6 +1,6 @@
 ''' Classes that represent images. '''
 
-from .base import Stim
+from .base import Stim, _update_array_fingerprint
 from scipy.misc import imread
 from PIL import Image
 from six.moves.urllib.request import urlopen
@@ -43,6 +43,6 @@ class ImageStim(Stim):
     def save(self, path):
         imsave(path, self.data)
 
-    def __hash__(self):
-        return hash((self.data.tobytes(), self.onset, self.duration,
-                     self.order, self.history))
+    def _update_fingerprint(self, h):
+        if self.data is not None:
+            _update_array_fingerprint(h, self.data)
@@ -0,0 +1,153 @@
+''' A process-wide pool of the file readers (moviepy clips, each backed by an
+ffmpeg subprocess) opened by video and audio Stims. Stims open their clips
+lazily, when data is first needed; the pool bounds the number of clips whose
+subprocesses are open at once, closing the least recently used ones as new
+ones are opened. Closed clips reopen transparently when they're next read
+from. '''
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import weakref
+
+import numpy as np
+
+from pliers import config
+
+__all__ = ['ReaderPool', 'get_reader_pool']
+
+
+# Clips opened by pliers from a file, whose contents can be read directly from
+# the file (unlike, e.g., subclips, which shift time)
+_file_clips = weakref.WeakKeyDictionary()
+
+
+def _close_clip(clip):
+    # Terminates the ffmpeg subprocesses of a moviepy clip (and of its
+    # soundtrack), leaving the clip in a state in which its readers restart
+    # on the next read. Unlike clip.close(), this doesn't break subclips and
+    # other copies, which share the readers.
+    reader = getattr(clip, 'reader', None)
+    if reader is None:
+        return
+    if hasattr(reader, 'close_proc'):
+        # Audio readers only restart when seeking backwards, so the buffer is
+        # emptied and the position moved past any frame
+        reader.close_proc()
+        reader.buffer = np.zeros((0, reader.nchannels))
+        reader.buffer_startframe = -reader.buffersize
+        reader.pos = np.inf
+    else:
+        # Video readers restart whenever they have no subprocess
+        reader.close()
+    audio = getattr(clip, 'audio', None)
+    if audio is not None:
+        _close_clip(audio)
+
+
+def _clip_lock(clip):
+    # Serializes reads from a clip. The lock is kept on the clip itself, so
+    # that copies of the clip (e.g., subclips), which share its readers, also
+    # share the lock.
+    lock = clip.__dict__.get('_pliers_lock')
+    if lock is None:
+        lock = clip.__dict__.setdefault('_pliers_lock', threading.RLock())
+    return lock
+
+
+class ReaderPool(object):
+
+    ''' Tracks the clips in use by Stims, and closes the least recently used
+    ones when more than max_open are open.
+
+    Every read from a clip should happen within use(), which also serializes
+    reads from the same clip (moviepy's readers can't be shared by several
+    threads at once), and ensures a clip is never closed while it's read from.
+
+    Args:
+        max_open (int): Maximum number of clips open at once. If None, the
+            max_open_readers config option is used.
+    '''
+
+    def __init__(self, max_open=None):
+        self._max_open = max_open
+        # id(clip) -> weak reference to the clip, in order of use
+        self._clips = OrderedDict()
+        # Reentrant, as weak reference callbacks can run while it's held
+        self._lock = threading.RLock()
+
+    @property
+    def max_open(self):
+        if self._max_open is not None:
+            return self._max_open
+        return config.get_option('max_open_readers')
+
+    @max_open.setter
+    def max_open(self, max_open):
+        self._max_open = max_open
+
+    def __len__(self):
+        return len(self._clips)
+
+    def __contains__(self, clip):
+        return id(clip) in self._clips
+
+    @contextmanager
+    def use(self, clip):
+        ''' Context manager within which a clip can be read from. Marks the
+        clip as the most recently used one, closing others if needed. '''
+        key = id(clip)
+        evicted = []
+        with self._lock:
+            ref = self._clips.pop(key, None)
+            if ref is None or ref() is not clip:
+                ref = weakref.ref(clip, self._forget(key))
+            self._clips[key] = ref
+            max_open = self.max_open
+            while max_open and len(self._clips) > max_open:
+                evicted.append(self._clips.popitem(last=False)[1]())
+        # Evicted clips are closed outside the pool's lock, once nothing is
+        # reading from them
+        for evicted_clip in evicted:
+            if evicted_clip is not None:
+                with _clip_lock(evicted_clip):
+                    _close_clip(evicted_clip)
+        with _clip_lock(clip):
+            yield clip
+
+    def close(self, clip):
+        ''' Closes a clip (until it's next used), and stops tracking it. '''
+        with self._lock:
+            self._clips.pop(id(clip), None)
+        with _clip_lock(clip):
+            _close_clip(clip)
+
+    def close_all(self):
+        ''' Closes all the clips in the pool. '''
+        with self._lock:
+            clips = [ref() for ref in self._clips.values()]
+            self._clips.clear()
+        for clip in clips:
+            if clip is not None:
+                with _clip_lock(clip):
+                    _close_clip(clip)
+
+    def _forget(self, key):
+        # Weak reference callback: drops the entry of a collected clip
+        pool = weakref.ref(self)
+
+        def _callback(ref):
+            self_ = pool()
+            if self_ is not None:
+                with self_._lock:
+                    if self_._clips.get(key) is ref:
+                        del self_._clips[key]
+        return _callback
+
+
+_pool = ReaderPool()
+
+
+def get_reader_pool():
+    ''' Returns the process-wide ReaderPool used by all Stims. '''
+    return _pool
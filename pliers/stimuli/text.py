@@ -49,6 +49,12 @@ class TextStim(Stim):
         with open(path, 'w') as f:
             f.write(self.text)
 
+    def _update_fingerprint(self, h):
+        text = self.text
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        h.update(text)
+
 
 class ComplexTextStim(Stim):
 
@@ -246,6 +252,6 @@ class ComplexTextStim(Stim):
     def data(self):
         return ' '.join([e.text for e in self._elements])
 
-    def __hash__(self):
-        return hash(
-            (self.data, self.onset, self.duration, self.order, self.history))
+    def _update_fingerprint(self, h):
+        for elem in self._elements:
+            h.update(elem.fingerprint().encode('utf-8'))
@@ -1,11 +1,289 @@
 ''' Classes that represent video clips. '''
 
 from __future__ import division
+from collections import deque
 from math import ceil
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import (FFMPEG_VideoReader,
+                                            ffmpeg_parse_infos)
 from moviepy.video.io.VideoFileClip import VideoFileClip
+from six import reraise
+from six.moves.queue import Queue, Full
+import copy
+import os
+import subprocess
+import sys
+import threading
+from pliers import config
 from .base import Stim
 from .audio import AudioStim
 from .image import ImageStim
+from .readers import get_reader_pool, _file_clips
+
+
+class _ReaderHandle(object):
+
+    # Lets the reader pool track, and close, a reader that isn't a clip's
+    # own (e.g., the one a FrameReader decodes with)
+
+    def __init__(self, reader):
+        self.reader = reader
+
+
+class FrameReader(object):
+
+    ''' Reads a set of frames from a video in a single forward pass.
+
+    The frame numbers are turned into a decode plan: the distinct frames, in
+    increasing order. For clips read from a file, the plan is decoded by a
+    reader of its own (tracked, like the clips themselves, by the reader
+    pool), so that random access through the clip is unaffected. Frames that
+    aren't needed are read off the decoder's pipe into a scratch buffer and
+    discarded, without being turned into arrays, and long gaps are skipped by
+    seeking. Frames are decoded ahead, on a background thread, into a bounded
+    buffer, so that decoding overlaps with whatever is done with the frames.
+
+    Iterating yields (frame number, data) tuples, in the order of the
+    frame numbers given.
+
+    Args:
+        video (VideoFrameCollectionStim): The video to read frames from.
+        frame_nums (list): Numbers of the frames to read. Frames can be
+            repeated, and needn't be in order. Up to buffer_size frames
+            decoded before they're needed are held in memory until used
+            (those needed soonest); others are dropped, and decoded again in
+            a later pass.
+        buffer_size (int): Maximum number of frames decoded ahead, and of
+            frames held for later use. If 0, frames are decoded in the
+            calling thread as they're needed. Defaults to the
+            video_prefetch_frames config option.
+    '''
+
+    # Gaps (in frames) over which the reader seeks instead of reading through
+    # (the same threshold as moviepy's reader)
+    max_skip = 100
+
+    def __init__(self, video, frame_nums, buffer_size=None):
+        self.video = video
+        self.frame_nums = list(frame_nums)
+        if buffer_size is None:
+            buffer_size = config.get_option('video_prefetch_frames')
+        self.buffer_size = buffer_size
+        self.plan = sorted(set(self.frame_nums))
+
+    def _decode(self, plan):
+        # Yields (frame number, data) for every frame in the plan
+        clip = self.video.clip
+        if clip not in _file_clips:
+            for num in plan:
+                yield num, self.video.read_frame(num / self.video.fps)
+            return
+
+        # A copy of the clip's reader, with a pipe of its own. Like the
+        # original, it falls back to the last frame read when reading past
+        # the end of the video.
+        pool = get_reader_pool()
+        with pool.use(clip):
+            reader = copy.copy(clip.reader)
+            last = getattr(clip.reader, 'lastread', None)
+        reader.proc = None
+        handle = _ReaderHandle(reader)
+        w, h = reader.size
+        scratch = bytearray(reader.depth * w * h)
+        pos = None
+        try:
+            for num in plan:
+                with pool.use(handle):
+                    # The pool may have closed the reader since the last
+                    # frame, in which case it's reopened where needed
+                    if reader.proc is None or num - pos > self.max_skip:
+                        reader.initialize(num / reader.fps)
+                        if last is not None:
+                            reader.lastread = last
+                        pos = num
+                    while pos < num:
+                        reader.proc.stdout.readinto(scratch)
+                        pos += 1
+                    last = reader.read_frame()
+                    pos += 1
+                yield num, last
+        finally:
+            pool.close(handle)
+
+    def _frames(self, plan):
+        frames = self._decode(plan)
+        if self.buffer_size:
+            frames = self._prefetch(frames)
+        return frames
+
+    def _prefetch(self, frames):
+        # Decodes frames on a background thread, into a bounded queue
+        end = object()
+        stop = threading.Event()
+        queue = Queue(self.buffer_size)
+
+        def _put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    pass
+
+        def _run():
+            try:
+                for frame in frames:
+                    _put(('frame', frame))
+                    if stop.is_set():
+                        break
+                _put(('done', end))
+            except Exception:
+                _put(('error', sys.exc_info()))
+            finally:
+                frames.close()
+
+        thread = threading.Thread(target=_run)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                kind, value = queue.get()
+                if kind == 'error':
+                    reraise(*value)
+                elif kind == 'done':
+                    return
+                yield value
+        finally:
+            stop.set()
+
+    def __iter__(self):
+        # Positions (in frame_nums) at which every frame is still needed
+        uses = {}
+        for i, num in enumerate(self.frame_nums):
+            uses.setdefault(num, deque()).append(i)
+
+        def _next_use(num):
+            return uses[num][0] if uses[num] else len(self.frame_nums)
+
+        pending = {}
+        frames, last = None, None
+        try:
+            for i, num in enumerate(self.frame_nums):
+                while num not in pending:
+                    if frames is None or num <= last:
+                        # The frame was dropped, or the pass is over: start
+                        # a new pass over the frames still needed
+                        if frames is not None:
+                            frames.close()
+                        frames = self._frames(sorted(
+                            set(self.frame_nums[i:]) - set(pending)))
+                    last, data = next(frames)
+                    pending[last] = data
+                    if len(pending) > max(self.buffer_size, 1):
+                        # Drops the frame needed last (other than this one)
+                        drop = max((n for n in pending if n != num),
+                                   key=_next_use)
+                        del pending[drop]
+                uses[num].popleft()
+                data = pending[num] if uses[num] else pending.pop(num)
+                yield num, data
+        finally:
+            if frames is not None:
+                frames.close()
+
+
+def _probe_video(filename, size=None, pix_fmt=None, fps=None):
+    # Returns the frame rate, frame size and duration the clip will have
+    # once it's opened (with the given decoding options), without keeping
+    # the file open
+    if pix_fmt is not None and pix_fmt not in _DecodingReader._depths:
+        raise ValueError("Invalid pix_fmt: '%s'. Must be one of %s." %
+                         (pix_fmt, sorted(_DecodingReader._depths)))
+    infos = ffmpeg_parse_infos(filename)
+    frame_size = infos['video_size']
+    if size is not None:
+        # As computed by moviepy's reader
+        if None in size:
+            ratio = 1
+            for target, current in zip(size, frame_size):
+                if target:
+                    ratio = target / current
+            frame_size = [int(frame_size[0] * ratio),
+                          int(frame_size[1] * ratio)]
+        else:
+            frame_size = list(size)
+    return fps or infos['video_fps'], frame_size, infos['video_duration']
+
+
+class _DecodingReader(FFMPEG_VideoReader):
+
+    ''' moviepy's ffmpeg reader, with frames resized, resampled to another
+    frame rate, and/or converted to grayscale by ffmpeg while decoding.
+    Grayscale frames are returned as 2-d arrays.
+
+    Args:
+        filename (str): Path to the video file.
+        size (tuple): Width and height of the frames. Either can be None, to
+            preserve the aspect ratio.
+        pix_fmt (str): Pixel format of the frames: 'rgb24', 'rgba' or
+            'gray'.
+        fps (float): Frame rate to resample the video to.
+    '''
+
+    _depths = {'rgb24': 3, 'rgba': 4, 'gray': 1}
+
+    def __init__(self, filename, size=None, pix_fmt=None, fps=None):
+        if pix_fmt is not None and pix_fmt not in self._depths:
+            raise ValueError("Invalid pix_fmt: '%s'. Must be one of %s." %
+                             (pix_fmt, sorted(self._depths)))
+        self.target_fps = fps
+        # moviepy expects (height, width)
+        resolution = None if size is None else (size[1], size[0])
+        super(_DecodingReader, self).__init__(
+            filename, pix_fmt=pix_fmt or 'rgb24',
+            target_resolution=resolution)
+
+    def initialize(self, starttime=0):
+        self.close()
+        # Called by the parent's __init__ before the first frame is read
+        self.depth = self._depths[self.pix_fmt]
+        if self.target_fps:
+            self.fps = self.target_fps
+            self.nframes = int(self.duration * self.fps)
+
+        if starttime != 0:
+            offset = min(1, starttime)
+            i_arg = ['-ss', '%.06f' % (starttime - offset),
+                     '-i', self.filename,
+                     '-ss', '%.06f' % offset]
+        else:
+            i_arg = ['-i', self.filename]
+
+        # Frames are dropped before they're scaled and converted
+        filters = ['scale=%d:%d' % tuple(self.size)]
+        if self.target_fps:
+            filters.insert(0, 'fps=%s' % self.target_fps)
+        cmd = ([get_setting('FFMPEG_BINARY')] + i_arg +
+               ['-loglevel', 'error',
+                '-f', 'image2pipe',
+                '-vf', ','.join(filters),
+                '-sws_flags', self.resize_algo,
+                '-pix_fmt', self.pix_fmt,
+                '-vcodec', 'rawvideo', '-'])
+        with open(os.devnull, 'rb') as devnull:
+            creationflags = 0x08000000 if os.name == 'nt' else 0
+            self.proc = subprocess.Popen(cmd, bufsize=self.bufsize,
+                                         stdin=devnull,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE,
+                                         creationflags=creationflags)
+
+    def read_frame(self):
+        frame = super(_DecodingReader, self).read_frame()
+        if frame.ndim == 3 and self.depth == 1:
+            frame = frame[:, :, 0]
+            self.lastread = frame
+        return frame
 
 
 class VideoFrameStim(ImageStim):
@@ -27,7 +305,7 @@ class VideoFrameStim(ImageStim):
         duration = spf if duration is None else duration
         onset = frame_num * spf
         if data is None:
-            data = self.video.clip.get_frame(onset)
+            data = self.video.read_frame(onset)
         if video.onset:
             onset += video.onset
         super(VideoFrameStim, self).__init__(onset=onset,
@@ -35,6 +313,11 @@ class VideoFrameStim(ImageStim):
                                              data=data)
         self.name += 'frame[%s]' % frame_num
 
+    def _update_fingerprint(self, h):
+        h.update(str((self.video.fingerprint(), self.frame_num))
+                 .encode('utf-8'))
+        super(VideoFrameStim, self)._update_fingerprint(h)
+
 
 class VideoFrameCollectionStim(Stim):
 
@@ -51,27 +334,44 @@ class VideoFrameCollectionStim(Stim):
         url (str): Optional url source for a video.
         clip (VidoFileClip): Optional moviepy VideoFileClip to initialize
             from.
+        size (tuple): Optional width and height (in pixels) to resize frames
+            to while decoding. Either can be None, to preserve the aspect
+            ratio.
+        pix_fmt (str): Optional pixel format to decode frames to: 'rgb24'
+            (the default), 'rgba', or 'gray' (in which case frames are 2-d
+            arrays).
+        fps (float): Optional frame rate to resample the video to while
+            decoding. Frame indices refer to frames at this rate.
     '''
 
     _default_file_extension = '.mp4'
 
     def __init__(self, filename=None, frame_index=None, onset=None, url=None,
-                 clip=None):
+                 clip=None, size=None, pix_fmt=None, fps=None):
         if url is not None:
             filename = url
         self.filename = filename
+        # Applied by ffmpeg when the clip is loaded; when a clip is passed,
+        # they describe how it was decoded
+        self.decode_options = dict((k, v) for k, v in
+                                   [('size', size), ('pix_fmt', pix_fmt),
+                                    ('fps', fps)] if v is not None)
+        # The clip (and its ffmpeg subprocess) is only opened when frames
+        # are first read; until then, the file is just probed
         if clip:
             self.clip = clip
+            fps, (width, height), duration = clip.fps, clip.size, \
+                clip.duration
         else:
-            self._load_clip()
-        self.fps = self.clip.fps
-        self.width = self.clip.w
-        self.height = self.clip.h
+            fps, (width, height), duration = _probe_video(
+                filename, **self.decode_options)
+        self.fps = fps
+        self.width = width
+        self.height = height
         if frame_index:
             self.frame_index = frame_index
         else:
-            self.frame_index = range(int(ceil(self.fps * self.clip.duration)))
-        duration = self.clip.duration
+            self.frame_index = range(int(ceil(self.fps * duration)))
         self.n_frames = len(self.frame_index)
         super(VideoFrameCollectionStim, self).__init__(filename,
                                                        onset=onset,
@@ -80,12 +380,54 @@ class VideoFrameCollectionStim(Stim):
 
     def _load_clip(self):
         audio_fps = AudioStim.get_sampling_rate(self.filename)
-        self.clip = VideoFileClip(self.filename, audio_fps=audio_fps)
+        clip = VideoFileClip(self.filename, audio_fps=audio_fps)
+        if self.decode_options:
+            clip.reader.close()
+            clip.reader = _DecodingReader(self.filename,
+                                          **self.decode_options)
+            clip.fps = clip.reader.fps
+            clip.size = clip.reader.size
+        _file_clips[clip] = True
+        if clip.audio is not None:
+            _file_clips[clip.audio] = True
+        self.__dict__['_clip'] = clip
+
+    @property
+    def clip(self):
+        # Loaded on demand; see AudioStim.clip
+        if self.__dict__.get('_clip') is None:
+            self._load_clip()
+        return self._clip
+
+    @clip.setter
+    def clip(self, clip):
+        self._clip = clip
+
+    def read_frame(self, t):
+        ''' Returns the frame displayed at time t (in seconds) as an array.
+        Reads go through the process-wide ReaderPool, which serializes them
+        (the underlying reader can't be shared by several threads at once)
+        and bounds the number of open clips. '''
+        with get_reader_pool().use(self.clip) as clip:
+            return clip.get_frame(t)
+
+    def _update_fingerprint(self, h):
+        super(VideoFrameCollectionStim, self)._update_fingerprint(h)
+        h.update(str(list(self.frame_index)).encode('utf-8'))
+        if self.decode_options:
+            h.update(str(sorted(self.decode_options.items()))
+                     .encode('utf-8'))
 
     def __iter__(self):
-        """ Frame iteration. """
-        for i, f in enumerate(self.frame_index):
-            yield self.get_frame(i)
+        """ Frame iteration. Frames are read in a single forward pass over
+        the video, and decoded ahead of use; see FrameReader. """
+        frames = iter(FrameReader(self, self.frame_index))
+        try:
+            for i, (frame_num, data) in enumerate(frames):
+                yield VideoFrameStim(self, frame_num, data=data,
+                                     duration=self._frame_duration(i))
+        finally:
+            frames.close()
 
     @property
     def frames(self):
@@ -100,27 +442,27 @@ class VideoFrameCollectionStim(Stim):
 
         frame_num = self.frame_index[index]
         onset = float(frame_num) / self.fps
+        return VideoFrameStim(self, frame_num,
+                              data=self.read_frame(onset),
+                              duration=self._frame_duration(index))
 
+    def _frame_duration(self, index):
+        # Frames last until the onset of the next retained frame
+        onset = float(self.frame_index[index]) / self.fps
         if index < self.n_frames - 1:
             next_frame_num = self.frame_index[index + 1]
             end = float(next_frame_num) / self.fps
         else:
             end = float(self.duration)
-
-        duration = end - onset if end > onset else 0.0
-
-        return VideoFrameStim(self, frame_num,
-                              data=self.clip.get_frame(onset),
-                              duration=duration)
+        return end - onset if end > onset else 0.0
 
     def __getstate__(self):
         d = self.__dict__.copy()
-        d['clip'] = None
+        d['_clip'] = None
         return d
 
     def __setstate__(self, d):
         self.__dict__ = d
-        self._load_clip()
 
     def save(self, path):
         ''' Save source video to file.
@@ -147,13 +489,25 @@ class VideoStim(VideoFrameCollectionStim):
         url (str): Optional url source for a video.
         clip (VidoFileClip): Optional moviepy VideoFileClip to initialize
             from.
+        size (tuple): Optional width and height (in pixels) to resize frames
+            to while decoding. Either can be None, to preserve the aspect
+            ratio.
+        pix_fmt (str): Optional pixel format to decode frames to: 'rgb24'
+            (the default), 'rgba', or 'gray' (in which case frames are 2-d
+            arrays).
+        fps (float): Optional frame rate to resample the video to while
+            decoding.
     '''
 
-    def __init__(self, filename=None, onset=None, url=None, clip=None):
+    def __init__(self, filename=None, onset=None, url=None, clip=None,
+                 size=None, pix_fmt=None, fps=None):
         super(VideoStim, self).__init__(filename=filename,
                                         onset=onset,
                                         url=url,
-                                        clip=clip)
+                                        clip=clip,
+                                        size=size,
+                                        pix_fmt=pix_fmt,
+                                        fps=fps)
 
     def get_frame(self, index=None, onset=None):
         ''' Overrides the default behavior by giving access to the onset
@@ -1,5 +1,3 @@
-import nltk
-
 CORPORA = [
     'punkt',
     'maxent_treebank_pos_tagger',
@@ -10,6 +8,7 @@ CORPORA = [
 
 def download_nltk_data():
     ''' Download nltk corpora required for one or more feature extractors. '''
+    import nltk
     for c in CORPORA:
         nltk.download(c)
 
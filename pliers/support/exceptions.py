@@ -39,3 +39,14 @@ class MissingDependencyError(PliersError):
                  *args, **kwargs):
         msg = message % ', '.join(dependencies)
         super(MissingDependencyError, self).__init__(msg, *args, **kwargs)
+
+
+class MemoryLimitError(PliersError):
+
+    ''' Exception thrown when a Transformer call uses more memory than the
+    limit set on a MemoryTracker. '''
+
+    def __init__(self, transformer, stim, used, limit, *args, **kwargs):
+        msg = ("%s used %d bytes while transforming %s, exceeding the limit "
+               "of %d bytes." % (transformer, used, stim, limit))
+        super(MemoryLimitError, self).__init__(msg, *args, **kwargs)
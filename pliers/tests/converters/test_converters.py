@@ -4,10 +4,11 @@ from pliers.converters import (get_converter,
                                VideoToAudioConverter,
                                VideoToTextConverter,
                                WitTranscriptionConverter,
-                               ComplexTextIterator)
+                               ComplexTextIterator,
+                               AudioChunkIterator)
 from pliers.converters.image import ImageToTextConverter
 from pliers.stimuli import (VideoStim, TextStim,
-                            ComplexTextStim, ImageStim)
+                            ComplexTextStim, ImageStim, AudioStim)
 import pytest
 
 
@@ -51,3 +52,66 @@ def test_stim_iteration_converter():
     assert words[1].text == 'Sherlock'
     assert str(
         words[1].history) == 'ComplexTextStim->ComplexTextIterator/TextStim'
+
+
+def test_audio_chunk_iterator():
+    stim = AudioStim(join(get_test_data_path(), 'audio', 'barber.wav'))
+    chunks = AudioChunkIterator(duration=20., overlap=5.).transform(stim)
+    assert len(chunks) == 4
+    assert isinstance(chunks[1], AudioStim)
+    assert chunks[1].onset == 15.
+    assert len(chunks[1].data) == 20 * 11025
+    assert str(
+        chunks[1].history) == 'AudioStim->AudioChunkIterator/AudioStim'
+
+
+def test_converter_path_planning(monkeypatch):
+    from pliers import config
+    from pliers.converters import (VideoFrameCollectionIterator,
+                                   TesseractConverter, IBMSpeechAPIConverter,
+                                   GoogleVisionAPITextConverter,
+                                   MicrosoftAPITextConverter)
+    from pliers.converters.base import (get_converter_path,
+                                        _get_converter_classes)
+    from pliers.converters.multistep import ChainedConverter
+    from pliers.stimuli import AudioStim, VideoFrameCollectionStim
+
+    # Only local OCR is available
+    speech = [cls for cls in _get_converter_classes()
+              if cls._input_type is AudioStim and cls._output_type is TextStim]
+    for cls in speech + [GoogleVisionAPITextConverter,
+                         MicrosoftAPITextConverter]:
+        monkeypatch.setattr(cls, 'available', False)
+
+    assert get_converter_path(VideoStim, AudioStim) == \
+        (VideoToAudioConverter,)
+    # Superclass converters are used when nothing matches exactly
+    assert len(get_converter_path(VideoFrameCollectionStim, ImageStim)) == 1
+    assert get_converter_path(TextStim, ImageStim) is None
+
+    # Videos are converted to text through speech, as VideoToTextConverter
+    # does, and never through OCR of the frames
+    assert get_converter_path(VideoStim, TextStim) is None
+    assert get_converter(VideoStim, TextStim) is None
+    assert get_converter_path(VideoFrameCollectionStim, TextStim) == \
+        (VideoFrameCollectionIterator, TesseractConverter)
+
+    # Multi-step conversions are planned automatically
+    monkeypatch.setattr(IBMSpeechAPIConverter, 'available', True)
+    assert get_converter_path(VideoStim, TextStim) == \
+        (VideoToAudioConverter, IBMSpeechAPIConverter)
+    assert get_converter_path(VideoStim, TextStim, max_steps=1) is None
+    conv = get_converter(VideoFrameCollectionStim, TextStim)
+    assert isinstance(conv, ChainedConverter)
+    assert conv._input_type is VideoFrameCollectionStim
+    assert conv._output_type is TextStim
+    assert conv.fingerprint() == \
+        get_converter(VideoFrameCollectionStim, TextStim).fingerprint()
+
+    # Local converters beat API converters unless configured otherwise
+    monkeypatch.setattr(GoogleVisionAPITextConverter, 'available', True)
+    assert get_converter_path(ImageStim, TextStim) == \
+        (GoogleVisionAPITextConverter,)
+    config.set_option('default_converters', {})
+    assert get_converter_path(ImageStim, TextStim) == (TesseractConverter,)
+    config.reset_options(False)
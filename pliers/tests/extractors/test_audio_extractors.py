@@ -16,10 +16,12 @@ from pliers.extractors import (LibrosaFeatureExtractor,
                                MelspectrogramExtractor,
                                MFCCExtractor,
                                TonnetzExtractor,
-                               TempogramExtractor)
+                               TempogramExtractor,
+                               stitch_results)
 from pliers.stimuli import (ComplexTextStim, AudioStim,
                             TranscribedAudioCompoundStim)
 import numpy as np
+import pytest
 
 AUDIO_DIR = join(get_test_data_path(), 'audio')
 
@@ -42,6 +44,27 @@ def test_stft_extractor():
     assert '0_1102' in df.columns
 
 
+def test_stitch_chunk_results():
+    stim = AudioStim(join(AUDIO_DIR, 'barber.wav'), onset=4.2)
+    ext = STFTAudioExtractor(frame_size=0.2, hop_size=0.2)
+    full = ext.transform(stim).to_df()
+    # Chunk boundaries fall on frame boundaries, so the frames of the chunks
+    # match those of the full clip
+    results = ext.transform(list(stim.chunks(4., overlap=0.4)))
+    result = stitch_results(results, stim=stim)
+    assert result.stim is stim
+    df = result.to_df()
+    assert np.allclose(np.diff(df['onset']), 0.2)
+    assert df['order'].tolist() == list(range(len(df)))
+    n = min(len(df), len(full))
+    assert len(full) - n <= 1
+    assert np.allclose(df['onset'][:n], full['onset'][:n])
+    assert np.allclose(df['0_220'][:n], full['0_220'][:n])
+
+    with pytest.raises(ValueError):
+        stitch_results([])
+
+
 def test_mean_amplitude_extractor():
     audio = AudioStim(join(AUDIO_DIR, 'barber_edited.wav'))
     text_file = join(get_test_data_path(), 'text', 'wonderful_edited.srt')
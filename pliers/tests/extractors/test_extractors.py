@@ -5,9 +5,10 @@ from pliers.extractors import (LengthExtractor,
                                SharpnessExtractor,
                                VibranceExtractor)
 from pliers.stimuli import (ComplexTextStim, ImageStim, VideoStim,
-                            AudioStim)
+                            AudioStim, TextStim)
 from pliers.support.download import download_nltk_data
-from pliers.extractors.base import ExtractorResult, merge_results
+from pliers.extractors.base import (ExtractorResult, ResultMerger,
+                                   merge_results)
 import numpy as np
 import pytest
 
@@ -132,3 +133,75 @@ def test_merge_extractor_results():
     assert df.shape == (1800, 11)
     row = df.iloc[523, :]
     assert row['feature'] == 'Extractor1#feature_2'
+
+
+def test_result_merger():
+    image_dir = join(get_test_data_path(), 'image')
+    stim1 = ImageStim(join(image_dir, 'apple.jpg'))
+    stim2 = ImageStim(join(image_dir, 'obama.jpg'))
+    ext1 = DummyExtractor(name='merger1')
+    ext2 = DummyExtractor(name='merger2')
+    results = [ext.transform(stim) for stim in [stim1, stim2]
+               for ext in [ext1, ext2]]
+
+    merger = ResultMerger()
+    for r in results:
+        merger.add(r)
+    assert len(merger) == 4
+    df = merger.merge()
+    assert df.equals(merge_results(results))
+    # Records of both Extractors are aligned on the same rows
+    assert df.shape == (200, 15)
+    features = ['merger1#feature_1', 'merger2#feature_1']
+    assert not df[features].isnull().any().any()
+    assert not df.duplicated(['stim_name', 'onset', 'object_id']).any()
+
+    # Name clashes are aggregated
+    df = merge_results(results, extractor_names='drop')
+    assert df.shape == (200, 12)
+    r1, r2 = results[:2]
+    expected = (r1.to_array()[:, 0] + r2.to_array()[:, 0]) / 2.
+    values = df.loc[df['stim_name'] == r1.stim.name, 'feature_1'].values
+    assert np.allclose(values, expected)
+    df = merge_results(results, extractor_names='drop', aggfunc='max')
+    values = df.loc[df['stim_name'] == r1.stim.name, 'feature_1'].values
+    assert np.allclose(values, np.maximum(r1.to_array()[:, 0],
+                                          r2.to_array()[:, 0]))
+
+    merger = ResultMerger(format='long', invalid_results='fail')
+    merger.add(results)
+    assert merger.merge().shape == (1200, 11)
+    with pytest.raises(ValueError):
+        merger.add('not a result')
+    with pytest.raises(ValueError):
+        ResultMerger(format='long', extractor_names='multi')
+
+
+def test_extractor_result_arrays():
+    stim = TextStim(text='hello')
+    ext = DummyExtractor()
+    data = np.random.rand(4, 3)
+    result = ExtractorResult(data, stim, ext, features=['a', 'b', 'c'],
+                             onsets=[0., 1., 1., 2.], durations=1.)
+    assert result.to_array() is data
+    assert result.to_array(dtype=np.float32).dtype == np.float32
+    assert result.get_feature_names() == ['a', 'b', 'c']
+
+    # The feature columns share memory with the data
+    df = result.to_df()
+    assert list(df.columns) == ['order', 'duration', 'onset', 'object_id',
+                                'a', 'b', 'c']
+    assert np.shares_memory(df['a'].values, data)
+    assert list(df['object_id']) == [0, 0, 1, 0]
+
+    long_df = result.to_df(format='long', extractor_name=True)
+    assert long_df.shape == (12, 7)
+    assert long_df['feature'].dtype == 'category'
+    assert long_df['extractor'].dtype == 'category'
+    assert np.array_equal(long_df['value'].values, data.T.ravel())
+
+    # Lists are converted once
+    result = ExtractorResult([[1, 2]], stim, ext)
+    assert result.to_array().shape == (1, 2)
+    assert isinstance(result._data, np.ndarray)
+    assert result.get_feature_names() == ['feature_1', 'feature_2']
@@ -1,6 +1,7 @@
 from os.path import join
 from ..utils import get_test_data_path
 from pliers.filters import (FrameSamplingFilter,
+                            VideoDecodingFilter,
                             VideoTrimmingFilter,
                             TemporalTrimmingFilter)
 from pliers.stimuli import VideoStim, VideoFrameStim
@@ -99,3 +100,27 @@ def test_video_trimming_filter():
     error_filt = VideoTrimmingFilter(end=10.0, validation='strict')
     with pytest.raises(ValueError):
         short_video = error_filt.transform(video)
+
+
+def test_video_decoding_filter():
+    video = VideoStim(join(VIDEO_DIR, 'small.mp4'))
+    filt = VideoDecodingFilter(size=(140, None), pix_fmt='gray', fps=10)
+    small = filt.transform(video)
+    assert isinstance(small, VideoStim)
+    assert small.fps == 10
+    assert small.n_frames == 56
+    assert (small.width, small.height) == (140, 80)
+    assert small.get_frame(index=3).data.shape == (80, 140)
+    assert small.history.transformer_class == 'VideoDecodingFilter'
+    assert "'pix_fmt': 'gray'" in small.history.transformer_params
+    assert small.fingerprint() != video.fingerprint()
+
+    # Options are kept by other filters
+    sampled = FrameSamplingFilter(every=5).transform(small)
+    assert sampled.decode_options == small.decode_options
+    assert [f.data.shape for f in sampled][0] == (80, 140)
+
+    trimmed = VideoTrimmingFilter(end=2.0).transform(small)
+    assert trimmed.n_frames == 20
+    with pytest.raises(ValueError):
+        filt.transform(trimmed)
@@ -385,3 +385,178 @@ def test_adding_nodes():
 
     with pytest.raises(ValueError):
         graph.add_nodes(['LengthExtractor'], mode='invalid')
+
+
+def test_concurrent_graph():
+    import threading
+    import time
+    from pliers import config
+
+    class SleepyExtractor(DummyExtractor):
+        in_flight = [0, 0]
+        lock = threading.Lock()
+
+        def _extract(self, stim):
+            with self.lock:
+                self.in_flight[0] += 1
+                self.in_flight[1] = max(self.in_flight)
+            time.sleep(0.05)
+            with self.lock:
+                self.in_flight[0] -= 1
+            return super(SleepyExtractor, self)._extract(stim)
+
+    config.set_option('cache_transformers', False)
+    stim = ImageStim(join(get_test_data_path(), 'image', 'button.jpg'))
+    nodes = [(SleepyExtractor(), [], 'a'),
+             ('imagecroppingfilter', [(SleepyExtractor(), [], 'b'),
+                                      (BrightnessExtractor(), [], 'c')]),
+             (SleepyExtractor(), [], 'd')]
+    serial = Graph(nodes).run(stim, merge=False)
+    assert SleepyExtractor.in_flight[1] == 1
+    graph = Graph(nodes, n_jobs=4)
+    results = graph.run(stim, merge=False)
+    assert SleepyExtractor.in_flight[1] > 1
+    assert [r.extractor.name for r in results] == \
+        [r.extractor.name for r in serial]
+    assert [r.stim.name for r in results] == [r.stim.name for r in serial]
+    config.reset_options(False)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_shared_subtrees(n_jobs):
+    from pliers import config
+    from pliers.filters import ImageCroppingFilter
+    config.set_option('cache_transformers', False)
+    stim = ImageStim(join(get_test_data_path(), 'image', 'button.jpg'))
+    de1, de2, de3 = DummyExtractor(), DummyExtractor(), \
+        DummyExtractor(param_A=1)
+    nodes = [(ImageCroppingFilter(), [de1]),
+             (ImageCroppingFilter(), [de2, de3])]
+    graph = Graph(nodes, n_jobs=n_jobs)
+    results = graph.run(stim, merge=False)
+    # Equivalent branches are only executed once
+    assert de1.num_calls + de2.num_calls == 1
+    assert de3.num_calls == 1
+    assert len(results) == 3
+    assert results[0] is results[1]
+    assert results[2] is not results[0]
+    # ...but the graph's structure is unaffected
+    assert len(graph.to_json()['roots']) == 2
+    config.reset_options(False)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_graph_streaming(n_jobs):
+    from pliers import config
+    from pliers.filters import ImageCroppingFilter
+    config.set_option('cache_transformers', False)
+    filename = join(get_test_data_path(), 'video', 'small.mp4')
+    video = FrameSamplingFilter(every=10).transform(VideoStim(filename))
+    n_frames = len(video.frame_index)
+    de1, de2 = DummyExtractor(), DummyExtractor(param_A=1)
+    graph = Graph([(ImageCroppingFilter(), [de1]),
+                   (ImageCroppingFilter(), [de2]), de1], n_jobs=n_jobs)
+
+    # Stims are pulled from the input (and processed) one at a time
+    decoded = []
+
+    def _frames():
+        for frame in video:
+            decoded.append(frame)
+            yield frame
+
+    results = graph.stream(_frames(), buffer_size=1)
+    first = next(results)
+    assert len(decoded) < (2 if n_jobs == 1 else 6)
+    results = [first] + list(results)
+    assert len(decoded) == n_frames
+    # The two identical cropping filters are only run once
+    assert len(results) == 3 * n_frames
+    assert de1.num_calls == 2 * n_frames
+    assert de2.num_calls == n_frames
+    if n_jobs == 1:
+        assert results[0].stim.name == results[1].stim.name
+
+    # Videos are converted to frames implicitly, and chunks of frames are
+    # transformed together
+    for chunksize in [1, 4]:
+        streamed = list(graph.stream(video, chunksize=chunksize))
+        assert len(streamed) == 3 * n_frames
+    config.reset_options(False)
+
+
+def test_graph_streaming_default_n_jobs(monkeypatch):
+    import multiprocessing
+    from pliers import config
+    # Makes sure nodes run concurrently, whatever the number of CPUs
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 2)
+    config.set_option('n_jobs', None)
+    graph = Graph(['LengthExtractor'], n_jobs=None)
+    results = list(graph.stream([TextStim(text='hi'), TextStim(text='hey')]))
+    assert sorted(r.to_df()['text_length'][0] for r in results) == [2, 3]
+    config.reset_options(False)
+
+
+def test_graph_journal():
+    from pliers import config
+    from pliers.graph import RunJournal
+    config.set_option('cache_transformers', False)
+    image_dir = join(get_test_data_path(), 'image')
+    stims = [join(image_dir, f) for f in ['apple.jpg', 'button.jpg']]
+    journal = RunJournal(tempfile.mkdtemp())
+    de1, de2 = DummyExtractor(), DummyExtractor(param_A=1)
+    graph = Graph([de1])
+    first = graph.run(stims, merge=False, journal=journal)
+    assert de1.num_calls == 2
+    assert len(journal) == 2
+
+    # Unchanged stims and nodes aren't recomputed...
+    graph.add_node(de2)
+    second = graph.run(stims, merge=False, journal=journal)
+    assert de1.num_calls == 2
+    assert de2.num_calls == 2
+    assert len(second) == 4
+    assert second[0].data.equals(first[0].data)
+    assert [r.extractor.param_A for r in second] == [None, 1, None, 1]
+
+    # ...but modified ones are
+    de2.param_A = 2
+    graph.run(stims[:1], merge=False, journal=journal.path)
+    assert de1.num_calls == 2
+    assert de2.num_calls == 3
+    config.reset_options(False)
+
+
+def test_graph_sink():
+    from pliers.sinks import CSVSink, ResultReader
+    image_dir = join(get_test_data_path(), 'image')
+    stims = [join(image_dir, f) for f in ['apple.jpg', 'button.jpg']]
+    graph = Graph([DummyExtractor(name='sink1'),
+                   DummyExtractor(name='sink2')])
+    results = graph.run(stims, merge=False)
+    sink = CSVSink(tempfile.mkdtemp(), buffer_size=150)
+    sink.write(results)
+    sink.flush()
+    key = ['stim_name', 'onset']
+    for kwargs in [{}, {'format': 'long', 'object_id': 'auto'}]:
+        df = sink.read().to_df(**kwargs).sort_values(key, kind='mergesort')
+        expected = merge_results(results, **kwargs)
+        expected = expected.sort_values(key, kind='mergesort')
+        pd.testing.assert_frame_equal(df.reset_index(drop=True),
+                                      expected.reset_index(drop=True))
+
+    # Results are partitioned by Extractor and input stim, and only
+    # references to them are kept
+    path = tempfile.mkdtemp()
+    df = graph.run(stims, sink=CSVSink(path))
+    assert df.shape == (200, 15)
+    assert [r.extractor for r in graph._results] == ['sink1', 'sink2'] * 2
+    # Paths are written to with a CSVSink
+    reader = graph.run(stims[:1], merge=False, sink=path)
+    assert isinstance(reader, ResultReader)
+    assert len(reader.files()) == 6
+    assert len(reader.files(extractors='sink1', stims=stims[0])) == 2
+    long = ResultReader(path).to_df(extractors='sink2', format='long',
+                                    extractor_names='column')
+    assert set(long['extractor']) == {'sink2'}
+    assert long.shape == (900, 12)
@@ -0,0 +1,120 @@
+from pliers import config
+from pliers.filters import FrameSamplingFilter, ImageCroppingFilter
+from pliers.graph import Graph
+from pliers.profiling import Profiler, MemoryTracker
+from pliers.stimuli import VideoStim, ImageStim
+from pliers.support.exceptions import MemoryLimitError
+from pliers.transformers import hooks
+from .utils import get_test_data_path, DummyExtractor
+from os.path import join
+import numpy as np
+import json
+import pytest
+import tempfile
+import time
+
+
+def test_graph_profiling():
+    config.set_option('cache_transformers', True)
+    filename = join(get_test_data_path(), 'video', 'small.mp4')
+    video = FrameSamplingFilter(every=20).transform(VideoStim(filename))
+    n_frames = len(video.frame_index)
+    graph = Graph([(ImageCroppingFilter(), [DummyExtractor()]),
+                   (DummyExtractor(name='direct'))])
+
+    with Profiler() as profiler:
+        graph.run(video)
+        graph.run(video)
+    n_events = len(profiler.events)
+    graph.run(video)
+    assert len(profiler.events) == n_events
+
+    by_node = profiler.summary()
+    assert set(by_node.index) == {'ImageCroppingFilter', 'DummyExtractor',
+                                  'direct'}
+    # The video is converted to frames implicitly (once, as the conversion
+    # is shared), and the second run is served from the cache
+    assert by_node.loc['direct', 'calls'] == 2
+    assert by_node.loc['direct', 'stims_in'] == 2
+    assert by_node.loc['direct', 'stims_out'] == 2 * n_frames
+    assert by_node.loc['direct', 'conversions'] == 1
+    assert by_node.loc['DummyExtractor', 'stims_in'] == 2 * n_frames
+    assert by_node.loc['DummyExtractor', 'cache_hits'] == n_frames
+    assert by_node.loc['ImageCroppingFilter', 'cache_hits'] == 1
+    assert (by_node['wall_time'] > 0).all()
+
+    by_class = profiler.summary(by='transformer')
+    assert by_class.loc['DummyExtractor', 'calls'] == 2 * n_frames
+    assert by_class.loc['VideoFrameCollectionIterator', 'calls'] == 1
+    assert by_class.loc['ImageCroppingFilter', 'conversions'] == 1
+    assert 'merge_results' in set(profiler.to_df()['name'])
+
+    filename = tempfile.mktemp(suffix='.json')
+    profiler.save_chrome_trace(filename)
+    with open(filename) as f:
+        trace = json.load(f)['traceEvents']
+    assert len(trace) == len(profiler.events)
+    spans = [e for e in trace if e['ph'] == 'X']
+    assert all(e['dur'] >= 0 for e in spans)
+    assert {e['cat'] for e in spans} >= {'node', 'transform', 'conversion',
+                                         'merge'}
+    config.reset_options(False)
+
+
+def test_memory_tracker():
+    config.set_option('cache_transformers', False)
+    image = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+
+    class GreedyExtractor(DummyExtractor):
+        def _extract(self, stim):
+            scratch = np.ones((50, 1024, 1024), dtype=np.uint8)
+            self.n_rows = int(scratch[:, 0, 0].sum()) * 20
+            return super(GreedyExtractor, self)._extract(stim)
+
+    with MemoryTracker() as tracker:
+        GreedyExtractor().transform(image)
+        DummyExtractor().transform([image, image])
+    assert not hooks.enabled
+
+    df = tracker.to_df()
+    assert len(df) == 3
+    assert (df['stim_bytes'] >= image.data.nbytes).all()
+    summary = tracker.summary()
+    assert list(summary.index) == ['GreedyExtractor', 'DummyExtractor']
+    assert summary.loc['DummyExtractor', 'calls'] == 2
+    greedy = summary.loc['GreedyExtractor']
+    assert greedy['max_traced_peak'] >= 50 * 1024 ** 2
+    assert greedy['traced_delta'] < 50 * 1024 ** 2
+    assert greedy['max_result_bytes'] >= 1000 * 3 * 8
+    assert greedy['max_result_bytes'] > \
+        summary.loc['DummyExtractor', 'max_result_bytes']
+
+    config.set_option('memory_limit', 20 * 1024 ** 2)
+    with MemoryTracker() as tracker:
+        DummyExtractor().transform(image)
+        with pytest.raises(MemoryLimitError) as err:
+            GreedyExtractor().transform(image)
+    assert 'GreedyExtractor' in str(err.value)
+    assert len(tracker.records) == 2
+    config.reset_options(False)
+
+    # Calls are stopped before they return, at the next Transformer call
+    class ChunkedExtractor(DummyExtractor):
+        def _extract(self, stim):
+            scratch = np.ones((50, 1024, 1024), dtype=np.uint8)
+            for i in range(10):
+                scratch[i] = 0
+                time.sleep(0.05)
+                DummyExtractor().transform(stim)
+                chunks.append(i)
+            return super(ChunkedExtractor, self)._extract(stim)
+
+    chunks = []
+    config.set_option('cache_transformers', False)
+    with MemoryTracker(limit=20 * 1024 ** 2) as tracker:
+        with pytest.raises(MemoryLimitError) as err:
+            ChunkedExtractor().transform(image)
+    assert 'ChunkedExtractor' in str(err.value)
+    assert len(chunks) < 10
+    assert tracker.records[-1]['transformer'] == 'ChunkedExtractor'
+    config.reset_options(False)
@@ -6,6 +6,9 @@ from pliers.stimuli import (VideoStim, VideoFrameStim, ComplexTextStim,
                             TweetStimFactory,
                             TweetStim)
 from pliers.stimuli.base import Stim, _get_stim_class
+from pliers.stimuli.video import VideoFrameCollectionStim, FrameReader
+from pliers.stimuli.readers import get_reader_pool
+from pliers import config
 from pliers.extractors import (BrightnessExtractor, LengthExtractor,
                                ComplexTextExtractor)
 from pliers.extractors.base import Extractor, ExtractorResult
@@ -16,6 +19,9 @@ import pandas as pd
 import pytest
 import tempfile
 import os
+import pickle
+import shutil
+import subprocess
 
 
 class DummyExtractor(Extractor):
@@ -59,6 +65,30 @@ def test_image_stim(dummy_iter_extractor):
     assert stim.data.shape == (288, 420, 3)
 
 
+def test_stim_fingerprint():
+    filename = join(get_test_data_path(), 'image', 'apple.jpg')
+    stim1, stim2 = ImageStim(filename), ImageStim(filename)
+    fp = stim1.fingerprint()
+    assert fp == stim2.fingerprint()
+    assert hash(stim1) == hash(stim2)
+
+    # Attribute assignment invalidates the cached value
+    stim2.onset = 2.0
+    assert stim2.fingerprint() != fp
+    stim2.onset = None
+    assert stim2.fingerprint() == fp
+
+    # In-place changes require explicit invalidation
+    stim2.data[0, 0, 0] += 1
+    assert stim2.fingerprint() == fp
+    stim2.invalidate_fingerprint()
+    assert stim2.fingerprint() != fp
+
+    text1, text2 = TextStim(text='yeah'), TextStim(text='buddy')
+    assert text1.fingerprint() != text2.fingerprint()
+    assert text1.fingerprint() == TextStim(text='yeah').fingerprint()
+
+
 def test_complex_text_hash():
     stims = [ComplexTextStim(text='yeah'), ComplexTextStim(text='buddy')]
     ext = ComplexTextExtractor()
@@ -120,6 +150,65 @@ def test_video_frame_stim():
     assert frame.name == 'frame[42]'
 
 
+def test_video_decoding_options():
+    filename = join(get_test_data_path(), 'video', 'small.mp4')
+    video = VideoStim(filename, size=(280, None), pix_fmt='gray')
+    assert video.fps == 30
+    assert (video.width, video.height) == (280, 160)
+    frames = list(video)
+    assert len(frames) == 168
+    assert frames[10].data.shape == (160, 280)
+    assert np.array_equal(video.get_frame(index=10).data, frames[10].data)
+
+    video = VideoStim(filename, fps=10, size=(None, 80))
+    assert video.n_frames == 56
+    assert video.get_frame(index=55).data.shape == (80, 140, 3)
+    with pytest.raises(ValueError):
+        VideoStim(filename, pix_fmt='yuv420p')
+
+
+def test_video_frame_reader():
+    filename = join(get_test_data_path(), 'video', 'small.mp4')
+    video = VideoStim(filename)
+    # Unordered, with repeated frames and a gap long enough to seek over
+    frame_index = [40, 3, 150, 3, 41, 0]
+    frames = VideoFrameCollectionStim(filename, clip=video.clip,
+                                      frame_index=frame_index)
+    expected = [frames.get_frame(i) for i in range(len(frame_index))]
+    for buffer_size in [0, 4]:
+        reader = FrameReader(frames, frame_index, buffer_size=buffer_size)
+        assert reader.plan == [0, 3, 40, 41, 150]
+        read = list(reader)
+        assert [n for n, _ in read] == frame_index
+        for (_, data), frame in zip(read, expected):
+            assert np.array_equal(data, frame.data)
+
+    # Frames beyond the buffer are dropped, and decoded again later
+    frame_index = [int(i) for i in np.random.RandomState(0).permutation(30)]
+    reader = FrameReader(frames, frame_index, buffer_size=2)
+    pool = get_reader_pool()
+    n_open = len(pool)
+    for i, (num, data) in enumerate(reader):
+        if i in (0, 15):
+            # The reader's own decoder is tracked by the pool
+            assert len(pool) == n_open + 1
+        if i % 10 == 0:
+            assert np.array_equal(data, video.get_frame(index=num).data)
+    assert len(pool) == n_open
+
+    frame_index = [40, 3, 150, 3, 41, 0]
+    iterated = list(frames)
+    assert [f.frame_num for f in iterated] == frame_index
+    assert [f.duration for f in iterated] == [f.duration for f in expected]
+    assert np.array_equal(iterated[2].data, expected[2].data)
+
+    # Stopping early leaves the clip usable
+    for i, frame in enumerate(video):
+        if i == 2:
+            break
+    assert np.array_equal(video.get_frame(index=41).data, expected[4].data)
+
+
 def test_audio_stim():
     audio_dir = join(get_test_data_path(), 'audio')
     stim = AudioStim(join(audio_dir, 'barber.wav'))
@@ -130,6 +219,18 @@ def test_audio_stim():
     assert round(stim.duration) == 3
     assert stim.sampling_rate == 11025
 
+    # Files without an audio stream fall back on the default sampling rate
+    from moviepy.config import get_setting
+    filename = tempfile.mktemp(suffix='.mp4')
+    subprocess.check_call([get_setting('FFMPEG_BINARY'), '-loglevel', 'error',
+                           '-f', 'lavfi', '-i', 'color=c=black:s=32x32:d=1',
+                           '-an', filename])
+    try:
+        assert AudioStim(filename).sampling_rate == 44100
+        assert AudioStim.get_sampling_rate(filename) == 44100
+    finally:
+        os.remove(filename)
+
 
 def test_audio_formats():
     audio_dir = join(get_test_data_path(), 'audio')
@@ -138,6 +239,113 @@ def test_audio_formats():
     assert stim.sampling_rate == 44100
 
 
+def test_lazy_stims_and_reader_pool():
+    filename = join(get_test_data_path(), 'video', 'small.mp4')
+    videos = [VideoStim(filename) for _ in range(4)]
+    # Nothing is opened until frames are read
+    assert all(v.__dict__.get('_clip') is None for v in videos)
+    assert videos[0].n_frames == 168
+    expected = videos[0].get_frame(index=30).data
+
+    pool = get_reader_pool()
+    default = config.get_option('max_open_readers')
+    config.set_option('max_open_readers', 2)
+    try:
+        for v in videos:
+            v.get_frame(index=10)
+        assert len(pool) <= 2
+        assert videos[0].clip not in pool
+        # Closed clips reopen when read from
+        for v in videos:
+            assert np.array_equal(v.get_frame(index=30).data, expected)
+        assert len(pool) <= 2
+    finally:
+        config.set_option('max_open_readers', default)
+
+    audio_dir = join(get_test_data_path(), 'audio')
+    stim = AudioStim(join(audio_dir, 'homer.wav'))
+    assert stim.__dict__['_data'] is None
+    fingerprint = stim.fingerprint()
+    assert np.isclose(len(stim.data) / stim.sampling_rate, stim.duration,
+                      atol=0.01)
+    assert stim.fingerprint() == fingerprint
+    stim.data = stim.data * 2
+    assert stim.fingerprint() != fingerprint
+
+
+def test_audio_stim_storage():
+    filename = join(get_test_data_path(), 'audio', 'homer.wav')
+    data = AudioStim(filename).data
+    assert data.dtype == np.float32
+    assert data.ndim == 1
+
+    # The output grows past the probed duration if needed, and is read in
+    # chunks
+    stim = AudioStim(filename)
+    stim.duration = 0.1
+    chunk_size = AudioStim._chunk_size
+    AudioStim._chunk_size = 1000
+    try:
+        assert np.array_equal(stim.data, data)
+    finally:
+        AudioStim._chunk_size = chunk_size
+
+    cache_dir = tempfile.mkdtemp()
+    old = config.get_option('audio_mmap'), config.get_option('audio_cache_dir')
+    try:
+        config.set_option('audio_mmap', True)
+        stim = AudioStim(filename)
+        assert isinstance(stim.data, np.memmap)
+        assert np.array_equal(stim.data, data)
+
+        config.set_option('audio_mmap', False)
+        config.set_option('audio_cache_dir', cache_dir)
+        stim = AudioStim(filename)
+        assert np.array_equal(stim.data, data)
+        assert not stim.data.flags.writeable
+        assert len(os.listdir(cache_dir)) == 1
+        # Cached data isn't pickled, but mapped again
+        copy = pickle.loads(pickle.dumps(stim))
+        assert copy.__dict__['_data'] is None
+        assert np.array_equal(copy.data, data)
+        assert copy.fingerprint() == stim.fingerprint()
+        assert np.array_equal(AudioStim(filename).data, data)
+        assert len(os.listdir(cache_dir)) == 1
+    finally:
+        config.set_option('audio_mmap', old[0])
+        config.set_option('audio_cache_dir', old[1])
+        shutil.rmtree(cache_dir)
+
+
+def test_audio_stim_chunks():
+    stim = AudioStim(join(get_test_data_path(), 'audio', 'barber.wav'),
+                     onset=4.2)
+    chunks = list(stim.chunks(10., overlap=2.))
+    assert len(chunks) == 7
+    assert [c.order for c in chunks] == list(range(7))
+    assert np.allclose([c.onset for c in chunks],
+                       [4.2 + 8 * i for i in range(7)])
+    assert chunks[0].duration == 10.
+    assert chunks[-1].onset + chunks[-1].duration == \
+        pytest.approx(stim.onset + stim.duration, abs=0.01)
+    # Chunks are views into the original data
+    assert np.shares_memory(chunks[1].data, stim.data)
+    assert np.array_equal(chunks[1].data[:100],
+                          stim.data[8 * 11025:8 * 11025 + 100])
+    assert chunks[1].name == stim.name
+    assert chunks[1].filename is None
+    assert chunks[1].clip.duration == pytest.approx(10.)
+    with pytest.raises(ValueError):
+        next(stim.chunks(2., overlap=2.))
+
+    stim = AudioStim(data=np.zeros(500, dtype=np.float32),
+                     sampling_rate=100)
+    assert stim.duration == 5.
+    assert [c.onset for c in stim.chunks(2.)] == [0., 2., 4.]
+    with pytest.raises(ValueError):
+        AudioStim(data=np.zeros(500, dtype=np.float32))
+
+
 def test_complex_text_stim():
     text_dir = join(get_test_data_path(), 'text')
     stim = ComplexTextStim(join(text_dir, 'complex_stim_no_header.txt'),
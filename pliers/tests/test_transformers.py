@@ -1,5 +1,6 @@
 from pliers.transformers import get_transformer
 from pliers.extractors import (STFTAudioExtractor, BrightnessExtractor,
+                               LengthExtractor,
                                merge_results)
 from pliers.stimuli.base import TransformationLog
 from pliers.stimuli import ImageStim, VideoStim, TextStim
@@ -8,6 +9,8 @@ from os.path import join
 from .utils import get_test_data_path, DummyExtractor, DummyBatchExtractor
 import numpy as np
 import pytest
+import shutil
+import tempfile
 
 
 def test_get_transformer_by_name():
@@ -43,6 +46,7 @@ def test_parallelization():
     # TODO: test that parallelization actually happened (this will likely
     # require some new logging functionality, or introspection). For now we
     # just make sure the parallelized version produces the same result.
+    from pliers.transformers.executors import shutdown_executors
     default = config.get_option('parallelize')
     cache_default = config.get_option('cache_transformers')
     config.set_option('cache_transformers', True)
@@ -62,6 +66,9 @@ def test_parallelization():
     assert result1 == result2
     config.set_option('parallelize', default)
     config.set_option('cache_transformers', cache_default)
+    # Workers inherit the pipes of open moviepy clips, which would block
+    # closing the clips later on
+    shutdown_executors()
 
 
 def test_batch_transformer():
@@ -156,10 +163,375 @@ def test_caching():
     assert ext.num_calls == 1
     assert res == res2
 
+    # None is a valid (cached) result
+    class NoneExtractor(DummyExtractor):
+        def _extract(self, stim):
+            self.num_calls += 1
+
+    ext = NoneExtractor()
+    assert ext.transform(img1) is None
+    assert ext.transform(img1) is None
+    assert ext.num_calls == 1
+
     config.set_option('cache_transformers', cache_default)
 
+
+def test_transformer_fingerprint():
+    ext1, ext2 = DummyExtractor('giraffe'), DummyExtractor('giraffe')
+    assert ext1.fingerprint() == ext2.fingerprint()
+    ext2.param_A = 'penguin'
+    assert ext1.fingerprint() != ext2.fingerprint()
+    # Attributes that aren't logged don't affect the fingerprint
+    fp = ext1.fingerprint()
+    ext1.num_calls = 10
+    assert ext1.fingerprint() == fp
+    ext1.name = 'zebra'
+    assert ext1.fingerprint() != fp
+
+
 def test_versioning():
     ext = DummyBatchExtractor()
     assert ext.VERSION == '0.1'
     ext = BrightnessExtractor()
     assert ext.VERSION >= '1.0'
+
+
+def test_disk_caching():
+    from pliers.transformers.cache import DiskCache, get_cache
+    cache_dir = tempfile.mkdtemp()
+    config.set_options(cache_transformers=True, cache_backend='disk',
+                       cache_dir=cache_dir)
+    cache = get_cache()
+    assert isinstance(cache, DiskCache)
+    assert len(cache) == 0
+
+    img1 = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+    ext = DummyExtractor()
+    res = ext.transform(img1)
+    assert ext.num_calls == 1
+    assert len(cache) == 1
+
+    # A fresh stim and extractor with identical content and parameters
+    # should be served from disk
+    img2 = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+    ext2 = DummyExtractor()
+    res2 = ext2.transform(img2)
+    assert ext2.num_calls == 0
+    assert np.array_equal(res._data, res2._data)
+
+    # Different parameters should miss
+    ext3 = DummyExtractor(param_A='giraffe')
+    ext3.transform(img2)
+    assert ext3.num_calls == 1
+
+    # Size-based eviction keeps the directory within budget
+    config.set_option('cache_max_bytes', cache.size + 1)
+    cache = get_cache()
+    ext4 = DummyExtractor(param_A='zebra')
+    ext4.transform(img2)
+    assert cache.size <= cache.max_bytes
+    assert len(cache) < 3
+
+    # Membership tests don't affect the counters, which are thread-safe
+    cache.reset_stats()
+    key = list(cache._sizes)[0]
+    assert key in cache and 'missing' not in cache
+    assert cache.stats()['hits'] == cache.stats()['misses'] == 0
+    import threading
+    threads = [threading.Thread(target=lambda: [cache.get(key)
+                                                for _ in range(10)])
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.stats()['hits'] == 40
+
+    cache.clear()
+    assert len(cache) == 0
+    config.reset_options(False)
+    shutil.rmtree(cache_dir)
+
+
+def test_bounded_memory_cache():
+    from pliers.transformers.cache import MemoryCache, estimate_size
+    arr = np.zeros(1000)
+    assert estimate_size(arr) == arr.nbytes
+    assert estimate_size([arr, arr[:10]]) < 2 * arr.nbytes
+
+    cache = MemoryCache(max_entries=2)
+    cache['a'], cache['b'] = 1, 2
+    assert cache.get('a') == 1
+    cache['c'] = 3
+    # 'b' is the least recently used entry
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+    assert cache.evictions == 1
+
+    cache = MemoryCache(max_entries=2, policy='lfu')
+    cache['a'], cache['b'] = 1, 2
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    cache['c'] = 3
+    assert 'b' not in cache and 'a' in cache
+
+    cache = MemoryCache(max_bytes=arr.nbytes * 1.5)
+    cache['a'], cache['b'] = np.zeros(1000), np.zeros(1000)
+    assert len(cache) == 1 and cache.size == arr.nbytes
+    cache['c'] = np.zeros(10000)
+    assert 'c' not in cache
+    cache.resize(max_bytes=None, max_entries=0)
+    assert len(cache) == 0 and cache.size == 0
+    stats = cache.stats()
+    assert stats['evictions'] == 2 and stats['entries'] == 0
+
+
+def test_cache_config():
+    from pliers.transformers.cache import (get_cache, register_cache_backend,
+                                           MemoryCache)
+    # Use a dedicated backend so the default cache is left untouched
+    register_cache_backend('test_memory', MemoryCache)
+    config.set_options(cache_transformers=True, cache_backend='test_memory',
+                       cache_max_entries=1)
+    cache = get_cache()
+    img1 = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+    img2 = ImageStim(join(get_test_data_path(), 'image', 'button.jpg'))
+    ext = DummyExtractor()
+    ext.transform(img1)
+    ext.transform(img2)
+    ext.transform(img2)
+    assert ext.num_calls == 2
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['evictions'] == 1
+    assert len(cache) == 1
+    config.set_option('cache_max_entries', None)
+    assert get_cache() is cache and cache.max_entries is None
+    config.reset_options(False)
+
+
+@pytest.mark.parametrize('executor', ['serial', 'thread', 'chunked_process'])
+def test_executors(executor):
+    from pliers.transformers.executors import (get_executor,
+                                               shutdown_executors)
+    config.set_option('cache_transformers', False)
+    stims = [TextStim(text=w) for w in ['a', 'bb', 'ccc', 'dddd', 'eeeee']]
+    ext = LengthExtractor()
+    results = ext.transform(stims, executor=executor)
+    assert [r._data[0] for r in results] == [1, 2, 3, 4, 5]
+
+    # Batch transformers dispatch batches through the executor too
+    img1 = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+    img2 = ImageStim(join(get_test_data_path(), 'image', 'button.jpg'))
+    ext = DummyBatchExtractor(batch_size=1)
+    res = ext.transform([img1, img2, img1], executor=executor)
+    assert [r._data[0][0] for r in res] == [len(img1.name), len(img2.name),
+                                            len(img1.name)]
+
+    # Instances (and hence worker pools) are shared across calls
+    assert get_executor(executor) is get_executor(executor)
+    config.reset_options(False)
+    shutdown_executors()
+
+
+def test_array_transport():
+    import pickle
+    from glob import glob
+    from pliers.transformers.transport import (ArrayTransport, SharedArray,
+                                               _shared_dir)
+    from pliers.transformers.executors import (get_executor,
+                                               shutdown_executors)
+    img = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+    fp = img.fingerprint()
+    with ArrayTransport() as transport:
+        exported = transport.export([img])[0]
+        # The original is untouched; the copy only holds a handle
+        assert exported is not img and not isinstance(img.data, SharedArray)
+        assert isinstance(exported.data, SharedArray)
+        assert len(pickle.dumps(exported)) < img.data.nbytes
+        assert exported.fingerprint() == fp
+        received = pickle.loads(pickle.dumps(exported))
+        assert isinstance(received.data, np.memmap)
+        assert np.array_equal(received.data, img.data)
+        assert received.fingerprint() == fp
+    assert not glob(join(_shared_dir(), transport.token + '*'))
+
+    # Arrays in results come back through shared memory as well
+    config.set_option('cache_transformers', False)
+    config.set_option('share_arrays_threshold', 1)
+    stims = [img, ImageStim(join(get_test_data_path(), 'image', 'button.jpg'))]
+    results = get_executor('process').map(lambda s: s.data * 2, stims)
+    assert all(np.array_equal(r, s.data * 2) for r, s in zip(results, stims))
+    results = BrightnessExtractor().transform(stims, executor='process')
+    assert [r.stim.fingerprint() for r in results] == \
+        [s.fingerprint() for s in stims]
+    config.reset_options(False)
+    shutdown_executors()
+
+
+def test_api_transformer_concurrency():
+    import threading
+    import time
+    from pliers.extractors import Extractor, ExtractorResult
+    from pliers.transformers.api import APITransformer
+    from pliers.utils import TokenBucket
+
+    bucket = TokenBucket(rate=50, burst=2)
+    start = time.time()
+    waits = [bucket.acquire() for i in range(6)]
+    assert waits[:2] == [0, 0]
+    assert time.time() - start >= 0.07
+
+    class SleepyAPIExtractor(APITransformer, Extractor):
+        _input_type = TextStim
+        _env_keys = ()
+        api_keys = []
+        in_flight = [0, 0]
+        lock = threading.Lock()
+
+        def check_valid_keys(self):
+            return True
+
+        def _extract(self, stim):
+            with self.lock:
+                self.in_flight[0] += 1
+                self.in_flight[1] = max(self.in_flight)
+            time.sleep(0.05)
+            with self.lock:
+                self.in_flight[0] -= 1
+            return ExtractorResult([[len(stim.text)]], stim, self, ['len'])
+
+    config.set_option('cache_transformers', False)
+    stims = [TextStim(text='a' * i) for i in range(1, 9)]
+    ext = SleepyAPIExtractor(max_concurrent=4)
+    results = ext.transform(stims)
+    assert [r._data[0][0] for r in results] == list(range(1, 9))
+    assert 1 < ext.in_flight[1] <= 4
+    assert ext.transformed_stim_count == 8
+
+    # Transformers of the same service share one bucket, with the most
+    # restrictive settings
+    class OtherAPIExtractor(SleepyAPIExtractor):
+        _env_keys = ('OTHER_API_KEY',)
+
+    fast = OtherAPIExtractor(rate_limit=0.01, burst=4)
+    bucket = fast._get_rate_limiter()
+    assert (bucket.rate, bucket.burst) == (100, 4)
+    slow = OtherAPIExtractor(rate_limit=0.1, burst=2)
+    assert slow._get_rate_limiter() is bucket
+    assert (bucket.rate, bucket.burst) == (10, 2)
+    assert fast._get_rate_limiter() is bucket
+    assert (bucket.rate, bucket.burst) == (10, 2)
+    config.reset_options(False)
+
+
+def test_implicit_conversion_caching(monkeypatch):
+    from pliers.converters import VideoToAudioConverter
+    from pliers.converters.base import get_implicit_converter
+    from pliers.stimuli import AudioStim
+    from pliers.transformers.cache import get_cache
+    calls = []
+    convert = VideoToAudioConverter._convert
+
+    def _counting_convert(self, stim):
+        calls.append(stim.name)
+        return convert(self, stim)
+
+    class DummyAudioExtractor(DummyExtractor):
+        _input_type = AudioStim
+
+    monkeypatch.setattr(VideoToAudioConverter, '_convert', _counting_convert)
+    config.set_options(cache_transformers=False, cache_conversions=True)
+    get_cache().clear()
+    video = VideoStim(join(get_test_data_path(), 'video', 'small.mp4'))
+    r1 = DummyAudioExtractor(param_A=1).transform(video)
+    r2 = DummyAudioExtractor(param_A=2).transform(video)
+    assert len(calls) == 1
+    assert r1.stim is r2.stim and r1.stim.history.implicit
+    assert get_implicit_converter(VideoStim, AudioStim) is \
+        get_implicit_converter(VideoStim, AudioStim)
+
+    # Frames aren't cached unless the cache is bounded
+    BrightnessExtractor().transform(video)
+    assert len(get_cache()) == 1
+
+    config.set_option('cache_conversions', False)
+    DummyAudioExtractor(param_A=1).transform(video)
+    assert len(calls) == 2
+
+    # By default, conversions are cached only if transformer outputs are
+    config.set_option('cache_conversions', None)
+    get_cache().clear()
+    BrightnessExtractor().transform(video)
+    DummyAudioExtractor(param_A=1).transform(video)
+    assert len(get_cache()) == 0
+    config.reset_options(False)
+
+
+def test_transformer_hooks():
+    from pliers.transformers import hooks
+    from pliers.transformers.api import APITransformer
+    from pliers.extractors import Extractor, ExtractorResult
+
+    events = []
+
+    def _record(event):
+        def callback(transformer, stim, **kwargs):
+            events.append((event, transformer.name, sorted(kwargs)))
+        return callback
+
+    callbacks = dict((e, _record(e)) for e in hooks.HOOK_EVENTS)
+    for event, callback in callbacks.items():
+        hooks.register_hook(event, callback)
+    assert hooks.enabled
+    with pytest.raises(ValueError):
+        hooks.register_hook('after_everything', _record('after_everything'))
+
+    try:
+        img = ImageStim(join(get_test_data_path(), 'image', 'apple.jpg'))
+        ext = DummyExtractor(param_A='hooks')
+        ext.transform(img)
+        assert events == [
+            ('before_transform', 'DummyExtractor', []),
+            ('after_transform', 'DummyExtractor', ['duration', 'result'])
+        ]
+        del events[:]
+        ext.transform(img)
+        assert events == [('on_cache_hit', 'DummyExtractor', ['result'])]
+
+        class FailingExtractor(DummyExtractor):
+            def _extract(self, stim):
+                raise RuntimeError('boom')
+
+        del events[:]
+        with pytest.raises(RuntimeError):
+            FailingExtractor().transform(img)
+        assert events[-1] == ('on_error', 'FailingExtractor',
+                              ['duration', 'error'])
+
+        class DummyAPIExtractor(APITransformer, Extractor):
+            _input_type = TextStim
+            _env_keys = ()
+            api_keys = []
+
+            def check_valid_keys(self):
+                return True
+
+            def _extract(self, stim):
+                return ExtractorResult([[len(stim.text)]], stim, self,
+                                       ['len'])
+
+        del events[:]
+        DummyAPIExtractor().transform(TextStim(text='hooks'))
+        assert [e[0] for e in events] == ['before_transform',
+                                          'on_api_request', 'after_transform']
+
+        hooks.unregister_hook('before_transform',
+                              callbacks['before_transform'])
+        assert hooks.get_hooks('before_transform') == []
+        assert hooks.enabled
+    finally:
+        hooks.clear_hooks()
+    assert not hooks.enabled
+    del events[:]
+    DummyExtractor(param_A='no_hooks').transform(img)
+    assert events == []
@@ -1,10 +1,14 @@
 from pliers.stimuli import VideoStim
 from pliers.filters import FrameSamplingFilter
-from pliers.utils import batch_iterable, flatten_dict
+from pliers.utils import (batch_iterable, flatten_dict, attempt_to_import,
+                          verify_dependencies)
+from pliers.support.exceptions import MissingDependencyError
 from pliers import config
 from types import GeneratorType
 from .utils import get_test_data_path
 from os.path import join
+import subprocess
+import sys
 import pytest
 
 
@@ -53,3 +57,32 @@ def test_flatten_dict():
     assert res == { 'a' : 5, 'b_c' : 6, 'b_d' : 1}
     res = flatten_dict(d, 'prefix', '.')
     assert res == { 'prefix.a' : 5, 'prefix.b.c' : 6, 'prefix.b.d' : 1}
+
+
+def test_attempt_to_import():
+    missing = attempt_to_import('pliers_missing_package', 'missing')
+    assert not missing
+    with pytest.raises(MissingDependencyError):
+        missing.some_function()
+    with pytest.raises(MissingDependencyError):
+        verify_dependencies(['missing'])
+
+    json = attempt_to_import('json', 'lazy_json')
+    assert json.loads('[1]') == [1]
+    assert json
+    verify_dependencies(['lazy_json'])
+
+
+def test_import_time():
+    # Importing pliers must not import any Transformers or optional
+    # dependencies, so that worker processes start up quickly.
+    code = ("import sys, time; t = time.time(); import pliers; "
+            "print(time.time() - t); "
+            "print(' '.join(sorted(sys.modules)))")
+    out = subprocess.check_output([sys.executable, '-c', code])
+    duration, modules = out.decode().strip().split('\n')
+    modules = modules.split()
+    for mod in ['pliers.graph', 'pliers.extractors', 'pliers.converters',
+                'pliers.filters', 'pliers.stimuli', 'nltk', 'pandas']:
+        assert mod not in modules
+    assert float(duration) < 1.
@@ -4,11 +4,17 @@ that have multiple subclasses spanning different modules (e.g., Google Cloud
 extractors that span audio, image, etc.).'''
 
 from .base import Transformer, BatchTransformerMixin, get_transformer
-from .api import (GoogleAPITransformer,
-                  GoogleVisionAPITransformer,
-                  MicrosoftAPITransformer,
-                  MicrosoftVisionAPITransformer)
+from pliers.utils import lazy_exports
 
+# Classes defined in the other submodules are only imported when first
+# accessed, so that importing the package doesn't import every optional
+# dependency.
+_exports = {
+    'api': ['GoogleAPITransformer',
+            'GoogleVisionAPITransformer',
+            'MicrosoftAPITransformer',
+            'MicrosoftVisionAPITransformer']
+}
 
 __all__ = [
     'BatchTransformerMixin',
@@ -19,3 +25,5 @@ __all__ = [
     'MicrosoftVisionAPITransformer',
     'Transformer'
 ]
+
+__getattr__, __dir__ = lazy_exports(__name__, _exports)
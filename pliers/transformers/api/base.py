@@ -1,23 +1,71 @@
 ''' Base implementation for all API transformers. '''
 
-from pliers import config
-from pliers.transformers import Transformer
-from pliers.utils import isiterable, listify, APIDependent
-import time
+from pliers import config, profiling
+from pliers.transformers import Transformer, hooks
+from pliers.transformers.executors import get_executor
+from pliers.utils import isiterable, listify, APIDependent, TokenBucket
+import threading
+
+# Rate limiters are shared by all transformers that use the same service
+# (identified by the environment keys holding its credentials), so that
+# quotas are respected across transformers and threads. When transformers of
+# the same service are configured differently, the most restrictive rate and
+# burst apply to all of them.
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+_count_lock = threading.Lock()
 
 
 class APITransformer(APIDependent, Transformer):
 
-    def _transform(self, stim, *args, **kwargs):
-        # Check if we are requesting faster than the rate limit,
-        # if so, throttle by sleeping
-        time_diff = time.time() - self._last_request_time
-        if time_diff < self.rate_limit:
-            time.sleep(self.rate_limit - time_diff)
-        self._last_request_time = time.time()
+    ''' Base class for Transformers that query a remote API.
+
+    Requests are throttled by a token bucket shared by all transformers
+    accessing the same service: tokens are added every rate_limit seconds,
+    and up to burst of them can accumulate. If transformers of the same
+    service are given different rate_limit or burst values, the most
+    restrictive ones (the longest rate_limit and the smallest burst) apply to
+    all of them. When an iterable of stims is
+    transformed, up to max_concurrent requests are kept in flight at once (in
+    a pool of threads), and results are returned in input order.
+
+    Args:
+        rate_limit (int): The minimum number of seconds required between
+            transformation requests, on average.
+        max_concurrent (int): Maximum number of requests in flight at once.
+            Defaults to the 'api_max_concurrent' config option.
+        burst (int): Number of requests that can be sent without waiting
+            after a period of inactivity. Defaults to the 'api_burst' config
+            option.
+    '''
 
+    def _get_rate_limiter(self):
+        rate = 1. / self.rate_limit if self.rate_limit else None
+        burst = self.burst or config.get_option('api_burst')
+        service = tuple(self.env_keys or [self.__class__.__name__])
+        with _rate_limiters_lock:
+            bucket = _rate_limiters.get(service)
+            if bucket is None:
+                bucket = _rate_limiters[service] = TokenBucket(rate, burst)
+            elif (rate and (not bucket.rate or rate < bucket.rate)) or \
+                    burst < bucket.burst:
+                bucket.restrict(rate, burst)
+            return bucket
+
+    def _iterate(self, stims, *args, **kwargs):
+        max_concurrent = self.max_concurrent or \
+            config.get_option('api_max_concurrent')
+        # Requests spend most of their time waiting on the network, so
+        # threads are used unless an executor is requested explicitly.
+        if kwargs.get('executor') is None and max_concurrent > 1:
+            kwargs['executor'] = get_executor('thread', n_jobs=max_concurrent)
+        return super(APITransformer, self)._iterate(stims, *args, **kwargs)
+
+    def _transform(self, stim, *args, **kwargs):
         # Check if we are trying to transform a large amount of data
-        self.transformed_stim_count += len(listify(stim))
+        with _count_lock:
+            self.transformed_stim_count += len(listify(stim))
+            count = self.transformed_stim_count
         if not config.get_option('allow_large_jobs'):
             if not isiterable(stim) and stim.duration \
                and stim.duration > config.get_option('long_job'):
@@ -27,7 +75,7 @@ class APITransformer(APIDependent, Transformer):
                                  "config option 'allow_large_jobs' to "
                                  "True." % stim.duration)
 
-            if self.transformed_stim_count > config.get_option('large_job'):
+            if count > config.get_option('large_job'):
                 raise ValueError("Number of transformations using this %s "
                                  "would exceed %d, aborting further "
                                  "transformations. To allow, set config "
@@ -41,4 +89,11 @@ class APITransformer(APIDependent, Transformer):
                              "you have authorized credentials for accessing "
                              "the target API." % self.__class__.__name__)
 
+        # Wait for our turn under the service's rate limit
+        with profiling.span(self.name, 'rate_limit',
+                            transformer=self.__class__.__name__):
+            wait = self._get_rate_limiter().acquire()
+        if hooks.enabled:
+            hooks.fire('on_api_request', self, stim, wait=wait)
+
         return super(APITransformer, self)._transform(stim, *args, **kwargs)
@@ -1,22 +1,22 @@
 ''' Core transformer logic. '''
 
-from pliers import config
+from pliers import config, profiling
 from pliers.stimuli.base import Stim, _log_transformation, load_stims
 from pliers.stimuli.compound import CompoundStim
+from pliers.transformers import hooks
+from pliers.transformers.cache import get_cache, get_cache_key, _missing
+from pliers.transformers.executors import get_executor, SerialExecutor
 from pliers.utils import (progress_bar_wrapper, isiterable,
                           isgenerator, listify, batch_iterable,
-                          attempt_to_import, set_iterable_type)
+                          set_iterable_type, fingerprint_hasher)
 import pliers
 from six import with_metaclass, string_types
 from abc import ABCMeta, abstractmethod, abstractproperty
 import importlib
 import logging
+import threading
 from functools import wraps
-
-multiprocessing = attempt_to_import('pathos.multiprocessing',
-                                    'multiprocessing', ['ProcessingPool'])
-
-_cache = {}
+from timeit import default_timer
 
 
 class Transformer(with_metaclass(ABCMeta)):
@@ -50,14 +50,22 @@ class Transformer(with_metaclass(ABCMeta)):
             use_cache = config.get_option('cache_transformers') \
                 and isinstance(stim, (Stim, string_types))
             if use_cache:
-                key = hash((hash(self), hash(stim)))
-                if key in _cache:
-                    return _cache[key]
+                cache = get_cache()
+                key = get_cache_key(self, stim)
+                # Transformers may legitimately return None, which is cached
+                # like any other result
+                result = cache.get(key, _missing)
+                if result is not _missing:
+                    profiling.event(self.name, 'cache',
+                                    transformer=self.__class__.__name__)
+                    if hooks.enabled:
+                        hooks.fire('on_cache_hit', self, stim, result=result)
+                    return result
             result = transform(self, stim, *args, **kwargs)
             if use_cache:
                 if isgenerator(result):
                     result = list(result)
-                _cache[key] = result
+                cache.set(key, result)
             return result
         return wrapper
 
@@ -82,12 +90,19 @@ class Transformer(with_metaclass(ABCMeta)):
                     - 'warn': Issue a warning for all validation errors
                     - 'loose': Silently ignore all validation errors
 
+            executor (str, Executor): Optional executor to use when an
+                iterable of stims is passed. Either an Executor instance or
+                the name of a registered executor ('serial', 'thread',
+                'process', or 'chunked_process'). Defaults to the 'executor'
+                config option.
             args: Optional positional arguments to pass onto the internal
                 _transform call.
             kwargs: Optional positional arguments to pass onto the internal
                 _transform call.
         '''
 
+        executor = kwargs.pop('executor', None)
+
         if isinstance(stims, string_types):
             stims = load_stims(stims)
 
@@ -102,8 +117,8 @@ class Transformer(with_metaclass(ABCMeta)):
         # If stims is an iterable, naively loop over elements, removing
         # invalid results if needed
         if isiterable(stims):
-            iters = self._iterate(stims, validation=validation, *args,
-                                  **kwargs)
+            iters = self._iterate(stims, validation=validation,
+                                  executor=executor, *args, **kwargs)
             if config.get_option('drop_bad_extractor_results'):
                 iters = (i for i in iters if i is not None)
             iters = progress_bar_wrapper(iters, desc='Stim')
@@ -126,24 +141,136 @@ class Transformer(with_metaclass(ABCMeta)):
             if stims is not validated_stim:
                 return self.transform(validated_stim, *args, **kwargs)
             else:
-                result = self._transform(validated_stim, *args, **kwargs)
-                result = _log_transformation(validated_stim, result, self)
-                if isgenerator(result):
-                    result = list(result)
-                self._propagate_context(validated_stim, result)
+                with profiling.span(self.name, 'transform', stims_in=1,
+                                    transformer=self.__class__.__name__) \
+                        as info:
+                    result = self._apply(validated_stim, args, kwargs)
+                    result = _log_transformation(validated_stim, result,
+                                                 self)
+                    if isgenerator(result):
+                        result = list(result)
+                    self._propagate_context(validated_stim, result)
+                    info['stims_out'] = len(listify(result) or [])
                 return result
 
+    def stream(self, stims, validation='strict', *args, **kwargs):
+        ''' Like transform(), but returns a generator that yields the results
+        one at a time (flattened into a single sequence). Stims are processed
+        as the generator is consumed, and collections produced along the way
+        (e.g., the frames of a video, whether iterated explicitly or as part
+        of an implicit conversion) are never held in memory all at once.
+
+        Args:
+            stims (str, Stim, list, generator): One or more stimuli to process.
+            validation (str): How validation errors are handled; see
+                transform().
+            args, kwargs: Optional arguments to pass onto the internal
+                _transform call.
+        '''
+        if isinstance(stims, string_types):
+            stims = load_stims(stims)
+
+        if isiterable(stims):
+            for stim in stims:
+                for result in self.stream(stim, validation, *args, **kwargs):
+                    yield result
+            return
+
+        # Implicit conversions are streamed too (and bypass the conversion
+        # cache); CompoundStims, and stims that can't be converted, go
+        # through the regular path
+        if isinstance(stims, CompoundStim) or \
+                not self._stim_matches_input_types(stims):
+            converter = None
+            if not isinstance(stims, CompoundStim):
+                from pliers.converters.base import get_implicit_converter
+                in_type = self._input_type if self._input_type \
+                    else self._optional_input_type
+                converter = get_implicit_converter(type(stims), in_type)
+            if converter is None:
+                results = self.transform(stims, validation, *args, **kwargs)
+                for result in listify(results) or []:
+                    if result is not None:
+                        yield result
+                return
+            for converted in converter.stream(stims):
+                converted = _log_transformation(stims, converted, converter,
+                                                True)
+                for result in self.stream(converted, validation, *args,
+                                          **kwargs):
+                    yield result
+            return
+
+        use_cache = config.get_option('cache_transformers')
+        if use_cache:
+            cache = get_cache()
+            key = get_cache_key(self, stims)
+            result = cache.get(key, _missing)
+            if result is not _missing:
+                profiling.event(self.name, 'cache',
+                                transformer=self.__class__.__name__)
+                if hooks.enabled:
+                    hooks.fire('on_cache_hit', self, stims, result=result)
+                if result is not None:
+                    for r in listify(result):
+                        yield r
+                return
+
+        # Lazy outputs are produced after the span ends, as they're consumed
+        with profiling.span(self.name, 'transform', stims_in=1,
+                            transformer=self.__class__.__name__):
+            result = self._apply(stims, args, kwargs, lazy=True)
+        result = _log_transformation(stims, result, self)
+        if isgenerator(result) or isiterable(result):
+            # Multiple outputs are passed on as they're produced, and not
+            # cached, as that would require holding all of them in memory
+            for r in result:
+                if r is not None:
+                    self._propagate_context(stims, r)
+                    yield r
+            return
+        if result is not None:
+            self._propagate_context(stims, result)
+        if use_cache:
+            cache.set(key, result)
+        if result is not None:
+            yield result
+
+    def _apply(self, stim, args, kwargs, lazy=False):
+        # Calls _transform, firing the lifecycle hooks if any are registered.
+        # When hooks are fired, generator outputs are consumed here (so that
+        # they're included in the duration), unless lazy is True.
+        if not hooks.enabled:
+            return self._transform(stim, *args, **kwargs)
+        hooks.fire('before_transform', self, stim)
+        start = default_timer()
+        try:
+            result = self._transform(stim, *args, **kwargs)
+            if not lazy and isgenerator(result):
+                result = list(result)
+        except Exception as e:
+            hooks.fire('on_error', self, stim, error=e,
+                       duration=default_timer() - start)
+            raise
+        hooks.fire('after_transform', self, stim,
+                   result=None if isgenerator(result) else result,
+                   duration=default_timer() - start)
+        return result
+
     def _validate(self, stim):
         # Checks whether the current Transformer can handle the passed Stim.
         # If not, attempts a dynamic conversion before failing.
         if not self._stim_matches_input_types(stim):
-            from pliers.converters.base import get_converter
+            from pliers.converters.base import get_implicit_converter
             in_type = self._input_type if self._input_type \
                 else self._optional_input_type
-            converter = get_converter(type(stim), in_type)
+            converter = get_implicit_converter(type(stim), in_type)
             if converter:
                 _old_stim = stim
-                stim = converter.transform(stim)
+                with profiling.span(converter.name, 'conversion',
+                                    transformer=self.__class__.__name__,
+                                    converter=converter.__class__.__name__):
+                    stim = _convert_implicitly(converter, stim)
                 stim = _log_transformation(_old_stim, stim, converter, True)
             else:
                 msg = ("Transformers of type %s can only be applied to stimuli"
@@ -176,24 +303,21 @@ class Transformer(with_metaclass(ABCMeta)):
                                                isinstance(stim, optional))
 
     def _iterate(self, stims, *args, **kwargs):
+        executor = get_executor(kwargs.pop('executor', None))
 
-        if config.get_option('parallelize') and multiprocessing is not None:
+        def _transform(s):
+            return self.transform(s, *args, **kwargs)
 
-            def _transform(s):
-                return self.transform(s, *args, **kwargs)
+        if isinstance(executor, SerialExecutor):
+            return (t for t in executor.map(_transform, stims) if t)
 
-            n_jobs = config.get_option('n_jobs')
-            return multiprocessing.ProcessingPool(n_jobs) \
-                .map(_transform, stims)
-
-        return (t for t in (self.transform(s, *args, **kwargs)
-                            for s in stims) if t)
+        return list(executor.map(_transform, stims))
 
     def _propagate_context(self, stim, result):
         if isiterable(result):
             for r in result:
                 self._propagate_context(stim, r)
-        else:
+        elif result is not None:
             if result.onset is None:
                 result.onset = stim.onset
             if result.duration is None:
@@ -209,9 +333,83 @@ class Transformer(with_metaclass(ABCMeta)):
     def _input_type(self):
         pass
 
+    def fingerprint(self):
+        ''' Returns a deterministic hex digest identifying the Transformer's
+        class, name, VERSION, and the parameters listed in _log_attributes.
+        Unlike hash(), the fingerprint is stable across processes and
+        sessions. It is cached, and invalidated whenever the name or one of
+        the logged attributes is reassigned. '''
+        fp = self.__dict__.get('_fingerprint')
+        if fp is None:
+            tr_attrs = [getattr(self, attr) for attr in self._log_attributes]
+            params = str(dict(zip(self._log_attributes, tr_attrs)))
+            h = fingerprint_hasher()
+            h.update(str((self.__class__.__module__,
+                          self.__class__.__name__, self.name, params,
+                          self.VERSION)).encode('utf-8'))
+            fp = h.hexdigest()
+            self.__dict__['_fingerprint'] = fp
+        return fp
+
+    def __setattr__(self, name, value):
+        if name == 'name' or name in self._log_attributes:
+            self.__dict__.pop('_fingerprint', None)
+        super(Transformer, self).__setattr__(name, value)
+
     def __hash__(self):
-        tr_attrs = [getattr(self, attr) for attr in self._log_attributes]
-        return hash(self.name + str(dict(zip(self._log_attributes, tr_attrs))))
+        return hash(self.fingerprint())
+
+
+# Key -> [lock, number of callers holding or waiting on it]
+_conversion_locks = {}
+_conversion_locks_lock = threading.Lock()
+
+
+def _is_bounded(cache):
+    return getattr(cache, 'max_bytes', None) is not None or \
+        getattr(cache, 'max_entries', None) is not None
+
+
+def _convert_implicitly(converter, stim):
+    # Applies a converter on behalf of a Transformer that can't handle the
+    # passed stim. If the 'cache_conversions' option is on (by default, if
+    # cache_transformers is), the output is cached (under the same key the
+    # converter's own transform() would use), and concurrent requests for the
+    # same conversion wait for the first one instead of repeating it. The
+    # outputs of iterators (e.g., all the frames of a video) are only cached
+    # if the cache is bounded.
+    enabled = config.get_option('cache_conversions')
+    if enabled is None:
+        enabled = config.get_option('cache_transformers')
+    if not enabled or not isinstance(stim, Stim):
+        return converter.transform(stim)
+    key = get_cache_key(converter, stim)
+    with _conversion_locks_lock:
+        entry = _conversion_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            cache = get_cache()
+            result = cache.get(key, _missing)
+            if result is _missing:
+                result = converter.transform(stim)
+                if isgenerator(result):
+                    result = list(result)
+                if not isinstance(result, list) or _is_bounded(cache):
+                    cache.set(key, result)
+            else:
+                profiling.event(converter.name, 'cache',
+                                transformer=converter.__class__.__name__)
+                if hooks.enabled:
+                    hooks.fire('on_cache_hit', converter, stim,
+                               result=result)
+            return result
+    finally:
+        # The lock is kept until no other caller is waiting on it
+        with _conversion_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _conversion_locks[key]
 
 
 class BatchTransformerMixin(Transformer):
@@ -232,42 +430,60 @@ class BatchTransformerMixin(Transformer):
         super(BatchTransformerMixin, self).__init__(*args, **kwargs)
 
     def _iterate(self, stims, validation='strict', *args, **kwargs):
-        batches = batch_iterable(stims, self._batch_size)
-        results = []
-        for batch in progress_bar_wrapper(batches):
-            use_cache = config.get_option('cache_transformers')
-            target_inds = {}
+        executor = get_executor(kwargs.pop('executor', None))
+        use_cache = config.get_option('cache_transformers')
+        cache = get_cache() if use_cache else None
+        stims = list(stims)
+        keys = [get_cache_key(self, stim) for stim in stims]
+
+        # Split the stims into batches, and within each batch only keep the
+        # stims that aren't in the cache and haven't already been scheduled
+        # as part of an earlier batch.
+        results = {}
+        scheduled = set()
+        to_run = []
+        for batch in batch_iterable(list(zip(stims, keys)),
+                                    self._batch_size):
             non_cached = []
-            for stim in batch:
-                key = hash((hash(self), hash(stim)))
-                # If using the cache, only transform stims that aren't in the
-                # cache and haven't already appeared in the batch
-                if not (use_cache and (key in _cache or key in target_inds)):
-                    target_inds[key] = len(non_cached)
-                    non_cached.append(stim)
-
+            for stim, key in batch:
+                if key in scheduled or key in results:
+                    continue
+                if use_cache:
+                    result = cache.get(key, _missing)
+                    if result is not _missing:
+                        profiling.event(self.name, 'cache',
+                                        transformer=self.__class__.__name__)
+                        if hooks.enabled:
+                            hooks.fire('on_cache_hit', self, stim,
+                                       result=result)
+                        results[key] = result
+                        continue
+                scheduled.add(key)
+                non_cached.append((stim, key))
             # _transform will likely fail if given an empty list
-            if len(non_cached) > 0:
-                batch_results = self._transform(non_cached, *args, **kwargs)
-            else:
-                batch_results = []
-
-            for i, stim in enumerate(batch):
-                key = hash((hash(self), hash(stim)))
-                # Use the target index to get the result from batch_results
-                if key in target_inds:
-                    result = batch_results[target_inds[key]]
-                    result = _log_transformation(stim, result, self)
-                    self._propagate_context(stim, result)
-                    if use_cache:
-                        if isgenerator(result):
-                            result = list(result)
-                        _cache[key] = result
-                    results.append(result)
-                # Otherwise, the result should be in the cache
-                else:
-                    results.append(_cache[key])
-        return results
+            if non_cached:
+                to_run.append(non_cached)
+
+        def _transform(batch):
+            with profiling.span(self.name, 'transform', stims_in=len(batch),
+                                transformer=self.__class__.__name__) as info:
+                outputs = self._apply([s for s, _ in batch], args, kwargs)
+                info['stims_out'] = len(listify(outputs) or [])
+            return outputs
+
+        batch_results = executor.map(_transform, to_run)
+        for batch, outputs in zip(to_run,
+                                  progress_bar_wrapper(batch_results,
+                                                       total=len(to_run))):
+            for (stim, key), result in zip(batch, outputs):
+                result = _log_transformation(stim, result, self)
+                self._propagate_context(stim, result)
+                if isgenerator(result):
+                    result = list(result)
+                if use_cache:
+                    cache.set(key, result)
+                results[key] = result
+        return [results[key] for key in keys]
 
     def _transform(self, stim, *args, **kwargs):
         stims = listify(stim)
@@ -280,7 +496,7 @@ class BatchTransformerMixin(Transformer):
                 return result[0]
         else:
             return list(super(BatchTransformerMixin, self)
-                        ._iterate(stims, *args, **kwargs))
+                        ._iterate(stims, executor='serial', *args, **kwargs))
 
 
 def get_transformer(name, base=None, *args, **kwargs):
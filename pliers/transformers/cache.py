@@ -0,0 +1,452 @@
+''' Backends used to cache (memoize) the results of Transformer calls. '''
+
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from os.path import join, exists, expanduser, realpath, getsize, getmtime
+from six import with_metaclass, string_types
+from pliers import config
+from pliers.stimuli.base import Stim
+from pliers.utils import fingerprint_hasher
+import numpy as np
+import pandas as pd
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+
+__all__ = ['TransformerCache', 'MemoryCache', 'DiskCache', 'get_cache',
+           'register_cache_backend', 'get_cache_key', 'clear_cache',
+           'estimate_size']
+
+_missing = object()
+
+
+class TransformerCache(with_metaclass(ABCMeta, object)):
+
+    ''' Base class for all Transformer result caches. Subclasses implement a
+    minimal key/value store; keys are always strings returned by
+    get_cache_key(). Subclasses are expected to update the hits, misses and
+    evictions counters, which are reported by stats(). '''
+
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    @abstractmethod
+    def get(self, key, default=None):
+        ''' Returns the value stored under key, or default if missing. '''
+        pass
+
+    @abstractmethod
+    def set(self, key, value):
+        ''' Stores value under key. '''
+        pass
+
+    @abstractmethod
+    def clear(self):
+        ''' Removes all entries from the cache. '''
+        pass
+
+    def __contains__(self, key):
+        return self.get(key, _missing) is not _missing
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def stats(self):
+        ''' Returns a dict with the hit, miss and eviction counts, as well as
+        the current number of entries in the cache. '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self)
+        }
+
+    def reset_stats(self):
+        ''' Sets all counters back to zero. '''
+        self.hits = self.misses = self.evictions = 0
+
+
+class MemoryCache(TransformerCache):
+
+    ''' An in-process cache with optional bounds on the number of entries
+    and on their total (estimated) size. Contents are lost when the process
+    exits.
+
+    Args:
+        max_entries (int): Optional maximum number of entries to hold. If
+            None, the number of entries is unbounded.
+        max_bytes (int): Optional maximum total size of all entries, in bytes.
+            Sizes are estimated with estimate_size(), which mainly counts the
+            numpy arrays held by Stims and ExtractorResults. If None, the
+            total size is unbounded.
+        policy (str): The eviction policy to apply when either bound is
+            exceeded. Either 'lru' (evict the least recently used entry) or
+            'lfu' (evict the least frequently used entry, breaking ties by
+            recency).
+    '''
+
+    _policies = ('lru', 'lfu')
+
+    def __init__(self, max_entries=None, max_bytes=None, policy='lru'):
+        if policy not in self._policies:
+            raise ValueError("Invalid cache policy '%s'; must be one of %s." %
+                             (policy, self._policies))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.size = 0
+        self._store = OrderedDict()
+        self._sizes = {}
+        self._counts = {}
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._store:
+                self.misses += 1
+                return default
+            self.hits += 1
+            # Re-insert to mark the entry as most recently used
+            value = self._store.pop(key)
+            self._store[key] = value
+            self._counts[key] += 1
+            return value
+
+    def set(self, key, value):
+        size = estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._store:
+                self._pop(key)
+            self._store[key] = value
+            self._sizes[key] = size
+            self._counts[key] = 1
+            self.size += size
+            self._evict(protect=key)
+
+    def _pop(self, key):
+        del self._store[key]
+        del self._counts[key]
+        self.size -= self._sizes.pop(key)
+
+    def _over_budget(self):
+        return (self.max_entries is not None and
+                len(self._store) > self.max_entries) or \
+            (self.max_bytes is not None and self.size > self.max_bytes)
+
+    def _evict(self, protect=None):
+        # The entry being inserted (if any) is never evicted; under LFU it
+        # would otherwise always be the first candidate.
+        while self._over_budget():
+            candidates = (k for k in self._store if k != protect)
+            if self.policy == 'lru':
+                key = next(candidates, None)
+            else:
+                # Iteration runs from least to most recently used, so min()
+                # breaks ties in favor of evicting older entries
+                candidates = list(candidates)
+                key = min(candidates, key=self._counts.__getitem__) \
+                    if candidates else None
+            if key is None:
+                break
+            self._pop(key)
+            self.evictions += 1
+
+    def resize(self, max_entries=None, max_bytes=None, policy=None):
+        ''' Changes the bounds (and optionally the policy) of the cache,
+        immediately evicting entries if the new bounds are exceeded. '''
+        if policy is not None and policy not in self._policies:
+            raise ValueError("Invalid cache policy '%s'; must be one of %s." %
+                             (policy, self._policies))
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            if policy is not None:
+                self.policy = policy
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self._sizes.clear()
+            self._counts.clear()
+            self.size = 0
+
+    def stats(self):
+        stats = super(MemoryCache, self).stats()
+        stats['bytes'] = self.size
+        return stats
+
+    def __contains__(self, key):
+        # Membership tests don't count as uses of the entry
+        return key in self._store
+
+    def __len__(self):
+        return len(self._store)
+
+
+class DiskCache(TransformerCache):
+
+    ''' A persistent cache that pickles each entry to its own file in a
+    target directory, so that results survive across processes and sessions.
+
+    Args:
+        path (str): Directory in which to store cache entries. Created if it
+            doesn't already exist. Defaults to ~/.pliers/cache.
+        max_bytes (int): Optional size budget (in bytes) for the directory.
+            When the budget is exceeded, the least recently used entries are
+            evicted until the total size fits again. If None, the cache grows
+            without limit.
+    '''
+
+    _extension = '.pkl'
+
+    def __init__(self, path=None, max_bytes=None):
+        if path is None:
+            path = join(expanduser('~'), '.pliers', 'cache')
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        if not exists(path):
+            os.makedirs(path)
+        self._sizes = self._scan()
+
+    def _scan(self):
+        # Build the size index from whatever a previous session left behind
+        sizes = {}
+        for f in os.listdir(self.path):
+            if f.endswith(self._extension):
+                sizes[f[:-len(self._extension)]] = getsize(join(self.path, f))
+        return sizes
+
+    def _filename(self, key):
+        return join(self.path, key + self._extension)
+
+    @property
+    def size(self):
+        ''' Total size (in bytes) of all entries currently on disk. '''
+        return sum(self._sizes.values())
+
+    def get(self, key, default=None):
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError):
+            with self._lock:
+                self.misses += 1
+            return default
+        except Exception as e:
+            # Entries that can no longer be unpickled (e.g., written by an
+            # incompatible version of a dependency) are treated as misses.
+            logging.debug("Discarding unreadable cache entry %s: %s" %
+                          (key, e))
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+        # Touch the file so that mtime reflects the most recent access
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        try:
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logging.debug("Result for cache key %s could not be pickled and "
+                          "will not be cached on disk: %s" % (key, e))
+            return
+        if self.max_bytes is not None and len(payload) > self.max_bytes:
+            return
+        # Write to a temporary file first so readers never see partial data
+        handle, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(payload)
+        os.rename(tmp, self._filename(key))
+        with self._lock:
+            self._sizes[key] = len(payload)
+        self._evict()
+
+    def _remove(self, key):
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+        with self._lock:
+            self._sizes.pop(key, None)
+
+    def _evict(self):
+        if self.max_bytes is None or self.size <= self.max_bytes:
+            return
+        # Other processes may share the directory, so refresh the index
+        # before deciding what to drop.
+        with self._lock:
+            self._sizes = self._scan()
+        entries = []
+        for key in list(self._sizes):
+            try:
+                entries.append((getmtime(self._filename(key)), key))
+            except OSError:
+                self._sizes.pop(key, None)
+        total = self.size
+        for _, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            total -= self._sizes.get(key, 0)
+            self._remove(key)
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        for key in list(self._scan()):
+            self._remove(key)
+
+    def stats(self):
+        stats = super(DiskCache, self).stats()
+        stats['bytes'] = self.size
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            super(DiskCache, self).reset_stats()
+
+    def __contains__(self, key):
+        # Membership tests don't count as hits or misses
+        return exists(self._filename(key))
+
+    def __len__(self):
+        return len(self._sizes)
+
+
+_backends = {
+    'memory': MemoryCache,
+    'disk': DiskCache
+}
+
+# Backends are initialized once per configuration, so that switching back
+# and forth between settings doesn't discard previously cached results.
+_instances = {}
+
+
+def register_cache_backend(name, cls):
+    ''' Registers a new TransformerCache subclass under the passed name, so
+    that it can be selected with the 'cache_backend' config option. The class
+    is initialized with the 'cache_dir' and 'cache_max_bytes' settings as its
+    'path' and 'max_bytes' arguments (or, if it subclasses MemoryCache, with
+    the 'cache_max_entries', 'cache_max_bytes' and 'cache_policy' settings).
+    '''
+    _backends[name] = cls
+
+
+def _init_backend(name):
+    if name not in _backends:
+        raise ValueError("Invalid cache backend '%s'; valid values are %s." %
+                         (name, sorted(_backends)))
+    cls = _backends[name]
+    if issubclass(cls, MemoryCache):
+        return cls(max_entries=config.get_option('cache_max_entries'),
+                   max_bytes=config.get_option('cache_max_bytes'),
+                   policy=config.get_option('cache_policy'))
+    return cls(path=config.get_option('cache_dir'),
+               max_bytes=config.get_option('cache_max_bytes'))
+
+
+def get_cache():
+    ''' Returns the TransformerCache currently selected via the config
+    options. The 'cache_backend' option can be either the name of a
+    registered backend, or an initialized TransformerCache instance. '''
+    backend = config.get_option('cache_backend')
+    if isinstance(backend, TransformerCache):
+        return backend
+    if issubclass(_backends.get(backend, object), MemoryCache):
+        # There is only ever one in-memory cache per backend; bounds are
+        # applied by resizing it in place.
+        if backend not in _instances:
+            _instances[backend] = _init_backend(backend)
+        cache = _instances[backend]
+        bounds = (config.get_option('cache_max_entries'),
+                  config.get_option('cache_max_bytes'),
+                  config.get_option('cache_policy'))
+        if bounds != (cache.max_entries, cache.max_bytes, cache.policy):
+            cache.resize(*bounds)
+        return cache
+    signature = (backend, config.get_option('cache_dir'),
+                 config.get_option('cache_max_bytes'))
+    if signature not in _instances:
+        _instances[signature] = _init_backend(backend)
+    return _instances[signature]
+
+
+def clear_cache():
+    ''' Clears the currently active Transformer cache. '''
+    get_cache().clear()
+
+
+def estimate_size(obj, _seen=None):
+    ''' Returns a rough estimate of the memory footprint (in bytes) of an
+    object. numpy arrays and pandas objects are measured exactly; Stims,
+    ExtractorResults and standard containers are walked recursively, and
+    anything else falls back on sys.getsizeof(). Objects referenced more than
+    once are only counted once. '''
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        # Views don't own their memory; count the base array instead
+        if isinstance(obj.base, np.ndarray):
+            return estimate_size(obj.base, _seen)
+        return obj.nbytes
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(index=True)))
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(o, _seen)
+                                        for o in obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(v, _seen)
+                                        for v in obj.values())
+
+    from pliers.extractors.base import ExtractorResult
+    if isinstance(obj, (Stim, ExtractorResult)):
+        size = sys.getsizeof(obj)
+        for k, v in obj.__dict__.items():
+            # Don't walk into the (potentially huge) Transformer object
+            if k != 'extractor':
+                size += estimate_size(v, _seen)
+        return size
+    return sys.getsizeof(obj)
+
+
+def get_cache_key(transformer, stim):
+    ''' Returns a deterministic string key identifying the application of a
+    Transformer to a Stim (or to a path that can be loaded as one). The key
+    combines the fingerprints of both objects, so it remains valid across
+    processes and sessions. '''
+    h = fingerprint_hasher()
+    h.update(transformer.fingerprint().encode('utf-8'))
+    if isinstance(stim, string_types):
+        path = realpath(stim)
+        h.update(path.encode('utf-8'))
+        if exists(path):
+            h.update(str((getsize(path), getmtime(path))).encode('utf-8'))
+    else:
+        h.update(stim.fingerprint().encode('utf-8'))
+    return h.hexdigest()
@@ -0,0 +1,214 @@
+''' Executor backends that control how Transformers iterate over multiple
+Stims (serially, in a pool of threads, or in a pool of processes). '''
+
+from abc import ABCMeta, abstractmethod
+from multiprocessing.pool import ThreadPool
+from six import with_metaclass
+from pliers import config
+from pliers.utils import attempt_to_import
+from pliers.transformers.transport import ArrayTransport
+import atexit
+import threading
+
+multiprocessing = attempt_to_import('pathos.multiprocessing',
+                                    'multiprocessing', ['ProcessingPool'])
+
+__all__ = ['Executor', 'SerialExecutor', 'ThreadExecutor', 'ProcessExecutor',
+           'ChunkedProcessExecutor', 'get_executor', 'register_executor',
+           'shutdown_executors']
+
+
+class Executor(with_metaclass(ABCMeta, object)):
+
+    ''' Base class for all executors. An executor applies a function to
+    every element of an iterable, yielding results in input order.
+
+    Args:
+        n_jobs (int): Number of workers to use. If None, the backend's
+            default is used (typically the number of CPU cores).
+    '''
+
+    def __init__(self, n_jobs=None):
+        self.n_jobs = n_jobs
+
+    @abstractmethod
+    def map(self, func, iterable):
+        ''' Applies func to every element of iterable, and returns an
+        iterable over the results, in input order. '''
+        pass
+
+    def shutdown(self):
+        ''' Releases any workers held by the executor. The executor can still
+        be used afterwards; workers are restarted on demand. '''
+        pass
+
+
+class SerialExecutor(Executor):
+
+    ''' Applies the function lazily, in the calling thread. '''
+
+    def map(self, func, iterable):
+        return (func(x) for x in iterable)
+
+
+class _PoolExecutor(Executor):
+
+    # Base class for executors backed by a persistent pool of workers. The
+    # pool is created on first use and reused by all subsequent calls.
+
+    def __init__(self, n_jobs=None, chunksize=None):
+        self.chunksize = chunksize
+        self._pool = None
+        self._lock = threading.Lock()
+        super(_PoolExecutor, self).__init__(n_jobs)
+
+    @abstractmethod
+    def _create_pool(self):
+        pass
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._create_pool()
+            return self._pool
+
+    def map(self, func, iterable):
+        kwargs = {} if self.chunksize is None else \
+            {'chunksize': self.chunksize}
+        # Blocks until all tasks are done; unlike imap(), this ensures that
+        # results are never unpickled while tasks are still being sent.
+        return self.pool.map(func, list(iterable), **kwargs)
+
+
+class ThreadExecutor(_PoolExecutor):
+
+    ''' Runs tasks in a pool of threads. Best suited to Transformers that
+    spend most of their time waiting on I/O (e.g., API calls), or that wrap
+    libraries which release the GIL (e.g., OpenCV or numpy). '''
+
+    def _create_pool(self):
+        return ThreadPool(self.n_jobs)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+
+class ProcessExecutor(_PoolExecutor):
+
+    ''' Runs tasks in a persistent pool of processes, via pathos. Tasks and
+    results are serialized with dill, so closures and most Transformers can be
+    passed to workers. Unless the 'share_arrays' option is disabled, large
+    arrays held by Stims and ExtractorResults (in either direction) are sent
+    through shared memory rather than copied through the worker pipes.
+
+    Args:
+        n_jobs (int): Number of worker processes.
+        chunksize (int): Number of tasks sent to a worker at a time. Defaults
+            to 1, which balances load best but has the highest overhead.
+    '''
+
+    def _create_pool(self):
+        if not multiprocessing:
+            raise ImportError("The process executors require the pathos "
+                              "package, which doesn't appear to be "
+                              "installed.")
+        return multiprocessing.ProcessingPool(self.n_jobs)
+
+    def map(self, func, iterable):
+        if not config.get_option('share_arrays'):
+            return super(ProcessExecutor, self).map(func, iterable)
+        threshold = config.get_option('share_arrays_threshold')
+        with ArrayTransport(threshold) as transport:
+            items = [transport.export(x) for x in iterable]
+            return super(ProcessExecutor, self).map(transport.wrap(func),
+                                                    items)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool.clear()
+                self._pool = None
+
+
+class ChunkedProcessExecutor(ProcessExecutor):
+
+    ''' A ProcessExecutor that sends tasks to workers in chunks, amortizing
+    serialization and IPC overhead over many cheap tasks.
+
+    Args:
+        n_jobs (int): Number of worker processes.
+        chunksize (int): Number of tasks sent to a worker at a time. If None,
+            the 'chunksize' config option is used.
+    '''
+
+    def __init__(self, n_jobs=None, chunksize=None):
+        if chunksize is None:
+            chunksize = config.get_option('chunksize')
+        super(ChunkedProcessExecutor, self).__init__(n_jobs, chunksize)
+
+
+_executors = {
+    'serial': SerialExecutor,
+    'thread': ThreadExecutor,
+    'process': ProcessExecutor,
+    'chunked_process': ChunkedProcessExecutor
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_executor(name, cls):
+    ''' Registers a new Executor subclass under the passed name, so that it
+    can be selected via the 'executor' config option or per call. '''
+    _executors[name] = cls
+
+
+def get_executor(executor=None, n_jobs=None):
+    ''' Returns an Executor instance. Instances are shared, so that worker
+    pools are reused across calls.
+
+    Args:
+        executor (str, Executor): Either an initialized Executor (returned
+            as is), or the name of a registered executor ('serial', 'thread',
+            'process', or 'chunked_process'). If None, the 'executor' config
+            option is used; if that is also None, 'process' is used when the
+            'parallelize' option is True (and pathos is installed), and
+            'serial' otherwise.
+        n_jobs (int): Number of workers. Defaults to the 'n_jobs' option.
+    '''
+    if isinstance(executor, Executor):
+        return executor
+    if executor is None:
+        executor = config.get_option('executor')
+    if executor is None:
+        parallelize = config.get_option('parallelize') and \
+            bool(multiprocessing)
+        executor = 'process' if parallelize else 'serial'
+    if executor not in _executors:
+        raise ValueError("Invalid executor '%s'; valid values are %s." %
+                         (executor, sorted(_executors)))
+    if n_jobs is None:
+        n_jobs = config.get_option('n_jobs')
+    key = (executor, n_jobs)
+    if executor == 'chunked_process':
+        key += (config.get_option('chunksize'),)
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = _executors[executor](n_jobs=n_jobs)
+        return _instances[key]
+
+
+@atexit.register
+def shutdown_executors():
+    ''' Shuts down the worker pools of all shared executors. '''
+    with _instances_lock:
+        for executor in _instances.values():
+            executor.shutdown()
@@ -0,0 +1,94 @@
+''' Lifecycle hooks: callbacks fired from the core Transformer code paths,
+e.g., to feed metrics or tracing systems. When no hooks are registered, the
+only cost to Transformers is a check of the module-level 'enabled' flag. '''
+
+from collections import OrderedDict
+import threading
+
+__all__ = ['register_hook', 'unregister_hook', 'clear_hooks', 'get_hooks',
+           'HOOK_EVENTS']
+
+# Event names, and the keyword arguments passed to their callbacks (in
+# addition to the Transformer and the stim, which are always passed first):
+HOOK_EVENTS = OrderedDict([
+    # Before _transform is called on a validated stim (or list of stims, for
+    # batch Transformers).
+    ('before_transform', ()),
+    # After _transform returns. duration is in seconds; result is None for
+    # lazy (generator) outputs that are still to be consumed.
+    ('after_transform', ('result', 'duration')),
+    # When _transform raises an exception (which is re-raised afterwards).
+    ('on_error', ('error', 'duration')),
+    # When a result is retrieved from the Transformer cache instead of being
+    # computed.
+    ('on_cache_hit', ('result',)),
+    # Before an API Transformer sends a request, once any rate-limit wait
+    # (in seconds) is over.
+    ('on_api_request', ('wait',))
+])
+
+_hooks = dict((e, ()) for e in HOOK_EVENTS)
+_lock = threading.Lock()
+
+# True if at least one hook is registered; checked before firing any event
+enabled = False
+
+
+def register_hook(event, callback):
+    ''' Registers a callback to be called on every occurrence of an event.
+    Callbacks are called in the order in which they were registered, in the
+    thread in which the event occurs; exceptions raised by callbacks
+    propagate to the caller.
+
+    Args:
+        event (str): One of 'before_transform', 'after_transform',
+            'on_error', 'on_cache_hit' or 'on_api_request'.
+        callback (callable): Called as callback(transformer, stim, **kwargs);
+            see HOOK_EVENTS for the keyword arguments passed for each event.
+
+    Returns:
+        The callback.
+    '''
+    global enabled
+    if event not in _hooks:
+        raise ValueError("Invalid hook event '%s'; valid events are %s." %
+                         (event, list(HOOK_EVENTS)))
+    with _lock:
+        # Lists are replaced rather than modified, so that events can be
+        # fired without holding the lock
+        _hooks[event] = _hooks[event] + (callback,)
+        enabled = True
+    return callback
+
+
+def unregister_hook(event, callback):
+    ''' Removes a previously registered callback. '''
+    global enabled
+    with _lock:
+        hooks = list(_hooks[event])
+        hooks.remove(callback)
+        _hooks[event] = tuple(hooks)
+        enabled = any(_hooks.values())
+
+
+def clear_hooks(event=None):
+    ''' Removes all callbacks registered for an event, or for all events if
+    event is None. '''
+    global enabled
+    with _lock:
+        for e in ([event] if event is not None else list(_hooks)):
+            _hooks[e] = ()
+        enabled = any(_hooks.values())
+
+
+def get_hooks(event):
+    ''' Returns the callbacks currently registered for an event. '''
+    return list(_hooks[event])
+
+
+def fire(event, transformer, stim, **kwargs):
+    ''' Calls all callbacks registered for an event. Callers should check
+    the module's enabled flag first, to avoid any overhead when no hooks are
+    registered. '''
+    for callback in _hooks[event]:
+        callback(transformer, stim, **kwargs)
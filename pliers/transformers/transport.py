@@ -0,0 +1,192 @@
+''' Zero-copy transport of large numpy arrays between processes, used by the
+process-based executors. Arrays are written once to memory-mapped files
+(in /dev/shm where available, so they never touch the disk), and only
+lightweight handles are pickled and sent through the worker pipes. '''
+
+from os.path import join, isdir
+from glob import glob
+from pliers.stimuli.base import Stim
+import numpy as np
+import copy
+import mmap
+import os
+import tempfile
+import uuid
+
+__all__ = ['SharedArray', 'ArrayTransport']
+
+
+def _shared_dir():
+    # tmpfs-backed shared memory on Linux; regular temp dir elsewhere
+    return '/dev/shm' if isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def _attach(path, dtype, shape, mode, unlink):
+    arr = np.memmap(path, dtype=np.dtype(dtype), mode=mode, shape=shape)
+    if unlink:
+        # The mapping stays valid after the file is removed
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return arr
+
+
+class SharedArray(np.ndarray):
+
+    ''' An ndarray backed by a memory-mapped file that pickles to a small
+    handle instead of to its contents. Unpickling maps the same file, so the
+    array data is never copied. SharedArrays should only ever exist in objects
+    that are about to be sent to (or returned from) a worker; anything derived
+    from them (e.g., slices) pickles as a regular array. '''
+
+    def __array_finalize__(self, obj):
+        self._handle = None
+
+    def __reduce__(self):
+        if self._handle is None:
+            return np.asarray(self).__reduce__()
+        return (_attach, self._handle)
+
+    @classmethod
+    def wrap(cls, arr, mode, unlink):
+        ''' Wraps an array that maps the entire file arr.filename. The mode
+        and unlink arguments are applied by whichever process unpickles the
+        array. '''
+        shared = arr.view(cls)
+        shared._handle = (arr.filename, arr.dtype.str, arr.shape, mode,
+                          unlink)
+        return shared
+
+
+class ArrayTransport(object):
+
+    ''' Manages the lifetime of the memory-mapped files used to send arrays
+    to workers during a single executor call. Use as a context manager; on
+    exit, all files created for the call (including files created by workers
+    for results that were never received) are removed.
+
+    Args:
+        threshold (int): Only arrays with at least this many bytes are
+            shared; smaller arrays are cheaper to pickle.
+    '''
+
+    def __init__(self, threshold=0):
+        self.threshold = threshold
+        self.token = 'pliers_%d_%s' % (os.getpid(), uuid.uuid4().hex[:8])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def release(self):
+        ''' Removes all files created for this transport. '''
+        for f in glob(join(_shared_dir(), self.token + '_*')):
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+    def share_array(self, arr, mode, unlink):
+        ''' Copies arr into a new memory-mapped file and returns it as a
+        SharedArray. '''
+        path = join(_shared_dir(), '%s_%s.dat' % (self.token,
+                                                  uuid.uuid4().hex))
+        arr = np.ascontiguousarray(arr)
+        mm = np.memmap(path, dtype=arr.dtype, mode='w+',
+                       shape=arr.shape)
+        mm[...] = arr
+        mm.flush()
+        return SharedArray.wrap(mm, mode, unlink)
+
+    def _share(self, arr, outbound):
+        # Workers receive read-only mappings, and the parent removes input
+        # files itself. Results are mapped copy-on-write by the parent,
+        # which takes over (and immediately removes) the underlying file.
+        if outbound:
+            return self.share_array(arr, 'r', False)
+        # Arrays that are still mapped from one of our input files can be
+        # returned without writing them out again
+        if isinstance(arr, np.memmap) and isinstance(arr.base, mmap.mmap) \
+                and os.path.basename(arr.filename or '') \
+                .startswith(self.token):
+            return SharedArray.wrap(arr, 'c', False)
+        return self.share_array(arr, 'c', True)
+
+    def export(self, obj, outbound=True, _memo=None):
+        ''' Returns a version of obj in which every sufficiently large array
+        (found directly, in containers, or in the attributes of Stims and
+        ExtractorResults) is replaced with a SharedArray. Stims and results
+        are shallow-copied as needed; obj itself is never modified.
+
+        Args:
+            obj: The object to export.
+            outbound (bool): True when exporting inputs in the parent process,
+                False when exporting results in a worker.
+        '''
+        if _memo is None:
+            _memo = {}
+        if id(obj) in _memo:
+            return _memo[id(obj)]
+
+        from pliers.extractors.base import ExtractorResult
+
+        result = obj
+        if isinstance(obj, np.ndarray):
+            if not isinstance(obj, SharedArray) and obj.ndim and \
+                    not obj.dtype.hasobject and \
+                    obj.nbytes >= max(self.threshold, 1):
+                result = self._share(obj, outbound)
+        elif isinstance(obj, (list, tuple)):
+            items = [self.export(o, outbound, _memo) for o in obj]
+            if any(a is not b for a, b in zip(items, obj)):
+                result = type(obj)(items) if isinstance(obj, list) \
+                    else tuple(items)
+        elif isinstance(obj, dict):
+            items = dict((k, self.export(v, outbound, _memo))
+                         for k, v in obj.items())
+            if any(items[k] is not obj[k] for k in obj):
+                result = items
+        elif isinstance(obj, (Stim, ExtractorResult)):
+            # Register a placeholder first to cope with reference cycles
+            _memo[id(obj)] = obj
+            changed = {}
+            # Only what's pickled is exported; e.g., AudioStims leave out
+            # data that workers can map from the audio cache themselves
+            state = obj.__getstate__() if hasattr(obj, '__getstate__') \
+                else obj.__dict__
+            if not isinstance(state, dict):
+                state = obj.__dict__
+            for k, v in state.items():
+                # Transformers are pickled as usual
+                if k == 'extractor':
+                    continue
+                new = self.export(v, outbound, _memo)
+                if new is not v:
+                    changed[k] = new
+            if changed:
+                result = copy.copy(obj)
+                # Bypass __setattr__, so that the (unchanged) fingerprint of
+                # Stims is preserved
+                result.__dict__.update(changed)
+        _memo[id(obj)] = result
+        return result
+
+    def wrap(self, func):
+        ''' Wraps a function that will be executed in a worker, so that
+        large arrays in its return value are sent back through shared memory
+        too. '''
+        return _SharedCall(func, self)
+
+
+class _SharedCall(object):
+
+    def __init__(self, func, transport):
+        self.func = func
+        self.transport = transport
+
+    def __call__(self, *args, **kwargs):
+        result = self.func(*args, **kwargs)
+        return self.transport.export(result, outbound=False)
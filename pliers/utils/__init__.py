@@ -3,13 +3,15 @@
 from .base import (listify, flatten, batch_iterable, classproperty, isiterable,
                    isgenerator, progress_bar_wrapper, attempt_to_import,
                    EnvironmentKeyMixin, verify_dependencies, set_iterable_type,
-                   APIDependent, flatten_dict)
+                   APIDependent, TokenBucket, flatten_dict,
+                   fingerprint_hasher, LazyModule, lazy_exports)
 
 
 __all__ = [
     'listify',
     'flatten',
     'flatten_dict',
+    'fingerprint_hasher',
     'batch_iterable',
     'classproperty',
     'isiterable',
@@ -19,5 +21,8 @@ __all__ = [
     'EnvironmentKeyMixin',
     'verify_dependencies',
     'set_iterable_type',
-    'APIDependent'
+    'APIDependent',
+    'TokenBucket',
+    'LazyModule',
+    'lazy_exports'
 ]
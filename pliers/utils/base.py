@@ -1,13 +1,18 @@
 ''' Miscellaneous internal utilities. '''
 
 import collections
+import hashlib
+import importlib
 import os
+import sys
+import threading
+import time
 from abc import ABCMeta, abstractmethod, abstractproperty
 from six import string_types, with_metaclass
 from tqdm import tqdm
 from pliers import config
 from pliers.support.exceptions import MissingDependencyError
-from types import GeneratorType
+from types import GeneratorType, ModuleType
 from itertools import islice
 
 
@@ -42,6 +47,15 @@ def flatten_dict(d, parent_key='', sep='_'):
     return dict(items)
 
 
+def fingerprint_hasher():
+    ''' Returns a new hash object used to compute Stim and Transformer
+    fingerprints. Uses blake2b where available (Python 3.6+), and sha1
+    otherwise. '''
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b(digest_size=20)
+    return hashlib.sha1()
+
+
 def batch_iterable(l, n):
     ''' Chunks iterable into n sized batches
     Solution from: http://stackoverflow.com/questions/1915170/split-a-generator-iterable-every-n-items-in-python-splitevery'''
@@ -100,26 +114,133 @@ module_names = {}
 Dependency = collections.namedtuple('Dependency', 'package value')
 
 
+class LazyModule(ModuleType):
+
+    ''' A placeholder for an optional dependency that is only imported the
+    first time one of its attributes is accessed. Accessing an attribute of a
+    dependency that isn't installed raises a MissingDependencyError. The
+    truth value of the placeholder indicates whether the dependency is
+    available (which imports it, if necessary).
+
+    Args:
+        dependency (str): Name of the module to import.
+        fromlist (list): Passed on to __import__ (i.e., when non-empty, the
+            named module itself is returned rather than its top-level
+            package).
+    '''
+
+    _missing = object()
+
+    def __init__(self, dependency, fromlist=None):
+        super(LazyModule, self).__init__(dependency)
+        self.__dict__['_dependency'] = dependency
+        self.__dict__['_fromlist'] = fromlist
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        ''' Imports the module if this hasn't been attempted yet. Returns
+        the module, or None if it couldn't be imported. '''
+        d = self.__dict__
+        if d['_module'] is None:
+            with d['_lock']:
+                if d['_module'] is None:
+                    try:
+                        d['_module'] = __import__(d['_dependency'],
+                                                  fromlist=d['_fromlist'])
+                    except ImportError:
+                        d['_module'] = LazyModule._missing
+        module = d['_module']
+        return None if module is LazyModule._missing else module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        if module is None:
+            raise MissingDependencyError([self.__dict__['_dependency']])
+        return getattr(module, attr)
+
+    def __dir__(self):
+        module = self._load()
+        return dir(module) if module is not None else []
+
+    def __bool__(self):
+        return self._load() is not None
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<LazyModule %r>' % self.__dict__['_dependency']
+
+
+_lazy_modules = {}
+
+
 def attempt_to_import(dependency, name=None, fromlist=None):
+    ''' Returns a LazyModule for an optional dependency, which is only
+    imported when first used. The dependency is registered under the passed
+    name (defaulting to the name of the dependency itself), for use with
+    verify_dependencies(). '''
     if name is None:
         name = dependency
-    try:
-        mod = __import__(dependency, fromlist=fromlist)
-    except ImportError:
-        mod = None
-    module_names[name] = Dependency(dependency, mod)
-    return mod
+    key = (dependency, tuple(fromlist or ()))
+    if key not in _lazy_modules:
+        _lazy_modules[key] = LazyModule(dependency, fromlist)
+    module_names[name] = Dependency(dependency, _lazy_modules[key])
+    return _lazy_modules[key]
 
 
 def verify_dependencies(dependencies):
     missing = []
     for dep in listify(dependencies):
-        if module_names[dep].value is None:
+        if not module_names[dep].value:
             missing.append(module_names[dep].package)
     if missing:
         raise MissingDependencyError(missing)
 
 
+def _has_submodule(package, name):
+    from importlib.util import find_spec
+    return find_spec('%s.%s' % (package, name)) is not None
+
+
+def lazy_exports(package, exports):
+    ''' Returns module-level __getattr__ and __dir__ functions (PEP 562)
+    that import the public names of a package (and its submodules) on first
+    access, so that importing the package itself stays cheap. On Python
+    versions without module __getattr__ support, everything is imported
+    eagerly instead.
+
+    Args:
+        package (str): The __name__ of the package.
+        exports (dict): Maps each submodule (relative to the package) to the
+            list of names it exports.
+    '''
+    owners = dict((name, module) for module, names in exports.items()
+                  for name in names)
+    namespace = sys.modules[package].__dict__
+
+    def __getattr__(name):
+        if name in owners:
+            module = importlib.import_module('.' + owners[name], package)
+            value = getattr(module, name)
+        elif not name.startswith('_') and _has_submodule(package, name):
+            # Submodules that used to be imported as a side effect
+            value = importlib.import_module('.' + name, package)
+        else:
+            raise AttributeError("module %r has no attribute %r" %
+                                 (package, name))
+        namespace[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(namespace) | set(owners))
+
+    if sys.version_info < (3, 7):
+        for name in owners:
+            __getattr__(name)
+    return __getattr__, __dir__
+
+
 class EnvironmentKeyMixin(object):
 
     @classproperty
@@ -135,15 +256,74 @@ class EnvironmentKeyMixin(object):
         return all([k in os.environ for k in cls.env_keys])
 
 
+class TokenBucket(object):
+
+    ''' A thread-safe token-bucket rate limiter. Tokens accumulate at a fixed
+    rate up to a maximum (the burst size), and each call to acquire() consumes
+    one, blocking until it becomes available. Callers are served in the order
+    in which they call acquire().
+
+    Args:
+        rate (float): Number of tokens added per second. If None or 0,
+            acquire() never blocks.
+        burst (int): Maximum number of tokens that can accumulate, i.e., the
+            number of calls that can be made at once after a period of
+            inactivity.
+    '''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        ''' Consumes a token, sleeping until one is available. Returns the
+        number of seconds spent waiting. '''
+        if not self.rate:
+            return 0.
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Reserve a token even if none is available yet; the deficit
+            # determines how long this caller has to wait.
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, 0.)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def restrict(self, rate, burst=1):
+        ''' Lowers the rate and/or the burst size to the passed values, where
+        they're more restrictive than the current ones. '''
+        burst = max(burst, 1)
+        with self._lock:
+            now = time.time()
+            if self.rate:
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._last) * self.rate)
+            self._last = now
+            if rate and (not self.rate or rate < self.rate):
+                self.rate = rate
+            if burst < self.burst:
+                self.burst = burst
+                self._tokens = min(self._tokens, burst)
+
+
 class APIDependent(with_metaclass(ABCMeta, EnvironmentKeyMixin)):
 
     _rate_limit = 0
 
-    def __init__(self, rate_limit=None, **kwargs):
+    def __init__(self, rate_limit=None, max_concurrent=None, burst=None,
+                 **kwargs):
         self.transformed_stim_count = 0
         self.validated_keys = set()
         self.rate_limit = rate_limit if rate_limit else self._rate_limit
-        self._last_request_time = 0
+        self.max_concurrent = max_concurrent
+        self.burst = burst
         super(APIDependent, self).__init__(**kwargs)
 
     @abstractproperty